@@ -98,6 +98,12 @@ export function ProductCard({ product }: ProductCardProps) {
           },
           callback: function(response: { status: string; transaction_id: string }) {
             console.log("Payment response:", response);
+            // Confirm server-side so the order's stock hold becomes a sale
+            fetch(`${API_BASE}/api/checkout/verify`, {
+              method: "POST",
+              headers: { "Content-Type": "application/json" },
+              body: JSON.stringify({ tx_ref: data.tx_ref }),
+            }).catch((error) => console.error("Payment verification error:", error));
             if (response.status === "successful") {
               toast({
                 title: "Payment Successful! 🎉",
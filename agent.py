@@ -12,45 +12,21 @@ from openai import OpenAI
 from database import get_trader_by_whatsapp
 
 from config import GROQ_API_KEY, GROQ_BASE_URL, MODEL_NAME, ALLOWED_CATEGORIES
-from tools import create_product, query_inventory, update_product, list_products
+from tools import (
+    create_product, create_products, query_inventory, update_product, update_products, list_products,
+    preview_bulk_update, bulk_update_products
+)
+from product_index import resolve_product, suggest_products
+from listing_parser import REQUIRED_FIELDS, normalize_naira_price, parse_listing, is_complete_listing
 
-REQUIRED_FIELDS = ["name", "price", "category", "stock"]
 OPTIONAL_FIELDS = ["description", "image"]
 
+CONFIRM_WORDS = {"yes", "y", "ok", "okay", "confirm", "go ahead", "do it", "yes please", "sure"}
+CANCEL_WORDS = {"no", "n", "cancel", "stop", "no thanks", "leave it"}
+# Pending actions that collect photos across messages
+PHOTO_ACTIONS = ("create_product", "batch")
+MORE_WORDS = {"more", "next", "next page", "show more", "see more", "continue"}
 
-def normalize_naira_price(value) -> int | None:
-    """Normalize common Nigerian WhatsApp price formats into integer Naira.
-
-    Examples:
-    - "5k", "5 K" -> 5000
-    - "₦12k" -> 12000
-    - "250" (no currency, < 1000) -> 250000
-    - "15000" -> 15000
-    """
-    if value is None:
-        return None
-    if isinstance(value, (int, float)):
-        n = int(value)
-        return n if n > 0 else None
-
-    s = str(value).strip().lower()
-    s = s.replace("₦", "").replace(",", "").strip()
-
-    # 5k / 5.5k / 5 k
-    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*k", s)
-    if m:
-        return max(1, int(float(m.group(1)) * 1000))
-
-    # plain number
-    m = re.fullmatch(r"\d+(?:\.\d+)?", s)
-    if m:
-        n = int(float(s))
-        if n <= 0:
-            return None
-        # Common Naija shorthand: "250" means 250k
-        return n * 1000 if n < 1000 else n
-
-    return None
 
 SYSTEM_PROMPT = f"""You are a helpful WhatsApp assistant for Nigerian sellers managing their shop inventory.
 Your job: understand casual Nigerian English / pidgin and turn it into ONE correct JSON action.
@@ -126,6 +102,24 @@ For updating a product (price, stock, etc.):
 {{"action": "update_product", "data": {{"product_name": "esp32 microcontroller", "updates": {{"price": 11000}}}}}}
 ```
 Note: You can update: price, stock_quantity, description, name, category, is_active.
+
+For changing MANY products at once (bulk price/stock changes), use bulk_update.
+filters can use: category, name_contains, min_price, max_price. field is "price" or "stock_quantity".
+mode is "set" (absolute value), "percent" (negative to reduce) or "increment" (negative to decrease).
+- "reduce all Fashion prices by 10%"
+```json
+{{"action": "bulk_update", "data": {{"filters": {{"category": "Fashion"}}, "field": "price", "mode": "percent", "value": -10}}}}
+```
+- "set stock to 0 for everything with 'iPhone 11'"
+```json
+{{"action": "bulk_update", "data": {{"filters": {{"name_contains": "iPhone 11"}}, "field": "stock_quantity", "mode": "set", "value": 0}}}}
+```
+
+If ONE message asks for several things (e.g. "add red bag 5k 3 pcs, blue bag 6k 2 pcs, and raise the Nike price to 20k"),
+output every action in a single "actions" list instead:
+```json
+{{"actions": [{{"action": "create_product", "data": {{"name": "Red bag", "price": 5000, "category": "Accessories", "stock": 3}}}}, {{"action": "create_product", "data": {{"name": "Blue bag", "price": 6000, "category": "Accessories", "stock": 2}}}}, {{"action": "update_product", "data": {{"product_name": "Nike", "updates": {{"price": 20000}}}}}}]}}
+```
 """
 
 
@@ -137,6 +131,11 @@ class AgentState(TypedDict):
     pending_action: str | None
     collected_data: dict
     image_url: str | None
+    # Photos for the pending action; new_image_urls are the latest message's
+    image_urls: list[str]
+    new_image_urls: list[str]
+    # Where the last product list/search left off, for "more"
+    listing_cursor: dict | None
 
 
 def create_client() -> OpenAI:
@@ -145,6 +144,71 @@ def create_client() -> OpenAI:
 
 def process_message(state: AgentState) -> AgentState:
     """Process incoming message and generate response."""
+    last_user_msg = state["messages"][-1]["content"] if state["messages"] else ""
+
+    # A previewed bulk update only needs a yes/no - no LLM call for that
+    if state["pending_action"] == "confirm_bulk_update":
+        answer = last_user_msg.strip().lower().strip(".!")
+        if answer in CONFIRM_WORDS:
+            new_state = state.copy()
+            new_state["pending_action"] = "bulk_update"
+            new_state["collected_data"] = {**state["collected_data"], "confirmed": True}
+            return new_state
+        if answer in CANCEL_WORDS:
+            return _reset_after_action(state, "👍 Cancelled. Nothing was changed.")
+        # Anything else is a new request; drop the unconfirmed bulk update
+        state = {**state, "pending_action": None, "collected_data": {}}
+
+    # Cancelling a listing that is waiting for photos drops the photos too
+    if state["pending_action"] in PHOTO_ACTIONS and last_user_msg.strip().lower().strip(".!") in CANCEL_WORDS:
+        return _reset_after_action(state, "👍 Cancelled. Nothing was added.")
+
+    # "more"/"next" just continues the last list or search - no LLM call needed
+    listing_cursor = state.get("listing_cursor")
+    if listing_cursor and not state["pending_action"] and last_user_msg.strip().lower().strip(".!") in MORE_WORDS:
+        new_state = state.copy()
+        new_state["pending_action"] = listing_cursor["action"]
+        new_state["collected_data"] = {
+            "search_term": listing_cursor.get("search_term", ""),
+            "cursor": listing_cursor["cursor"],
+        }
+        return new_state
+
+    parsed = parse_listing(last_user_msg)
+    caption = last_user_msg.strip()
+
+    # Fast path: the photo we were waiting for has arrived for an already-complete
+    # listing. Execute straight away instead of asking the LLM to re-emit the JSON.
+    # Only a bare photo (or one captioned with the listing itself) takes it; any
+    # other caption ("cancel", "wait, wrong price") goes to the LLM.
+    if (
+        state["pending_action"] == "batch"
+        and state["image_url"]
+        and not caption
+        and len(state.get("image_urls", [])) >= _batch_photos_needed(state["collected_data"])
+    ):
+        return state.copy()
+    if (
+        state["pending_action"] == "create_product"
+        and state["image_url"]
+        and is_complete_listing(state["collected_data"])
+        and (not caption or is_complete_listing(parsed))
+    ):
+        new_state = state.copy()
+        # A caption that is itself a full listing takes precedence over the old data
+        if is_complete_listing(parsed):
+            new_state["collected_data"] = dict(parsed)
+        return new_state
+
+    # Fast path: a listing in a known template doesn't need the LLM at all
+    if is_complete_listing(parsed):
+        action_data = {"action": "create_product", "data": parsed}
+        new_state = state.copy()
+        new_state["messages"] = state["messages"] + [{"role": "assistant", "content": json.dumps(action_data)}]
+        new_state["pending_action"] = "create_product"
+        new_state["collected_data"] = dict(parsed)
+        return new_state
+
     client = create_client()
     
     messages = [{"role": "system", "content": SYSTEM_PROMPT}]
@@ -160,6 +224,11 @@ def process_message(state: AgentState) -> AgentState:
     if state["image_url"]:
         messages[0]["content"] += f"\n\nImage provided: {state['image_url']}"
     
+    # Partial fields from the pre-parser are reliable hints for the model, but a
+    # name alone is just the message echoed back ("hello" -> {"name": "Hello"})
+    if parsed.get("price") is not None or parsed.get("stock") is not None:
+        messages[0]["content"] += f"\n\nFields already extracted from the latest message: {json.dumps(parsed)}"
+    
     messages.extend(state["messages"])
     
     response = client.chat.completions.create(model=MODEL_NAME, messages=messages, temperature=0.7)
@@ -172,7 +241,7 @@ def process_message(state: AgentState) -> AgentState:
     json_match = re.search(r'```json\s*(\{.*?\})\s*```', assistant_msg, re.DOTALL)
     if not json_match:
         # Try finding complete JSON object (matching braces)
-        start_idx = assistant_msg.find('{"action"')
+        start_idx = assistant_msg.find('{"action')
         if start_idx >= 0:
             # Find matching closing brace
             brace_count = 0
@@ -205,19 +274,236 @@ def process_message(state: AgentState) -> AgentState:
     if json_str:
         try:
             action_data = json.loads(json_str)
-            new_state["pending_action"] = action_data.get("action")
-            new_state["collected_data"] = action_data.get("data", {})
+            actions = action_data.get("actions")
+            if isinstance(actions, list) and len(actions) > 1:
+                new_state["pending_action"] = "batch"
+                new_state["collected_data"] = {"actions": actions}
+            else:
+                if isinstance(actions, list) and actions:
+                    action_data = actions[0]
+                new_state["pending_action"] = action_data.get("action")
+                new_state["collected_data"] = action_data.get("data", {})
         except json.JSONDecodeError:
             pass
+        # Photos collected for a replaced action don't carry over to the new one
+        if state["pending_action"] and new_state["pending_action"] != state["pending_action"]:
+            new_images = state.get("new_image_urls", [])
+            new_state["image_urls"] = list(new_images)
+            new_state["image_url"] = new_images[0] if new_images else None
     
     return new_state
 
 
+def _normalize_updates(updates: dict) -> dict:
+    """Normalize field names: "stock" -> "stock_quantity"."""
+    updates = dict(updates)
+    if "stock" in updates:
+        updates["stock_quantity"] = updates.pop("stock")
+    return updates
+
+
+def _find_product_to_update(trader_id: str, product_name: str) -> tuple[dict | None, str]:
+    """Resolve a product name to a single product, or explain why not."""
+    if not product_name:
+        return None, "❌ I need the product name to update it. Which product do you want to update?"
+
+    # Exact and substring matches come first; the fuzzy index is only for typos
+    search_result = query_inventory(product_name, trader_id)
+    if not search_result["success"]:
+        return None, f"❌ Couldn't look up '{product_name}': {search_result['error']}"
+    results = search_result["results"]
+    if len(results) == 1:
+        return results[0], ""
+    if len(results) > 1:
+        exact = [p for p in results if p["name"].strip().lower() == product_name.strip().lower()]
+        if len(exact) == 1:
+            return exact[0], ""
+        items = "\n".join([f"• {p['name']} (ID: {p['id'][:8]}...)" for p in results])
+        return None, f"I found multiple products:\n{items}\n\nPlease be more specific about which one to update."
+
+    try:
+        match = resolve_product(trader_id, product_name)
+        if match:
+            return {"id": match["id"], "name": match["name"]}, ""
+        suggestions = suggest_products(trader_id, product_name)
+    except Exception as e:
+        return None, f"❌ Couldn't look up '{product_name}': {e}"
+    if suggestions:
+        items = "\n".join([f"• {p['name']}" for p in suggestions])
+        return None, f"❌ I couldn't find '{product_name}'. Did you mean:\n{items}"
+    return None, f"❌ I couldn't find any product matching '{product_name}'. Please check the name and try again."
+
+
+def _bulk_value(field: str, mode: str, value):
+    """A bulk update value as a number; None if it isn't one.
+
+    Naira shorthand ("5k", "250" meaning 250k) only applies to price amounts
+    (set/increment); a percent or a stock count is read as a plain number.
+    """
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    try:
+        if field == "price" and mode in ("set", "increment"):
+            sign = -1 if text.startswith("-") else 1
+            amount = normalize_naira_price(text.lstrip("+-").strip())
+            return None if amount is None else sign * amount
+        if mode == "percent":
+            return float(text.rstrip("%"))
+        return int(float(text))
+    except ValueError:
+        return None
+
+
+def _describe_bulk_change(data: dict) -> str:
+    field = "price" if data["field"] == "price" else "stock"
+    value = data["value"]
+    if data["mode"] == "percent":
+        return f"{field} {'down' if value < 0 else 'up'} by {abs(value):g}%"
+    if data["mode"] == "increment":
+        amount = f"₦{abs(value):,.0f}" if field == "price" else f"{abs(value):g}"
+        return f"{field} {'down' if value < 0 else 'up'} by {amount}"
+    amount = f"₦{value:,.0f}" if field == "price" else f"{value:g}"
+    return f"{field} set to {amount}"
+
+
+def _format_inventory_page(
+    header: str, products: list[dict], result: dict, state: AgentState, action: str, search_term: str = ""
+) -> tuple[str, dict | None]:
+    """Reply text for one page of products, plus the cursor to continue from."""
+    previous = state.get("listing_cursor") if state["collected_data"].get("cursor") else None
+    shown = previous["shown"] if previous else 0
+    total = previous["total"] if previous else result["total"]
+    if shown:
+        header = f"📦 Items {shown + 1}-{shown + len(products)} of {total}"
+
+    items = "\n".join([f"• {p['name']} - ₦{p['price']:,} ({p['stock_quantity']} in stock)" for p in products])
+    msg = f"{header}:\n{items}"
+    if not result.get("next_cursor"):
+        return msg, None
+
+    msg += "\n\nReply *more* to see the next ones."
+    return msg, {
+        "action": action,
+        "search_term": search_term,
+        "cursor": result["next_cursor"],
+        "shown": shown + len(products),
+        "total": total,
+    }
+
+
+def _batch_photos_needed(data: dict) -> int:
+    return sum(1 for a in data.get("actions", []) if a.get("action") == "create_product")
+
+
+def _reset_after_action(state: AgentState, result_msg: str) -> AgentState:
+    new_state = state.copy()
+    new_state["messages"] = state["messages"] + [{"role": "assistant", "content": result_msg}]
+    new_state["pending_action"] = None
+    new_state["collected_data"] = {}
+    new_state["image_url"] = None
+    new_state["image_urls"] = []
+    new_state["new_image_urls"] = []
+    new_state["listing_cursor"] = None
+    return new_state
+
+
+def execute_batch(state: AgentState) -> AgentState:
+    """Execute several actions from one message with as few DB calls as possible.
+
+    Creates go in a single bulk insert, updates that change the same fields to
+    the same values share one update call, and everything is reported back in
+    one consolidated reply. Other actions go through execute_action one at a
+    time; a bulk update there stops at its preview, which is left pending for
+    the seller to confirm.
+    """
+    actions = state["collected_data"].get("actions", [])
+    trader_id = state["trader_id"]
+
+    creates = [a.get("data", {}) for a in actions if a.get("action") == "create_product"]
+    images = state.get("image_urls") or ([state["image_url"]] if state["image_url"] else [])
+    if len(images) < len(creates):
+        names = "\n".join([f"{i}. {c.get('name', 'item')}" for i, c in enumerate(creates, start=1)])
+        result_msg = (
+            f"📸 Please send {len(creates)} photos, one for each product, in this order:\n{names}"
+            f"\n\nI have {len(images)} so far."
+        )
+        new_state = state.copy()
+        new_state["messages"] = state["messages"] + [{"role": "assistant", "content": result_msg}]
+        # Keep the batch pending until all the photos are in
+        return new_state
+
+    lines = []
+
+    if creates:
+        rows = [{**c, "image": image} for c, image in zip(creates, images)]
+        result = create_products(rows, trader_id, state["trader_name"], state["whatsapp_number"])
+        for p in result["products"]:
+            lines.append(f"✅ Added {p['name']} (ID: {p['id']})")
+        for err in result["errors"]:
+            lines.append(f"❌ Couldn't add {err['name']}: {err['error']}")
+
+    # Group updates by their change set so identical changes share one call
+    update_groups: dict[str, dict] = {}
+    for a in actions:
+        if a.get("action") != "update_product":
+            continue
+        data = a.get("data", {})
+        product, error_msg = _find_product_to_update(trader_id, data.get("product_name", ""))
+        if not product:
+            lines.append(error_msg)
+            continue
+        updates = _normalize_updates(data.get("updates", {}))
+        key = json.dumps(updates, sort_keys=True)
+        group = update_groups.setdefault(key, {"updates": updates, "ids": []})
+        group["ids"].append(product["id"])
+
+    for group in update_groups.values():
+        result = update_products(group["ids"], group["updates"], trader_id)
+        if not result["success"]:
+            lines.append(f"❌ Update failed: {result['error']}")
+            continue
+        for p in result["products"]:
+            changed = ", ".join([f"{k}: {p.get(k, v)}" for k, v in group["updates"].items()])
+            lines.append(f"✅ Updated {p['name']}! Changed: {changed}")
+
+    # Reads and bulk updates don't batch with the rest; run them through the
+    # single-action path. Only one bulk update preview can await a YES at a time.
+    confirm = None
+    for a in actions:
+        action = a.get("action")
+        if action in ("create_product", "update_product"):
+            continue
+        if action not in ("query_inventory", "list_products", "bulk_update") or (action == "bulk_update" and confirm):
+            lines.append(f"⚠️ Not done: {action or 'unknown action'}. Please send it on its own.")
+            continue
+        sub_state = {**state, "pending_action": action, "collected_data": a.get("data", {})}
+        sub_result = execute_action(sub_state)
+        if sub_result["pending_action"] == "confirm_bulk_update":
+            confirm = sub_result["collected_data"]
+            confirm_msg = sub_result["messages"][-1]["content"]
+        else:
+            lines.append(sub_result["messages"][-1]["content"])
+    if confirm:
+        # The YES/NO question goes last, after everything that was done
+        lines.append(confirm_msg)
+
+    new_state = _reset_after_action(state, "\n".join(lines) or "Nothing to do.")
+    if confirm:
+        new_state["pending_action"] = "confirm_bulk_update"
+        new_state["collected_data"] = confirm
+    return new_state
+
+
 def execute_action(state: AgentState) -> AgentState:
     """Execute the pending action if data is complete."""
     action = state["pending_action"]
     data = state["collected_data"]
     result_msg = ""
+    listing_cursor = None
+    
+    if action == "batch":
+        return execute_batch(state)
     
     if action == "create_product":
         # Check if image is provided - REQUIRE image for product creation
@@ -241,63 +527,99 @@ def execute_action(state: AgentState) -> AgentState:
             result_msg = f"❌ Couldn't add product: {result['error']}"
     
     elif action == "query_inventory":
-        result = query_inventory(data.get("search_term", ""), state["trader_id"])
-        if result["results"]:
-            items = "\n".join([f"• {p['name']} - ₦{p['price']:,} ({p['stock_quantity']} in stock)" for p in result["results"]])
-            result_msg = f"📦 Found {result['total']} items:\n{items}"
+        search_term = data.get("search_term", "")
+        cursor = data.get("cursor")
+        result = query_inventory(search_term, state["trader_id"], cursor=cursor)
+        if result["success"] and not result["results"] and search_term and not cursor:
+            # Substring search missed - the seller may have misspelt the name
+            try:
+                match = resolve_product(state["trader_id"], search_term)
+            except Exception as e:
+                match = None
+                result = {"success": False, "error": str(e), "results": []}
+            if match:
+                search_term = match["name"]
+                result = query_inventory(search_term, state["trader_id"])
+        if not result["success"]:
+            result_msg = f"❌ Couldn't search your products: {result['error']}"
+        elif result["results"]:
+            result_msg, listing_cursor = _format_inventory_page(
+                f"📦 Found {result['total']} items", result["results"], result, state, "query_inventory",
+                result.get("search_term", search_term)
+            )
         else:
             result_msg = "No products found matching your search."
     
     elif action == "update_product":
-        # First search for the product by name
         product_name = data.get("product_name", "")
-        if not product_name:
-            result_msg = "❌ I need the product name to update it. Which product do you want to update?"
+        product, result_msg = _find_product_to_update(state["trader_id"], product_name)
+
+        if product:
+            product_id = product["id"]
+            updates = _normalize_updates(data.get("updates", {}))
+            
+            result = update_product(product_id, updates, state["trader_id"])
+            
+            if result["success"]:
+                # Show what was updated, as stored in the database
+                updated = result["product"]
+                updated_fields = ", ".join([f"{k}: {updated.get(k, v)}" for k, v in updates.items()])
+                result_msg = f"✅ Updated {updated['name']}! Changed: {updated_fields}"
+            else:
+                result_msg = f"❌ Update failed: {result['error']}"
+    
+    elif action == "bulk_update":
+        filters = data.get("filters", {})
+        field = "stock_quantity" if data.get("field") == "stock" else data.get("field")
+        mode = data.get("mode", "set")
+        value = _bulk_value(field, mode, data.get("value"))
+        data = {**data, "field": field, "value": value, "mode": mode}
+
+        if not data.get("confirmed"):
+            # Show the seller how many products will change before touching anything
+            preview = preview_bulk_update(state["trader_id"], filters, field, mode, value)
+            if not preview["success"]:
+                result_msg = f"❌ Can't do that bulk update: {preview['error']}"
+            elif preview["count"] == 0:
+                result_msg = "No products match that. Nothing was changed."
+            else:
+                try:
+                    change = _describe_bulk_change(data)
+                except (KeyError, TypeError, ValueError):
+                    change = "the requested change"
+                result_msg = (
+                    f"⚠️ This will change {preview['count']} products: {change}.\n\n"
+                    "Reply YES to apply or NO to cancel."
+                )
+                new_state = state.copy()
+                new_state["messages"] = state["messages"] + [{"role": "assistant", "content": result_msg}]
+                new_state["pending_action"] = "confirm_bulk_update"
+                new_state["collected_data"] = data
+                return new_state
         else:
-            search_result = query_inventory(product_name, state["trader_id"])
-            if not search_result["results"]:
-                result_msg = f"❌ I couldn't find any product matching '{product_name}'. Please check the name and try again."
-            elif len(search_result["results"]) > 1:
-                items = "\n".join([f"• {p['name']} (ID: {p['id'][:8]}...)" for p in search_result["results"]])
-                result_msg = f"I found multiple products:\n{items}\n\nPlease be more specific about which one to update."
+            result = bulk_update_products(state["trader_id"], filters, field, data["mode"], value)
+            if result["success"]:
+                result_msg = f"✅ Updated {result['updated']} products!"
             else:
-                # Found exactly one product
-                product = search_result["results"][0]
-                product_id = product["id"]
-                updates = data.get("updates", {})
-                
-                # Normalize field names: "stock" -> "stock_quantity"
-                if "stock" in updates:
-                    updates["stock_quantity"] = updates.pop("stock")
-                
-                result = update_product(product_id, updates, state["trader_id"])
-                
-                if result["success"]:
-                    # Show what was updated
-                    updated_fields = ", ".join([f"{k}: {v}" for k, v in updates.items()])
-                    result_msg = f"✅ Updated {product['name']}! Changed: {updated_fields}"
-                else:
-                    result_msg = f"❌ Update failed: {result['error']}"
+                result_msg = f"❌ Bulk update failed: {result['error']}"
     
     elif action == "list_products":
-        result = list_products(state["trader_id"], data.get("limit", 10))
+        result = list_products(state["trader_id"], cursor=data.get("cursor"))
         if result["products"]:
-            items = "\n".join([f"• {p['name']} - ₦{p['price']:,} ({p['stock_quantity']} in stock)" for p in result["products"]])
-            result_msg = f"📦 Your {result['total']} products:\n{items}"
+            result_msg, listing_cursor = _format_inventory_page(
+                f"📦 Your {result['total']} products", result["products"], result, state, "list_products"
+            )
         else:
             result_msg = "You haven't added any products yet."
     
-    new_state = state.copy()
-    new_state["messages"] = state["messages"] + [{"role": "assistant", "content": result_msg}]
-    new_state["pending_action"] = None
-    new_state["collected_data"] = {}
-    new_state["image_url"] = None
+    new_state = _reset_after_action(state, result_msg)
+    new_state["listing_cursor"] = listing_cursor
     return new_state
 
 
 def should_execute(state: AgentState) -> Literal["execute", "end"]:
     """Determine if we should execute an action or end."""
-    if state["pending_action"] and state["collected_data"]:
+    if state["pending_action"] and (state["collected_data"] or state["pending_action"] == "list_products"):
         return "execute"
     return "end"
 
@@ -325,16 +647,27 @@ def create_initial_state(whatsapp_number: str, business_name: str = "My Shop") -
         "whatsapp_number": whatsapp_number,
         "pending_action": None,
         "collected_data": {},
-        "image_url": None
+        "image_url": None,
+        "image_urls": [],
+        "new_image_urls": [],
+        "listing_cursor": None
     }
 
 
-def chat(state: AgentState, user_message: str, image_url: str = None) -> AgentState:
+def chat(state: AgentState, user_message: str, image_url: str = None, image_urls: list[str] = None) -> AgentState:
     """Process a user message and return updated state."""
     new_state = state.copy()
     new_state["messages"] = state["messages"] + [{"role": "user", "content": user_message}]
-    if image_url:
-        new_state["image_url"] = image_url
+    image_urls = image_urls or ([image_url] if image_url else [])
+    new_state["new_image_urls"] = image_urls
+    if image_urls:
+        new_state["image_url"] = image_urls[0]
+        # Photos for a multi-product batch often arrive one message at a time;
+        # otherwise a new photo replaces any earlier one
+        if state["pending_action"] == "batch":
+            new_state["image_urls"] = state.get("image_urls", []) + image_urls
+        else:
+            new_state["image_urls"] = image_urls
     
     graph = build_graph()
     return graph.invoke(new_state)
@@ -0,0 +1,174 @@
+"""Throughput benchmark: threaded vs asyncio customer chat pipeline.
+
+Runs N concurrent chats through both customer graphs with the network faked
+by sleeps (LLM, Supabase and Flutterwave latencies below), so no services
+are needed. The threaded path mirrors server.customer_chat before the async
+pipeline: each chat runs handle_customer_chat in a pool of THREADPOOL_SIZE
+threads (Starlette's default run_in_threadpool limit). The async path awaits
+handle_customer_chat_async for all chats on one event loop.
+
+Usage: python benchmarks/bench_customer_pipeline.py [--chats 1000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+import customer_agent
+import customer_agent_async
+
+THREADPOOL_SIZE = 40
+
+# Simulated round trips, in seconds
+LLM_LATENCY = 0.25
+DB_LATENCY = 0.02
+PAYMENT_LATENCY = 0.15
+
+PRODUCTS = [
+    {"id": f"p{i}", "name": f"Nike Air Max {i}", "price": 45_000, "stock_quantity": 5, "category": "Footwear"}
+    for i in range(3)
+]
+
+
+def _completion(messages) -> SimpleNamespace:
+    if "You decide what action" in messages[0]["content"]:
+        content = json.dumps({"tool": "search_shop_products", "args": {"query": "nike sneakers"}})
+    else:
+        content = "Here is what I found."
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def _search_result() -> dict:
+    return {"results": [dict(p) for p in PRODUCTS], "total": len(PRODUCTS), "fetched_at": time.time()}
+
+
+def _install_sync_fakes() -> None:
+    def create(messages, **kwargs):
+        time.sleep(LLM_LATENCY)
+        return _completion(messages)
+
+    def search(trader_id, query, limit=10):
+        time.sleep(DB_LATENCY)
+        return _search_result()
+
+    def create_order(trader_id, product_id, *args, **kwargs):
+        time.sleep(DB_LATENCY * 2)
+        return {"id": f"order-{product_id}"}
+
+    def create_payment_link(order_id):
+        time.sleep(DB_LATENCY + PAYMENT_LATENCY)
+        return f"https://pay.example/{order_id}"
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    customer_agent.create_client = lambda: client
+    customer_agent.search_shop_products = search
+    customer_agent.check_products_availability = lambda t, ids, search_result=None: {i: 5 for i in ids}
+    customer_agent.create_order = create_order
+    customer_agent.create_payment_link = create_payment_link
+    customer_agent.similar_products = lambda trader_id, product_id: []
+
+
+def _install_async_fakes() -> None:
+    async def create(messages, **kwargs):
+        await asyncio.sleep(LLM_LATENCY)
+        return _completion(messages)
+
+    async def search(trader_id, query, limit=10):
+        await asyncio.sleep(DB_LATENCY)
+        return _search_result()
+
+    async def check_availability(trader_id, ids, search_result=None):
+        return {i: 5 for i in ids}
+
+    async def create_order(trader_id, product_id, *args, **kwargs):
+        await asyncio.sleep(DB_LATENCY * 2)
+        return {"id": f"order-{product_id}"}
+
+    async def create_payment_link(order_id):
+        await asyncio.sleep(DB_LATENCY + PAYMENT_LATENCY)
+        return f"https://pay.example/{order_id}"
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    customer_agent_async.create_client = lambda: client
+    customer_agent_async.search_shop_products = search
+    customer_agent_async.check_products_availability = check_availability
+    customer_agent_async.create_order = create_order
+    customer_agent_async.create_payment_link = create_payment_link
+    customer_agent_async.similar_products = lambda trader_id, product_id: []
+
+
+def _new_state(i: int) -> dict:
+    return {
+        "session_id": f"bench-{i}", "trader_id": "bench-shop", "trader_name": "Bench Shop",
+        "messages": [], "status": "browsing", "context": {},
+        "product_id": None, "order_id": None, "payment_link": None, "delivery_details": {},
+    }
+
+
+async def _timed(chat) -> float:
+    start = time.perf_counter()
+    await chat
+    return time.perf_counter() - start
+
+
+async def run_threaded(chats: int) -> list:
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=THREADPOOL_SIZE) as pool:
+        return await asyncio.gather(*(
+            _timed(loop.run_in_executor(pool, customer_agent.handle_customer_chat, _new_state(i), "nike sneakers"))
+            for i in range(chats)
+        ))
+
+
+async def run_async(chats: int) -> list:
+    return await asyncio.gather(*(
+        _timed(customer_agent_async.handle_customer_chat_async(_new_state(i), "nike sneakers"))
+        for i in range(chats)
+    ))
+
+
+def _report(name: str, chats: int, wall: float, latencies: list) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<9} wall {wall:7.2f}s  {chats / wall:8.1f} chats/s  "
+          f"p50 {statistics.median(latencies) * 1000:8.0f}ms  p95 {p95 * 1000:8.0f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=1000)
+    args = parser.parse_args()
+
+    _install_sync_fakes()
+    _install_async_fakes()
+    ideal = LLM_LATENCY * 2 + DB_LATENCY * 4 + PAYMENT_LATENCY
+    print(f"{args.chats} concurrent chats, ~{ideal * 1000:.0f}ms of I/O each "
+          f"(threaded pool: {THREADPOOL_SIZE} threads)")
+
+    # Silence the agents' per-step logging while timing
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        results = []
+        for name, run in (("threaded", run_threaded), ("async", run_async)):
+            start = time.perf_counter()
+            latencies = asyncio.run(run(args.chats))
+            results.append((name, time.perf_counter() - start, latencies))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    for name, wall, latencies in results:
+        _report(name, args.chats, wall, latencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Latency benchmark for marketplace search over a synthetic catalog.
+
+Builds a MarketplaceIndex from generated products (no database needed) and
+times a mix of broad, narrow, filtered and category-scoped queries.
+
+Usage: python benchmarks/bench_marketplace_search.py [--products 100000] [--shops 2000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config import ALLOWED_CATEGORIES
+from marketplace_search import MarketplaceIndex
+
+# p95 latency target per query, in milliseconds
+TARGET_P95_MS = 50
+
+WORDS = {
+    "Electronics": ["iphone", "samsung", "charger", "earbuds", "laptop", "power", "bank", "speaker", "tecno", "infinix"],
+    "Fashion": ["ankara", "dress", "shirt", "agbada", "jeans", "gown", "senator", "kaftan", "blouse", "skirt"],
+    "Footwear": ["sneakers", "nike", "adidas", "sandals", "slippers", "heels", "loafers", "boots", "air", "max"],
+    "Accessories": ["watch", "bag", "necklace", "bracelet", "wallet", "belt", "cap", "sunglasses", "earrings", "ring"],
+    "Home & Living": ["pot", "blender", "bedsheet", "curtain", "fan", "rug", "lamp", "kettle", "plates", "pillow"],
+}
+ADJECTIVES = ["new", "original", "premium", "black", "red", "white", "big", "small", "quality", "latest"]
+
+QUERIES = [
+    ("nike sneakers", {}),
+    ("black dress", {}),
+    ("iphone charger", {"max_price": 20_000}),
+    ("ankara", {"category": "Fashion"}),
+    ("original watch", {"in_stock": True}),
+    ("blender", {"min_price": 10_000, "max_price": 80_000}),
+    ("premium", {}),
+    ("red leather bag", {"in_stock": True}),
+]
+
+
+def generate_products(count: int, shops: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    products = []
+    for i in range(count):
+        category = rng.choice(ALLOWED_CATEGORIES)
+        words = WORDS[category]
+        name = " ".join([rng.choice(ADJECTIVES)] + rng.sample(words, 2)).title()
+        description = " ".join(rng.choice(ADJECTIVES + words) for _ in range(rng.randint(3, 12)))
+        products.append({
+            "id": f"p{i}",
+            "trader_id": f"t{rng.randrange(shops)}",
+            "name": name,
+            "price": rng.randrange(1_000, 500_000, 500),
+            "category": category,
+            "stock_quantity": rng.choice([0, 1, 2, 5, 10, 50]),
+            "image_url": "",
+            "description": description,
+            "is_active": True,
+        })
+    return products
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--shops", type=int, default=2_000)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    products = generate_products(args.products, args.shops)
+
+    start = time.perf_counter()
+    index = MarketplaceIndex(products)
+    print(f"Indexed {len(index)} products in {len(index.shards)} shards: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    for p in products[:1000]:
+        index.add({**p, "stock_quantity": p["stock_quantity"] + 1})
+    print(f"Incremental update: {(time.perf_counter() - start) * 1000 / 1000:.3f}ms per product")
+
+    timings = []
+    for _ in range(args.rounds):
+        for query, filters in QUERIES:
+            start = time.perf_counter()
+            index.search(query, limit=20, **filters)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    p50 = statistics.median(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{len(timings)} queries: p50 {p50:.1f}ms, p95 {p95:.1f}ms, max {timings[-1]:.1f}ms")
+    print(f"p95 target {TARGET_P95_MS}ms: {'met' if p95 <= TARGET_P95_MS else 'MISSED'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Snapshot and restore timings for the session log.
+
+Fills the session stores with synthetic customer chats (and some seller
+WhatsApp sessions), then times a full snapshot, an incremental pass after a
+fraction of the sessions changed, and a cold restore from the log, as at
+dyno startup.
+
+Usage: python benchmarks/bench_session_restore.py [--sessions 10000] [--messages 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import customer_sessions
+import session_snapshots
+from customer_sessions import create_session, update_session
+
+# Restore budget for 10k sessions, in seconds
+TARGET_RESTORE_S = 1.0
+
+REPLY = ("Here is what I found:\n- **Nike Air Max 90**\n  Price: 45000 | Stock: 5\n"
+         "  [Buy Now](https://checkout.flutterwave.com/v3/hosted/pay/flwlnk-01hx8z0example)\n")
+
+
+def populate(sessions: int, messages: int) -> dict:
+    for i in range(sessions):
+        session = create_session(f"trader-{i % 500}", f"Shop {i % 500}", "+2348000000000")
+        state = session.to_state()
+        for j in range(messages // 2):
+            state["messages"].append({"role": "user", "content": f"do you have nike sneakers size {40 + j}?"})
+            state["messages"].append({"role": "assistant", "content": REPLY})
+        state["context"] = {
+            "decision": {"tool": "search_shop_products", "args": {"query": "nike sneakers"}},
+            "tool_result": {"results": [{"id": f"p{k}"} for k in range(3)], "total": 3},
+        }
+        state["order_id"] = f"order-{i}"
+        state["payment_link"] = f"https://checkout.flutterwave.com/v3/hosted/pay/{i}"
+        state["status"] = "awaiting_payment"
+        update_session(session.session_id, state)
+
+    return {
+        f"whatsapp:+23480{i:08d}": {
+            "messages": [{"role": "user", "content": "add product"}, {"role": "assistant", "content": "Send a photo"}],
+            "trader_id": f"trader-{i}", "trader_name": f"Shop {i}", "whatsapp_number": f"+23480{i:08d}",
+            "pending_action": None, "collected_data": {}, "image_url": None, "image_urls": [], "new_image_urls": [],
+            "listing_cursor": None,
+        }
+        for i in range(sessions // 20)
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=10_000)
+    parser.add_argument("--messages", type=int, default=20)
+    args = parser.parse_args()
+
+    trader_sessions = populate(args.sessions, args.messages)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.snapshot")
+
+        records, full_s = timed(session_snapshots.snapshot, trader_sessions, path)
+        size = os.path.getsize(path)
+        print(f"full snapshot:        {records} records, {size / 1e6:.1f} MB in {full_s * 1000:.0f}ms")
+
+        for session in list(customer_sessions.sessions.values())[::10]:
+            session.messages.append({"role": "user", "content": "I paid"})
+        records, incr_s = timed(session_snapshots.snapshot, trader_sessions, path)
+        print(f"incremental (10%):    {records} records in {incr_s * 1000:.0f}ms")
+
+        customer_sessions.sessions.clear()
+        trader_sessions.clear()
+        session_snapshots._fingerprints.clear()
+        restored, restore_s = timed(session_snapshots.restore, trader_sessions, path)
+        print(f"restore:              {restored} in {restore_s * 1000:.0f}ms "
+              f"(target {TARGET_RESTORE_S * 1000:.0f}ms for 10k sessions)")
+
+        sample = next(iter(customer_sessions.sessions.values()))
+        assert sample.order_id and sample.payment_link and len(sample.messages) == sample.messages.total <= args.messages + 1
+
+
+if __name__ == "__main__":
+    main()
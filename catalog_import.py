@@ -0,0 +1,163 @@
+"""Bulk catalog import from CSV/XLSX files sent over WhatsApp."""
+import csv
+import io
+import re
+from typing import Iterator
+
+import requests
+from requests.auth import HTTPBasicAuth
+
+from config import ALLOWED_CATEGORIES
+from storage import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN
+from tools import create_products, validate_product_data
+
+# text/plain is left out: any plain-text attachment would be parsed as a catalog
+CSV_CONTENT_TYPES = {"text/csv", "text/comma-separated-values", "application/csv"}
+XLSX_CONTENT_TYPES = {"application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+
+CHUNK_SIZE = 200
+MAX_ERRORS_IN_REPLY = 10
+
+# Header spellings sellers use -> our field names
+COLUMN_ALIASES = {
+    "name": "name", "product": "name", "product name": "name", "item": "name",
+    "price": "price", "amount": "price", "cost": "price",
+    "category": "category",
+    "stock": "stock", "stock quantity": "stock", "stock_quantity": "stock", "qty": "stock", "quantity": "stock",
+    "description": "description", "details": "description",
+    "image": "image", "image url": "image", "image_url": "image", "photo": "image", "picture": "image",
+}
+
+
+def is_spreadsheet(content_type: str) -> bool:
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    return content_type in CSV_CONTENT_TYPES or content_type in XLSX_CONTENT_TYPES
+
+
+def _iter_csv_rows(response: requests.Response) -> Iterator[dict]:
+    response.raw.decode_content = True
+    text = io.TextIOWrapper(response.raw, encoding="utf-8-sig", newline="")
+    yield from csv.DictReader(text)
+
+
+def _iter_xlsx_rows(response: requests.Response) -> Iterator[dict]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("XLSX import needs openpyxl installed (pip install openpyxl)")
+
+    # XLSX is a zip archive, so it has to be fully downloaded before reading;
+    # read_only mode still streams the rows out of the sheet.
+    workbook = load_workbook(io.BytesIO(response.content), read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    headers = next(rows, None)
+    if headers is None:
+        return
+    headers = [str(h) if h is not None else "" for h in headers]
+    for values in rows:
+        yield dict(zip(headers, values))
+    workbook.close()
+
+
+def parse_price(value) -> int | None:
+    """A spreadsheet price cell as integer Naira.
+
+    Cells are read literally ("250" is 250), unlike chat listings where
+    "250" usually means 250k; only a ₦ sign and thousands commas are removed.
+    """
+    if isinstance(value, (int, float)):
+        n = int(value)
+        return n if n > 0 else None
+    s = str(value or "").replace("₦", "").replace(",", "").strip()
+    if not re.fullmatch(r"\d+(?:\.\d+)?", s):
+        return None
+    n = int(float(s))
+    return n if n > 0 else None
+
+
+def parse_row(row: dict) -> tuple[dict | None, str]:
+    """Map one spreadsheet row onto create_products() fields, or explain why not."""
+    item = {}
+    for header, value in row.items():
+        field = COLUMN_ALIASES.get(str(header or "").strip().lower())
+        if field and value not in (None, ""):
+            item[field] = str(value).strip() if field in ("name", "category", "description", "image") else value
+
+    if not item.get("name"):
+        return None, "Missing product name"
+
+    item["price"] = parse_price(item.get("price"))
+    if item["price"] is None:
+        return None, "Missing or invalid price"
+
+    # An empty stock cell means one in stock (see the README)
+    try:
+        item["stock"] = int(float(item.get("stock", 1)))
+    except (TypeError, ValueError):
+        return None, f"Invalid stock '{item.get('stock')}'"
+
+    category = str(item.get("category", ""))
+    item["category"] = next((c for c in ALLOWED_CATEGORIES if c.lower() == category.lower()), category)
+
+    valid, error = validate_product_data({
+        "price": item["price"], "category": item["category"], "stock_quantity": item["stock"]
+    })
+    if not valid:
+        return None, error
+    if not item.get("image"):
+        return None, "Missing image URL"
+    return item, ""
+
+
+def import_catalog(media_url: str, content_type: str, trader: dict, whatsapp_number: str) -> dict:
+    """Download a spreadsheet from Twilio and insert its rows in chunked bulk writes.
+
+    Returns {"imported", "total", "errors": [{"row", "error"}]}.
+    """
+    auth = HTTPBasicAuth(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    response = requests.get(media_url, auth=auth, timeout=30, stream=True)
+    response.raise_for_status()
+
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    rows = _iter_xlsx_rows(response) if content_type in XLSX_CONTENT_TYPES else _iter_csv_rows(response)
+
+    imported = 0
+    total = 0
+    errors = []
+    chunk = []  # (row_number, item)
+
+    def flush():
+        nonlocal imported
+        result = create_products([item for _, item in chunk], trader["id"], trader["business_name"], whatsapp_number)
+        imported += len(result["products"])
+        # Each error carries its item's position in the chunk
+        errors.extend({"row": chunk[e["index"]][0], "error": e["error"]} for e in result["errors"])
+        chunk.clear()
+
+    # Row 1 is the header, so data starts at row 2
+    for row_number, row in enumerate(rows, start=2):
+        if not any(v not in (None, "") for v in row.values()):
+            continue
+        total += 1
+        item, error = parse_row(row)
+        if not item:
+            errors.append({"row": row_number, "error": error})
+            continue
+        chunk.append((row_number, item))
+        if len(chunk) >= CHUNK_SIZE:
+            flush()
+    if chunk:
+        flush()
+
+    return {"imported": imported, "total": total, "errors": errors}
+
+
+def format_import_summary(result: dict) -> str:
+    """WhatsApp reply summarising an import."""
+    msg = f"📥 Imported {result['imported']} of {result['total']} products."
+    if result["errors"]:
+        lines = "\n".join([f"• Row {e['row']}: {e['error']}" for e in result["errors"][:MAX_ERRORS_IN_REPLY]])
+        msg += f"\n\n⚠️ {len(result['errors'])} rows were skipped:\n{lines}"
+        if len(result["errors"]) > MAX_ERRORS_IN_REPLY:
+            msg += f"\n…and {len(result['errors']) - MAX_ERRORS_IN_REPLY} more."
+    return msg
@@ -0,0 +1,158 @@
+"""In-process change feed for product, trader and order writes.
+
+Writers call publish() after a successful write; modules holding derived
+state (indexes, aggregates, caches) subscribe() to the tables they read.
+Every publish bumps a per-table, per-trader version, so a cache can check
+freshness by comparing the version it was filled at with get_version() over
+just the tables it reads (order writes don't invalidate a product cache). Changes are
+coalesced per trader: a bulk write is one delivery, and events from the
+realtime listener are buffered for COALESCE_WINDOW seconds so a burst of
+row events reaches subscribers as one batch.
+
+With CHANGE_FEED_REALTIME enabled, start_realtime_listener() also tails
+Supabase Realtime, so writes made outside this process (the web dashboard,
+SQL functions) reach the same subscribers. Without it, the in-process
+publishes are the whole feed.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from config import SUPABASE_URL, SUPABASE_KEY
+from customer_config import CHANGE_FEED_REALTIME, CHANGE_FEED_COALESCE_WINDOW
+
+TABLES = ("products", "traders", "orders")
+
+
+class Change:
+    """Coalesced writes to one table for one trader.
+
+    rows is None when the affected rows aren't known (e.g. a bulk update
+    done in SQL); subscribers should then reload the trader's data.
+    """
+    __slots__ = ("table", "trader_id", "rows", "version")
+
+    def __init__(self, table: str, trader_id: str, rows: Optional[List[Dict[str, Any]]], version: int):
+        self.table = table
+        self.trader_id = trader_id
+        self.rows = rows
+        self.version = version
+
+
+_subscribers: Dict[str, List[Callable[[Change], None]]] = defaultdict(list)
+_versions: Dict[tuple, int] = defaultdict(int)  # (table, trader_id) -> version
+# (table, trader_id) -> rows by id, or None once a "reload everything" change is pending
+_pending: Dict[tuple, Optional[Dict[str, Dict[str, Any]]]] = {}
+_lock = threading.Lock()
+_stats = {"published": 0, "delivered": 0}
+_flush_scheduled = False
+
+
+def subscribe(table: str, handler: Callable[[Change], None]) -> None:
+    """Call handler(change) for every coalesced change to table."""
+    if table not in TABLES:
+        raise ValueError(f"table must be one of: {', '.join(TABLES)}")
+    _subscribers[table].append(handler)
+
+
+def get_version(trader_id: str, tables: Iterable[str] = TABLES) -> int:
+    """Counter bumped on every change to a trader's rows in any of tables."""
+    return sum(_versions.get((table, trader_id), 0) for table in tables)
+
+
+def publish(table: str, trader_id: str, rows: Optional[List[Dict[str, Any]]] = None, defer: bool = False) -> None:
+    """Record written rows (None: unknown rows) and deliver them.
+
+    defer=True leaves the change pending for the next flush(), so changes
+    arriving close together are delivered as one.
+    """
+    with _lock:
+        key = (table, trader_id)
+        _versions[key] += 1
+        _stats["published"] += 1
+        if rows is None:
+            _pending[key] = None
+        elif key not in _pending or _pending[key] is not None:
+            merged = _pending.setdefault(key, {})
+            for row in rows:
+                merged[row["id"]] = row  # the latest write of a row wins
+    if not defer:
+        flush()
+
+
+def flush() -> None:
+    """Deliver all pending changes, one Change per (table, trader)."""
+    with _lock:
+        pending = list(_pending.items())
+        _pending.clear()
+    for (table, trader_id), rows in pending:
+        change = Change(table, trader_id, None if rows is None else list(rows.values()), _versions[(table, trader_id)])
+        for handler in _subscribers.get(table, ()):
+            try:
+                handler(change)
+            except Exception as e:
+                print(f"Change feed subscriber error ({table}): {e}")
+        with _lock:
+            _stats["delivered"] += 1
+
+
+def get_stats() -> Dict[str, int]:
+    """Publish and delivery counts; the gap is what coalescing saved."""
+    return dict(_stats)
+
+
+def _trader_of(table: str, record: Dict[str, Any]) -> Optional[str]:
+    return record.get("id") if table == "traders" else record.get("trader_id")
+
+
+def _on_realtime_event(table: str, payload: Dict[str, Any]) -> None:
+    data = payload.get("data", payload)
+    record = data.get("record") or data.get("old_record") or {}
+    trader_id = _trader_of(table, record)
+    if not trader_id:
+        return
+    deleted = data.get("type") == "DELETE"  # a str enum in realtime payloads
+    row = {**record, "is_active": False} if deleted and table == "products" else record
+    publish(table, trader_id, [row] if "id" in row else None, defer=True)
+    _schedule_flush()
+
+
+def _schedule_flush() -> None:
+    global _flush_scheduled
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        flush()
+        return
+    if not _flush_scheduled:
+        _flush_scheduled = True
+        loop.call_later(CHANGE_FEED_COALESCE_WINDOW, _scheduled_flush)
+
+
+def _scheduled_flush() -> None:
+    global _flush_scheduled
+    _flush_scheduled = False
+    flush()
+
+
+async def start_realtime_listener() -> bool:
+    """Tail Supabase Realtime into the feed. Returns False when disabled or unavailable."""
+    if not CHANGE_FEED_REALTIME:
+        return False
+    try:
+        from supabase import acreate_client
+
+        client = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+        channel = client.channel("catalog-changes")
+        for table in TABLES:
+            channel.on_postgres_changes(
+                "*", schema="public", table=table,
+                callback=lambda payload, table=table: _on_realtime_event(table, payload),
+            )
+        await channel.subscribe()
+        print("📡 Change feed listening to Supabase Realtime")
+        return True
+    except Exception as e:
+        print(f"Change feed realtime listener unavailable, using in-process events only: {e}")
+        return False
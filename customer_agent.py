@@ -9,11 +9,16 @@ from customer_config import (
 )
 from customer_tools import (
     get_shop_info, search_shop_products, get_product_details, 
-    get_products_by_category, check_product_availability, 
+    get_products_by_category, check_product_availability, check_products_availability,
     get_price_range, get_products_in_price_range,
     create_order, create_payment_link, check_order_status, notify_seller
 )
 from customer_sessions import CustomerAgentState
+from identity_map import request_scope
+from recommendations import similar_products, suggest_for_query
+
+# Searches with fewer results than this also get similar-product suggestions
+WEAK_SEARCH_RESULTS = 3
 
 # Define the state again here or import? I can use the TypedDict from customer_sessions
 # But LangGraph needs it to be passed to StateGraph. 
@@ -69,41 +74,25 @@ INSTRUCTIONS:
 Keep responses SHORT and helpful. Don't repeat the welcome message if you already searched.
 """
 
-def process_message(state: CustomerAgentState) -> CustomerAgentState:
-    """Parse intent and update state."""
-    client = create_client()
-    
-    current_status = state.get("status", "browsing")
-    
-    # Format categories for prompt inputs if needed, 
-    # but mainly we need to pass current state vars
-    
+def _decision_messages(state: CustomerAgentState) -> list:
     # IMPORTANT: The decision model needs some history; sending only the last user
     # message makes it default to tool=null too often.
     history = state.get("messages", [])[-8:]
     messages = [
         {"role": "system", "content": STATE_SYSTEM_PROMPT.format(
-            status=current_status,
+            status=state.get("status", "browsing"),
             product_id=state.get("product_id"),
             order_id=state.get("order_id")
         )}
     ]
     messages.extend(history)
-    
-    try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=messages,
-            temperature=0.1,
-            response_format={"type": "json_object"}
-        )
-    except Exception as e:
-        print(f"API Error in process_message: {e}")
-        # Return state as is, maybe loop logic will retry or fail gracefully
-        return state
-    
+    return messages
+
+def _apply_decision(state: CustomerAgentState, content: str) -> bool:
+    """Parse the decision model's reply into state. Returns True if the seller should be notified."""
+    current_status = state.get("status", "browsing")
     try:
-        decision = json.loads(response.choices[0].message.content)
+        decision = json.loads(content)
         state["context"]["decision"] = decision
 
         # Lightweight debug logging (helps trace tool selection issues)
@@ -149,16 +138,46 @@ def process_message(state: CustomerAgentState) -> CustomerAgentState:
                     state[k] = v
             
             # If status transitioned to PAID just now (via decision), trigger notification
-            if decision.get("next_state") == "paid":
-                 if state.get("order_id"):
-                      notify_seller(state["order_id"])
+            if decision.get("next_state") == "paid" and state.get("order_id"):
+                return True
                     
     except Exception as e:
         print(f"Decision Parse Error: {e}")
         state["context"]["decision"] = {"tool": None}
+    return False
+
+def process_message(state: CustomerAgentState) -> CustomerAgentState:
+    """Parse intent and update state."""
+    client = create_client()
+    
+    try:
+        response = client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=_decision_messages(state),
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
+    except Exception as e:
+        print(f"API Error in process_message: {e}")
+        # Return state as is, maybe loop logic will retry or fail gracefully
+        return state
+    
+    if _apply_decision(state, response.choices[0].message.content):
+        notify_seller(state["order_id"])
         
     return state
 
+def _safe_recommendations(lookup, trader_id: str, key: str) -> list:
+    """Recommendations are a nice-to-have; never let them break a search reply."""
+    try:
+        return lookup(trader_id, key)
+    except Exception as e:
+        print(f"[customer_agent] Recommendations error: {e}")
+        return []
+
+def _format_alternatives(products: list) -> str:
+    return "".join(f"- **{p['name']}** (Price: {p['price']})\n" for p in products)
+
 def execute_tools(state: CustomerAgentState) -> CustomerAgentState:
     """Execute the selected tool."""
     decision = state["context"].get("decision", {})
@@ -186,13 +205,18 @@ def execute_tools(state: CustomerAgentState) -> CustomerAgentState:
                  top_results = result["results"][:3]
                  enhanced_message = "Here is what I found:\n"
                  
+                 # Check availability for all of them at once (the search result
+                 # itself answers this while it is fresh)
+                 stock_by_id = check_products_availability(
+                     trader_id, [p["id"] for p in top_results], search_result=result
+                 )
+                 
                  for p in top_results:
                       try:
-                          # Check availability first
-                          stock_res = check_product_availability(p["id"], trader_id)
-                          if stock_res.get("available"):
-                               # Create Order
-                               order_res = create_order(trader_id, p["id"], "delivery", {})
+                          if stock_by_id.get(p["id"], 0) > 0:
+                               # Create Order. These links are speculative (up to 3 per
+                               # search), so they don't hold stock; it is taken when paid.
+                               order_res = create_order(trader_id, p["id"], "delivery", {}, reserve=False)
                                if "id" in order_res:
                                     link = create_payment_link(order_res["id"])
                                     # Append to product info for display
@@ -217,9 +241,28 @@ def execute_tools(state: CustomerAgentState) -> CustomerAgentState:
                       if state["payment_link"]:
                           state["status"] = "awaiting_payment"
                  
+                 # Few matches: pad with precomputed neighbours of the best one
+                 if len(result["results"]) < WEAK_SEARCH_RESULTS:
+                      shown = {p["id"] for p in result["results"]}
+                      alternatives = [
+                          a for a in _safe_recommendations(similar_products, trader_id, top_results[0]["id"])
+                          if a["id"] not in shown
+                      ][:WEAK_SEARCH_RESULTS - len(result["results"])]
+                      if alternatives:
+                           result["alternatives"] = alternatives
+                           enhanced_message += "\nYou might also like:\n" + _format_alternatives(alternatives)
+                 
                  result["message"] = enhanced_message
             else:
-                 result = {"error": "No products found", "message": "I couldn't find exactly that. try checking our categories?"}
+                 alternatives = _safe_recommendations(suggest_for_query, trader_id, args.get("query", ""))
+                 if alternatives:
+                      result = {
+                          "error": "No exact match",
+                          "alternatives": alternatives,
+                          "message": "I couldn't find exactly that, but these are close:\n" + _format_alternatives(alternatives)
+                      }
+                 else:
+                      result = {"error": "No products found", "message": "I couldn't find exactly that. try checking our categories?"}
             
         elif tool_name == "check_product_availability":
             # If we are checking availability to Select a product
@@ -254,6 +297,10 @@ def execute_tools(state: CustomerAgentState) -> CustomerAgentState:
                         result["order_created"] = True
                         result["payment_link"] = link
                         result["message"] = "Order initialized. Link generated."
+                     else:
+                        # Someone else bought the last unit between the check and the order
+                        result = {"available": False, "stock_quantity": 0, "product_name": result.get("product_name"),
+                                  "message": "Sorry, that item just sold out."}
             else:
                 result = {"error": "Product not identified"}
                 
@@ -294,8 +341,13 @@ def execute_tools(state: CustomerAgentState) -> CustomerAgentState:
     # Automatic Actions Logic outside explicit tool calls
     # REMOVED: Previous logic that created order on entering awaiting_payment
     # Reason: We now do it eagerly in check_product_availability
-    pass
-    
+    if _record_tool_result(state, result):
+        notify_seller(state["order_id"])
+    return state
+
+def _record_tool_result(state: CustomerAgentState, result) -> bool:
+    """Store a tool result in state. Returns True if the seller should be notified."""
+    notify = False
     # If checking status returns PAID, decide next step
     if state["context"].get("decision", {}).get("tool") == "check_order_status":
         if isinstance(result, dict) and result.get("status") == "paid":
@@ -303,8 +355,7 @@ def execute_tools(state: CustomerAgentState) -> CustomerAgentState:
              if state.get("delivery_details") and len(str(state["delivery_details"])) > 10:
                   state["status"] = "paid"
                   # Notify seller immediately since we are skipping the collection step
-                  if state.get("order_id"):
-                      notify_seller(state["order_id"])
+                  notify = bool(state.get("order_id"))
              else:
                   state["status"] = "collecting_delivery_details"
     
@@ -324,12 +375,9 @@ def execute_tools(state: CustomerAgentState) -> CustomerAgentState:
         )
     except Exception:
         pass
-    return state
+    return notify
 
-def synthesize_response(state: CustomerAgentState) -> CustomerAgentState:
-    """Generate final response using tool results."""
-    client = create_client()
-    
+def _synthesis_messages(state: CustomerAgentState) -> list:
     tool_results = state["context"].get("tool_result")
     
     system_msg = RESPONSE_SYSTEM_PROMPT.format(
@@ -340,15 +388,31 @@ def synthesize_response(state: CustomerAgentState) -> CustomerAgentState:
     )
     
     # System prompt + last user message
-    msgs = [
+    return [
         {"role": "system", "content": system_msg},
         {"role": "user", "content": state["messages"][-1]["content"]}
     ]
+
+def _chitchat_messages(state: CustomerAgentState) -> list:
+    system_msg = RESPONSE_SYSTEM_PROMPT.format(
+        shop_name=state["trader_name"],
+        status=state.get("status", "browsing"),
+        payment_link=state.get("payment_link", ""),
+        tool_results="No search performed (user greeting or chitchat).",
+    )
+    
+    messages = [{"role": "system", "content": system_msg}]
+    messages.extend(state["messages"][-3:])
+    return messages
+
+def synthesize_response(state: CustomerAgentState) -> CustomerAgentState:
+    """Generate final response using tool results."""
+    client = create_client()
     
     try:
         response = client.chat.completions.create(
             model=MODEL_NAME,
-            messages=msgs,
+            messages=_synthesis_messages(state),
             temperature=0.7,
             max_tokens=MAX_TOKENS
         )
@@ -364,22 +428,10 @@ def generate_response(state: CustomerAgentState) -> CustomerAgentState:
     """Generate response without tools (chit-chat/greeting only)."""
     client = create_client()
     
-    user_message = state["messages"][-1]["content"]
-    
-    system_msg = RESPONSE_SYSTEM_PROMPT.format(
-        shop_name=state["trader_name"],
-        status=state.get("status", "browsing"),
-        payment_link=state.get("payment_link", ""),
-        tool_results="No search performed (user greeting or chitchat).",
-    )
-    
-    messages = [{"role": "system", "content": system_msg}]
-    messages.extend(state["messages"][-3:]) 
-    
     try:
         response = client.chat.completions.create(
             model=MODEL_NAME,
-            messages=messages,
+            messages=_chitchat_messages(state),
             temperature=0.7,
             max_tokens=MAX_TOKENS
         )
@@ -400,13 +452,19 @@ def decide_next_step(state: CustomerAgentState) -> Literal["execute_tools", "gen
         return "execute_tools"
     return "generate_response"
 
-def build_customer_graph() -> StateGraph:
+def build_customer_graph(nodes: Optional[dict] = None) -> StateGraph:
+    """Compile the customer graph; nodes overrides node functions by name (e.g. async twins)."""
+    nodes = {
+        "process_message": process_message,
+        "execute_tools": execute_tools,
+        "synthesize_response": synthesize_response,
+        "generate_response": generate_response,
+        **(nodes or {}),
+    }
     graph = StateGraph(CustomerAgentState)
     
-    graph.add_node("process_message", process_message)
-    graph.add_node("execute_tools", execute_tools)
-    graph.add_node("synthesize_response", synthesize_response)
-    graph.add_node("generate_response", generate_response)
+    for name, node in nodes.items():
+        graph.add_node(name, node)
     
     graph.set_entry_point("process_message")
     
@@ -427,6 +485,8 @@ def handle_customer_chat(session_state: CustomerAgentState, user_message: str) -
     session_state["messages"].append({"role": "user", "content": user_message})
     
     app = build_customer_graph()
-    final_state = app.invoke(session_state)
+    # All tool reads in this turn share one identity map
+    with request_scope():
+        final_state = app.invoke(session_state)
     
     return final_state
@@ -0,0 +1,248 @@
+"""Asyncio-native customer chat graph.
+
+Same graph, prompts and state transitions as customer_agent, but every node
+is a coroutine: LLM calls use AsyncOpenAI and tools come from
+customer_tools_async, so a chat waiting on Groq, Supabase or Flutterwave
+holds no thread and thousands of chats can be in flight on one event loop.
+The graph is compiled once at import.
+"""
+import asyncio
+from typing import Optional
+
+from openai import AsyncOpenAI
+
+import executors
+from customer_agent import (
+    WEAK_SEARCH_RESULTS, build_customer_graph,
+    _decision_messages, _apply_decision, _record_tool_result,
+    _synthesis_messages, _chitchat_messages, _safe_recommendations, _format_alternatives,
+)
+from customer_config import MODEL_NAME, GROQ_BASE_URL, GROQ_API_KEY, MAX_TOKENS
+from customer_sessions import CustomerAgentState
+from customer_tools_async import (
+    get_shop_info, search_shop_products, check_product_availability, check_products_availability,
+    create_order, create_payment_link, check_order_status, notify_seller,
+)
+from identity_map import request_scope
+from recommendations import similar_products, suggest_for_query
+
+_client: Optional[AsyncOpenAI] = None
+
+
+def create_client() -> AsyncOpenAI:
+    """One shared client, so chats reuse its connection pool."""
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(base_url=GROQ_BASE_URL, api_key=GROQ_API_KEY)
+    return _client
+
+
+async def _notify_seller(order_id: str) -> None:
+    # The WhatsApp notification uses the sync Twilio client
+    await executors.io.run(notify_seller, order_id)
+
+
+async def process_message(state: CustomerAgentState) -> CustomerAgentState:
+    """Parse intent and update state."""
+    try:
+        response = await create_client().chat.completions.create(
+            model=MODEL_NAME,
+            messages=_decision_messages(state),
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
+    except Exception as e:
+        print(f"API Error in process_message: {e}")
+        return state
+
+    if _apply_decision(state, response.choices[0].message.content):
+        await _notify_seller(state["order_id"])
+    return state
+
+
+async def _buy_line(trader_id: str, p: dict, in_stock: bool) -> str:
+    """Speculative order + payment link for one search hit, as a message line."""
+    if not in_stock:
+        return f"\n- **{p['name']}** (Out of Stock)\n"
+    try:
+        # Speculative links don't hold stock; it is taken when paid
+        order_res = await create_order(trader_id, p["id"], "delivery", {}, reserve=False)
+        if "id" not in order_res:
+            return ""
+        link = await create_payment_link(order_res["id"])
+        p["payment_link"] = link
+        p["order_id"] = order_res["id"]
+        return f"\n- **{p['name']}**\n  Price: {p['price']} | Stock: {p['stock_quantity']}\n  [Buy Now]({link})\n"
+    except Exception as inner_e:
+        print(f"[customer_agent] ERROR processing product {p.get('id')}: {inner_e}")
+        return f"\n- **{p['name']}**\n  Price: {p['price']}\n"
+
+
+async def _search(state: CustomerAgentState, trader_id: str, query: str) -> dict:
+    # STATE RESET: New search means new interaction context.
+    state["order_id"] = None
+    state["payment_link"] = None
+    state["status"] = "browsing"
+
+    result = await search_shop_products(trader_id, query)
+    if not result.get("results"):
+        alternatives = await executors.db.run(_safe_recommendations, suggest_for_query, trader_id, query)
+        if alternatives:
+            return {
+                "error": "No exact match",
+                "alternatives": alternatives,
+                "message": "I couldn't find exactly that, but these are close:\n" + _format_alternatives(alternatives)
+            }
+        return {"error": "No products found", "message": "I couldn't find exactly that. try checking our categories?"}
+
+    top_results = result["results"][:3]
+    stock_by_id = await check_products_availability(
+        trader_id, [p["id"] for p in top_results], search_result=result
+    )
+    # The buy links for the top results are created concurrently
+    lines = await asyncio.gather(*(
+        _buy_line(trader_id, p, stock_by_id.get(p["id"], 0) > 0) for p in top_results
+    ))
+    message = "Here is what I found:\n" + "".join(lines)
+
+    if len(top_results) == 1:
+        state["product_id"] = top_results[0]["id"]
+        state["payment_link"] = top_results[0].get("payment_link")
+        state["order_id"] = top_results[0].get("order_id")
+        if state["payment_link"]:
+            state["status"] = "awaiting_payment"
+
+    # Few matches: pad with precomputed neighbours of the best one
+    if len(result["results"]) < WEAK_SEARCH_RESULTS:
+        shown = {p["id"] for p in result["results"]}
+        neighbours = await executors.db.run(_safe_recommendations, similar_products, trader_id, top_results[0]["id"])
+        alternatives = [a for a in neighbours if a["id"] not in shown][:WEAK_SEARCH_RESULTS - len(result["results"])]
+        if alternatives:
+            result["alternatives"] = alternatives
+            message += "\nYou might also like:\n" + _format_alternatives(alternatives)
+
+    result["message"] = message
+    return result
+
+
+async def _select_product(state: CustomerAgentState, trader_id: str, args: dict) -> dict:
+    p_id = args.get("product_id") or state.get("product_id")
+    if not p_id and args.get("product_name"):
+        search_res = await search_shop_products(trader_id, args.get("product_name"))
+        if search_res["results"]:
+            p_id = search_res["results"][0]["id"]
+    if not p_id:
+        return {"error": "Product not identified"}
+
+    result = await check_product_availability(p_id, trader_id)
+    # CHAINING LOGIC: If available, immediately create order + payment link
+    if result.get("available"):
+        state["product_id"] = p_id
+        order_res = await create_order(trader_id, p_id, "delivery", {})
+        if "id" in order_res:
+            state["order_id"] = order_res["id"]
+            link = await create_payment_link(state["order_id"])
+            state["payment_link"] = link
+            state["status"] = "awaiting_payment"
+            result["order_created"] = True
+            result["payment_link"] = link
+            result["message"] = "Order initialized. Link generated."
+        else:
+            # Someone else bought the last unit between the check and the order
+            result = {"available": False, "stock_quantity": 0, "product_name": result.get("product_name"),
+                      "message": "Sorry, that item just sold out."}
+    return result
+
+
+async def execute_tools(state: CustomerAgentState) -> CustomerAgentState:
+    """Execute the selected tool."""
+    decision = state["context"].get("decision", {})
+    tool_name = decision.get("tool")
+    args = decision.get("args", {})
+    trader_id = state["trader_id"]
+
+    result = None
+    try:
+        if tool_name == "search_shop_products":
+            result = await _search(state, trader_id, args.get("query", ""))
+        elif tool_name == "check_product_availability":
+            result = await _select_product(state, trader_id, args)
+        elif tool_name == "create_payment_link":
+            order_id = state.get("order_id")
+            if order_id:
+                result = await create_payment_link(order_id)
+                state["payment_link"] = result
+            else:
+                result = "Error: No order ID"
+        elif tool_name == "check_order_status":
+            order_id = state.get("order_id")
+            if order_id:
+                status = await check_order_status(order_id)
+                result = {"status": status}
+                if status == "paid":
+                    state["status"] = "paid"
+                    await _notify_seller(order_id)
+            else:
+                result = "Error: No order ID"
+        elif tool_name == "get_shop_info":
+            result = await get_shop_info(trader_id)
+    except Exception as e:
+        result = {"error": str(e)}
+
+    if _record_tool_result(state, result):
+        await _notify_seller(state["order_id"])
+    return state
+
+
+async def _reply(messages: list, fallback: str, node: str) -> str:
+    try:
+        response = await create_client().chat.completions.create(
+            model=MODEL_NAME,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=MAX_TOKENS
+        )
+        return response.choices[0].message.content
+    except Exception as e:
+        print(f"API Error in {node}: {e}")
+        return fallback
+
+
+async def synthesize_response(state: CustomerAgentState) -> CustomerAgentState:
+    """Generate final response using tool results."""
+    reply = await _reply(
+        _synthesis_messages(state),
+        "I'm experiencing high traffic right now. Please try again in 10-20 seconds.",
+        "synthesize_response",
+    )
+    state["messages"].append({"role": "assistant", "content": reply})
+    return state
+
+
+async def generate_response(state: CustomerAgentState) -> CustomerAgentState:
+    """Generate response without tools (chit-chat/greeting only)."""
+    reply = await _reply(
+        _chitchat_messages(state),
+        "I'm experiencing high traffic right now. Please try again in a moment.",
+        "generate_response",
+    )
+    state["messages"].append({"role": "assistant", "content": reply})
+    return state
+
+
+_graph = build_customer_graph({
+    "process_message": process_message,
+    "execute_tools": execute_tools,
+    "synthesize_response": synthesize_response,
+    "generate_response": generate_response,
+})
+
+
+async def handle_customer_chat_async(session_state: CustomerAgentState, user_message: str) -> CustomerAgentState:
+    session_state["messages"].append({"role": "user", "content": user_message})
+
+    # All tool reads in this turn share one identity map
+    with request_scope():
+        final_state = await _graph.ainvoke(session_state)
+
+    return final_state
@@ -17,6 +17,17 @@ SESSION_TTL = int(os.getenv("CUSTOMER_SESSION_TTL", "1800"))
 MAX_SESSION_MESSAGES = int(os.getenv("CUSTOMER_MAX_SESSION_MESSAGES", "50"))
 MAX_SESSION_DURATION = 7200  # 2 hours
 CLEANUP_INTERVAL = 300  # 5 minutes
+# Longest a history request may be held open waiting for new messages (seconds)
+HISTORY_LONG_POLL_MAX = float(os.getenv("CUSTOMER_HISTORY_LONG_POLL_MAX", "30"))
+
+# Session snapshots (see session_snapshots.py): changed sessions are appended
+# to this log every SESSION_SNAPSHOT_INTERVAL seconds and on shutdown, and
+# replayed at startup. Put the path on a volume that survives restarts.
+SESSION_SNAPSHOT_ENABLED = os.getenv("SESSION_SNAPSHOT_ENABLED", "true").lower() == "true"
+SESSION_SNAPSHOT_PATH = os.getenv("SESSION_SNAPSHOT_PATH", "sessions.snapshot")
+SESSION_SNAPSHOT_INTERVAL = int(os.getenv("SESSION_SNAPSHOT_INTERVAL", "15"))
+# Seller WhatsApp sessions have no expiry of their own; older ones aren't restored
+TRADER_SESSION_RESTORE_TTL = int(os.getenv("TRADER_SESSION_RESTORE_TTL", "86400"))
 
 # Rate limiting
 RATE_LIMIT_PER_MINUTE = int(os.getenv("CUSTOMER_RATE_LIMIT_PER_MINUTE", "30"))
@@ -25,9 +36,52 @@ MAX_CONCURRENT_SESSIONS = int(os.getenv("CUSTOMER_MAX_CONCURRENT_SESSIONS", "100
 
 # Response settings
 MAX_PRODUCTS_IN_RESPONSE = 5
+MAX_SEARCH_RESULTS = 20
+MAX_PRODUCTS_PER_PAGE = 50
 INCLUDE_PRODUCT_IMAGES = True
 ENCOURAGE_WHATSAPP_CONTACT = True
 
+# Search results younger than this (seconds) are trusted for stock checks
+AVAILABILITY_MAX_STALENESS = float(os.getenv("CUSTOMER_AVAILABILITY_MAX_STALENESS", "5"))
+
+# Shop preview cache (seconds): served fresh for the TTL, then served stale
+# while it is refreshed in the background, up to the stale TTL
+PREVIEW_CACHE_TTL = int(os.getenv("PREVIEW_CACHE_TTL", "30"))
+PREVIEW_CACHE_STALE_TTL = int(os.getenv("PREVIEW_CACHE_STALE_TTL", "300"))
+
+# Stock reservation settings
+RESERVATION_TTL = int(os.getenv("STOCK_RESERVATION_TTL", "900"))  # 15 minutes to pay
+RESERVATION_SWEEP_INTERVAL = 60
+
+# Shop search index is rebuilt after this many seconds (seller writes apply immediately)
+SEARCH_INDEX_TTL = int(os.getenv("SEARCH_INDEX_TTL", "300"))
+
+# Marketplace search: at most this many results per shop, full rebuild interval (seconds)
+MARKETPLACE_PER_SHOP_CAP = int(os.getenv("MARKETPLACE_PER_SHOP_CAP", "3"))
+MARKETPLACE_INDEX_TTL = int(os.getenv("MARKETPLACE_INDEX_TTL", "900"))
+
+# Similar-product recommendations: neighbours kept per product, batch rebuild interval (seconds)
+RECOMMENDATIONS_TOP_K = 5
+RECOMMENDATIONS_INTERVAL = int(os.getenv("RECOMMENDATIONS_INTERVAL", "3600"))
+
+# Change feed: also tail Supabase Realtime (for writes made outside this
+# process), buffering its events this many seconds before delivery
+CHANGE_FEED_REALTIME = os.getenv("CHANGE_FEED_REALTIME", "false").lower() == "true"
+CHANGE_FEED_COALESCE_WINDOW = float(os.getenv("CHANGE_FEED_COALESCE_WINDOW", "0.5"))
+
+# Thread pools per I/O class (see executors.py): concurrent calls, and how
+# many more may queue before requests are shed with a 503
+EXECUTOR_LLM_WORKERS = int(os.getenv("EXECUTOR_LLM_WORKERS", "32"))
+EXECUTOR_LLM_QUEUE = int(os.getenv("EXECUTOR_LLM_QUEUE", "128"))
+EXECUTOR_DB_WORKERS = int(os.getenv("EXECUTOR_DB_WORKERS", "16"))
+EXECUTOR_DB_QUEUE = int(os.getenv("EXECUTOR_DB_QUEUE", "256"))
+EXECUTOR_IO_WORKERS = int(os.getenv("EXECUTOR_IO_WORKERS", "8"))
+EXECUTOR_IO_QUEUE = int(os.getenv("EXECUTOR_IO_QUEUE", "64"))
+
+# Customer chat pipeline: "async" runs the graph on the event loop
+# (customer_agent_async), "threaded" runs the sync graph in the threadpool
+CUSTOMER_PIPELINE = os.getenv("CUSTOMER_PIPELINE", "async").lower()
+
 # Payment Settings
 FLUTTERWAVE_SECRET_KEY = os.getenv("FLUTTERWAVE_SECRET_KEY", "")
 FLUTTERWAVE_PUBLIC_KEY = os.getenv("FLUTTERWAVE_PUBLIC_KEY", "")
@@ -1,11 +1,27 @@
+"""In-memory customer chat sessions.
+
+A session is a compact __slots__ object rather than nested dicts. Its
+messages live in a fixed-capacity ring buffer (the last MAX_SESSION_MESSAGES
+are kept) as (role, content) tuples with interned role strings. The graph
+still works on a CustomerAgentState dict: to_state() builds one per turn
+around the session's own ring, and update_session() copies the results back,
+keeping the turn's tool result only as product ids (last_tool_result) so the
+payloads aren't held until the session expires. memory_report() estimates bytes per session for sizing.
+
+Message indexes are absolute (0 is a session's first message ever), so
+history readers can poll with a `since` cursor that stays valid as the ring
+drops old messages.
+"""
+import asyncio
+import sys
 import time
 import uuid
-from typing import Dict, TypedDict, Optional, List, Literal
+from typing import Any, Dict, TypedDict, Optional, List, Literal, Tuple
 from datetime import datetime, timezone
-from customer_config import SESSION_TTL, MAX_SESSION_MESSAGES, MAX_SESSION_DURATION
+from customer_config import SESSION_TTL, MAX_SESSION_MESSAGES, MAX_SESSION_DURATION, MAX_CONCURRENT_SESSIONS
 
 class CustomerAgentState(TypedDict):
-    messages: list[dict]
+    messages: "MessageRing"
     trader_id: str
     trader_name: str
     whatsapp_number: str
@@ -28,50 +44,162 @@ class CustomerAgentState(TypedDict):
         "completed",
     ]
 
-class Session(TypedDict):
-    session_id: str
-    trader_id: str
-    state: CustomerAgentState
-    created_at: float
-    last_activity: float
-    message_count: int
+class MessageRing:
+    """The last `capacity` chat messages, oldest first.
+
+    Reads return {"role", "content"} dicts like a list of messages, so the
+    agents can index, slice and append as before. total counts every message
+    ever appended, so total - len(ring) is the index of the oldest one kept.
+    """
+    __slots__ = ("capacity", "total", "_items", "_head")
+
+    def __init__(self, capacity: int = MAX_SESSION_MESSAGES):
+        self.capacity = capacity
+        self.total = 0
+        self._items: List[tuple] = []
+        self._head = 0  # position of the oldest message once the ring is full
+
+    def append(self, message: Dict[str, str]) -> None:
+        item = (sys.intern(message["role"]), message["content"])
+        if len(self._items) < self.capacity:
+            self._items.append(item)
+        else:
+            self._items[self._head] = item
+            self._head = (self._head + 1) % self.capacity
+        self.total += 1
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _ordered(self) -> List[tuple]:
+        return self._items[self._head:] + self._items[:self._head] if self._head else self._items
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [{"role": role, "content": content} for role, content in self._ordered()[index]]
+        n = len(self._items)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("message index out of range")
+        role, content = self._items[(self._head + index) % n]
+        return {"role": role, "content": content}
+
+    def __iter__(self):
+        for role, content in self._ordered():
+            yield {"role": role, "content": content}
+
+    def __reversed__(self):
+        for role, content in reversed(self._ordered()):
+            yield {"role": role, "content": content}
+
+    def __bool__(self) -> bool:
+        return bool(self._items)
+
+    def since(self, index: int) -> Tuple[int, List[Dict[str, str]]]:
+        """Messages from absolute index `index` on, and the index of the first one returned.
+
+        An index older than the ring holds starts at the oldest kept message.
+        """
+        first = max(index, self.total - len(self._items))
+        if first >= self.total:
+            return self.total, []
+        return first, self[first - self.total:]
+
+    def items(self) -> List[tuple]:
+        """(role, content) tuples, oldest first."""
+        return list(self._ordered())
+
+    @classmethod
+    def from_items(cls, items: List[tuple], total: int, capacity: int = MAX_SESSION_MESSAGES) -> "MessageRing":
+        ring = cls(capacity)
+        ring._items = [(sys.intern(role), content) for role, content in items[-capacity:]]
+        ring.total = max(total, len(ring._items))
+        return ring
+
+class Session:
+    __slots__ = (
+        "session_id", "trader_id", "trader_name", "whatsapp_number",
+        "created_at", "last_activity", "messages", "context",
+        "product_id", "order_id", "fulfillment_type", "delivery_details", "payment_link", "status",
+    )
+
+    def __init__(self, session_id: str, trader_id: str, trader_name: str, whatsapp_number: str, now: float):
+        self.session_id = session_id
+        self.trader_id = trader_id
+        self.trader_name = trader_name
+        self.whatsapp_number = whatsapp_number
+        self.created_at = now
+        self.last_activity = now
+        self.messages = MessageRing()
+        self.context: Dict[str, Any] = {}
+        self.product_id: Optional[str] = None
+        self.order_id: Optional[str] = None
+        self.fulfillment_type: Optional[str] = None
+        self.delivery_details: Optional[Dict[str, str]] = None
+        self.payment_link: Optional[str] = None
+        self.status = "browsing"
+
+    @property
+    def message_count(self) -> int:
+        return self.messages.total
+
+    def to_record(self) -> tuple:
+        """Plain-value tuple for session snapshots (see session_snapshots)."""
+        return (
+            self.session_id, self.trader_id, self.trader_name, self.whatsapp_number,
+            self.created_at, self.last_activity, self.messages.total, self.messages.items(), self.context,
+            self.product_id, self.order_id, self.fulfillment_type, self.delivery_details, self.payment_link, self.status,
+        )
+
+    @classmethod
+    def from_record(cls, record: tuple) -> "Session":
+        (session_id, trader_id, trader_name, whatsapp_number, created_at, last_activity, total, items, context,
+         product_id, order_id, fulfillment_type, delivery_details, payment_link, status) = record
+        session = cls(session_id, trader_id, trader_name, whatsapp_number, created_at)
+        session.last_activity = last_activity
+        session.messages = MessageRing.from_items(items, total)
+        session.context = context
+        session.product_id = product_id
+        session.order_id = order_id
+        session.fulfillment_type = fulfillment_type
+        session.delivery_details = delivery_details
+        session.payment_link = payment_link
+        session.status = sys.intern(status)
+        return session
+
+    def is_expired(self, now: float) -> bool:
+        return now - self.last_activity > SESSION_TTL or now - self.created_at > MAX_SESSION_DURATION
+
+    def to_state(self) -> CustomerAgentState:
+        """Graph state for one turn; shares this session's message ring."""
+        return {
+            "messages": self.messages,
+            "trader_id": self.trader_id,
+            "trader_name": self.trader_name,
+            "whatsapp_number": self.whatsapp_number,
+            "session_id": self.session_id,
+            "created_at": datetime.fromtimestamp(self.created_at, timezone.utc).isoformat(),
+            "last_activity": datetime.fromtimestamp(self.last_activity, timezone.utc).isoformat(),
+            # No tool_result: the server reads it as this turn's result
+            "context": {key: value for key, value in self.context.items() if key != "tool_result"},
+            "product_id": self.product_id,
+            "order_id": self.order_id,
+            "fulfillment_type": self.fulfillment_type,
+            "delivery_details": self.delivery_details,
+            "payment_link": self.payment_link,
+            "status": self.status,
+        }
 
 # In-memory session store
 sessions: Dict[str, Session] = {}
+# Long-polling history readers per session, woken by update_session()
+_waiters: Dict[str, List[asyncio.Future]] = {}
 
 def create_session(trader_id: str, trader_name: str, whatsapp_number: str) -> Session:
     """Create a new session for a customer interacting with a specific trader."""
-    session_id = str(uuid.uuid4())
-    now_ts = time.time()
-    now_iso = datetime.now(timezone.utc).isoformat()
-    
-    initial_state: CustomerAgentState = {
-        "messages": [],
-        "trader_id": trader_id,
-        "trader_name": trader_name,
-        "whatsapp_number": whatsapp_number,
-        "session_id": session_id,
-        "created_at": now_iso,
-        "last_activity": now_iso,
-        "context": {},
-        "product_id": None,
-        "order_id": None,
-        "fulfillment_type": None,
-        "delivery_details": None,
-        "payment_link": None,
-        "status": "browsing"
-    }
-    
-    session: Session = {
-        "session_id": session_id,
-        "trader_id": trader_id,
-        "state": initial_state,
-        "created_at": now_ts,
-        "last_activity": now_ts,
-        "message_count": 0
-    }
-    
-    sessions[session_id] = session
+    session = Session(str(uuid.uuid4()), trader_id, trader_name, whatsapp_number, time.time())
+    sessions[session.session_id] = session
     return session
 
 def get_session(session_id: str) -> Optional[Session]:
@@ -79,41 +207,124 @@ def get_session(session_id: str) -> Optional[Session]:
     session = sessions.get(session_id)
     if not session:
         return None
-        
+
     now = time.time()
-    
-    # Check TTL
-    if now - session["last_activity"] > SESSION_TTL:
-        del sessions[session_id]
-        return None
-        
-    # Check max duration
-    if now - session["created_at"] > MAX_SESSION_DURATION:
+
+    # Check TTL and max duration
+    if session.is_expired(now):
         del sessions[session_id]
         return None
-        
+
     # Update last activity
-    session["last_activity"] = now
-    session["state"]["last_activity"] = datetime.now(timezone.utc).isoformat()
+    session.last_activity = now
     return session
 
+def _ids(items: list) -> List[str]:
+    return [p["id"] for p in items if isinstance(p, dict) and "id" in p]
+
+def _trim_tool_result(result: Any) -> Any:
+    """A tool result reduced to ids and scalars, not product payloads.
+
+    Product lists are kept as "<key>_ids", never under the keys the server
+    reads product cards from ("results", "alternatives").
+    """
+    if isinstance(result, dict):
+        trimmed = {}
+        for key, value in result.items():
+            if isinstance(value, list):
+                trimmed[f"{key}_ids"] = _ids(value)
+            elif key != "message" and (value is None or isinstance(value, (str, int, float, bool))):
+                trimmed[key] = value
+        return trimmed
+    if isinstance(result, list):
+        return {"ids": _ids(result)}
+    return result
+
 def update_session(session_id: str, state: CustomerAgentState) -> None:
-    """Update session state."""
-    if session_id in sessions:
-        sessions[session_id]["state"] = state
-        sessions[session_id]["message_count"] = len(state["messages"])
-        
+    """Copy a finished turn's state back into its session. Call on the event loop."""
+    session = sessions.get(session_id)
+    if session is None:
+        return
+    for future in _waiters.pop(session_id, ()):
+        if not future.done():
+            future.set_result(None)
+    if state["messages"] is not session.messages:
+        session.messages = MessageRing()
+        for message in state["messages"]:
+            session.messages.append(message)
+    context = {"decision": state["context"].get("decision")}
+    if "tool_result" in state["context"]:
+        context["last_tool_result"] = _trim_tool_result(state["context"]["tool_result"])
+    session.context = context
+    session.product_id = state.get("product_id")
+    session.order_id = state.get("order_id")
+    session.fulfillment_type = state.get("fulfillment_type")
+    session.delivery_details = state.get("delivery_details")
+    session.payment_link = state.get("payment_link")
+    session.status = sys.intern(state.get("status") or "browsing")
+
+async def wait_for_messages(session: Session, since: int, timeout: float) -> bool:
+    """Wait until the session has messages past index `since`. False on timeout."""
+    if session.messages.total > since:
+        return True
+    future = asyncio.get_running_loop().create_future()
+    waiters = _waiters.setdefault(session.session_id, [])
+    waiters.append(future)
+    try:
+        await asyncio.wait_for(future, timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        if future in waiters:
+            waiters.remove(future)
+        if not waiters and _waiters.get(session.session_id) is waiters:
+            del _waiters[session.session_id]
+
 def cleanup_expired_sessions() -> int:
     """Remove expired sessions to free memory. Returns count of removed sessions."""
     now = time.time()
     expired = []
-    
+
     for sid, session in sessions.items():
-        if (now - session["last_activity"] > SESSION_TTL) or \
-           (now - session["created_at"] > MAX_SESSION_DURATION):
+        if session.is_expired(now):
             expired.append(sid)
-            
+
     for sid in expired:
         del sessions[sid]
-        
+
     return len(expired)
+
+def _deep_size(obj: Any, seen: set) -> int:
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(_deep_size(getattr(obj, slot), seen) for slot in obj.__slots__ if hasattr(obj, slot))
+    return size
+
+def memory_report(sample: int = 200) -> Dict[str, Any]:
+    """Approximate bytes per live session, from up to `sample` sessions.
+
+    Interned roles and small ints are shared with the rest of the process,
+    so they are counted once per sampled session, not per message.
+    """
+    sampled = list(sessions.values())[:sample]
+    sizes = [_deep_size(session, set()) for session in sampled]
+    avg = sum(sizes) / len(sizes) if sizes else 0
+    return {
+        "sessions": len(sessions),
+        "sampled": len(sampled),
+        "avg_bytes_per_session": round(avg),
+        "max_bytes_per_session": max(sizes, default=0),
+        "avg_messages_per_session": round(sum(len(s.messages) for s in sampled) / len(sampled), 1) if sampled else 0,
+        "message_capacity": MAX_SESSION_MESSAGES,
+        "estimated_bytes_total": round(avg * len(sessions)),
+        "estimated_bytes_at_max_sessions": round(avg * MAX_CONCURRENT_SESSIONS),
+        "max_concurrent_sessions": MAX_CONCURRENT_SESSIONS,
+    }
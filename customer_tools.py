@@ -1,13 +1,25 @@
 from typing import List, Dict, Optional, Any
 from datetime import datetime, timezone
-from datetime import datetime, timezone
+import time
 import uuid
 import json
 import requests
 from database import get_supabase
 from config import ALLOWED_CATEGORIES
-from customer_config import FLUTTERWAVE_BASE_URL, FLUTTERWAVE_SECRET_KEY
+from customer_config import (
+    FLUTTERWAVE_BASE_URL, FLUTTERWAVE_SECRET_KEY, AVAILABILITY_MAX_STALENESS,
+    MAX_SEARCH_RESULTS, MAX_PRODUCTS_PER_PAGE
+)
+from pagination import decode_cursor, apply_keyset, page_result
+from reservations import reserve_stock, release_reservation, commit_reservation
+from identity_map import get_row, remember, forget
+from shop_stats import get_shop_stats
+from change_feed import publish
+from singleflight import singleflight
+from search_index import get_shop_index
+from query_normalizer import normalize_query
 
+@singleflight
 def get_shop_info(trader_id: str) -> Optional[Dict[str, Any]]:
     """Retrieve trader profile information."""
     supabase = get_supabase()
@@ -18,10 +30,10 @@ def get_shop_info(trader_id: str) -> Optional[Dict[str, Any]]:
         return None
         
     trader = response.data[0]
+    remember("traders", trader_id, trader)
     
-    # Get product count
-    prod_response = supabase.table("products").select("id", count="exact").eq("trader_id", trader_id).eq("is_active", True).execute()
-    product_count = prod_response.count if prod_response.count is not None else 0
+    # Product count comes from the incrementally maintained shop aggregates
+    product_count = get_shop_stats(trader_id).active_count
     
     return {
         "business_name": trader.get("business_name"),
@@ -31,77 +43,85 @@ def get_shop_info(trader_id: str) -> Optional[Dict[str, Any]]:
         "product_count": product_count
     }
 
-def search_shop_products(trader_id: str, query: str) -> Dict[str, Any]:
-    """Search products by keyword within a shop."""
+# Card fields plus what chat replies and follow-up reads need
+SEARCH_FIELDS = "id, trader_id, name, price, category, stock_quantity, image_url, description, is_active"
+
+def search_shop_products(trader_id: str, query: str, limit: int = MAX_SEARCH_RESULTS) -> Dict[str, Any]:
+    """Search products by keyword within a shop, most relevant first."""
+    try:
+        index = get_shop_index(trader_id)
+    except Exception as e:
+        print(f"Search index error: {e}")
+        return _search_shop_products_ilike(trader_id, normalize_query(query, expand=False), limit)
+
+    query = normalize_query(query, index)
+
+    # Index rows may lag stock changes from orders, so they are not put in the
+    # identity map and fetched_at is the index load time (availability checks
+    # treat older results as stale and re-read stock)
+    results = [_search_result(p) for p in index.search(query, limit)]
+    return {
+        "results": results,
+        "total": len(results),
+        "fetched_at": index.loaded_at
+    }
+
+def _search_result(p: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": p["id"],
+        "name": p["name"],
+        "price": p["price"],
+        "category": p["category"],
+        "stock_quantity": p["stock_quantity"],
+        "image_url": p.get("image_url", ""),
+        "description": p.get("description", "")
+    }
+
+def _search_shop_products_ilike(trader_id: str, query: str, limit: int) -> Dict[str, Any]:
+    """Substring search straight against the database, used if the index can't load."""
     supabase = get_supabase()
-    
-    # Using ilike for case-insensitive search
-    # Note: Supabase/PostgREST 'or' syntax for searching name or description
-    # format: name.ilike.%query%,description.ilike.%query%
-    
-    # We want (trader_id = X) AND (is_active = True) AND ((name ILIKE %q%) OR (description ILIKE %q%))
-    # This complex filtering might be easier with separate queries or using rpc if available,
-    # but let's try to construct it with the valid syntax.
-    
-    # Simple approach: search name first as it's most important
-    response = supabase.table("products") \
-        .select("*") \
-        .eq("trader_id", trader_id) \
-        .eq("is_active", True) \
-        .ilike("name", f"%{query}%") \
-        .order("stock_quantity", desc=True) \
-        .execute()
-        
-    # If not enough results, maybe search description? 
-    # For now let's stick to name as per commonly used pattern or if client supports 'or'
-    # .or_(f"name.ilike.%{query}%,description.ilike.%{query}%")
-    # But .or_ usually applies to top level.
-    
-    # Let's try attempting the .or_ filter combined with others.
-    # Note: chaining .eq with .or_ works as AND (OR) in some clients, but sometimes replaces.
-    # Safe implementation: Search name ilike query, filter locally if needed for description?
-    # Or use the 'or' syntax:
-    # supabase.table("products").select("*").eq("trader_id", trader_id).eq("is_active", True).or_(f"name.ilike.%{query}%,description.ilike.%{query}%").execute()
-    
+
     # Let's try the .or_ method which is standard for Supabase-py
     try:
         response = supabase.table("products") \
-            .select("*") \
+            .select(SEARCH_FIELDS) \
             .eq("trader_id", trader_id) \
             .eq("is_active", True) \
             .or_(f"name.ilike.%{query}%,description.ilike.%{query}%") \
             .order("stock_quantity", desc=True) \
+            .limit(limit) \
             .execute()
     except Exception as e:
         print(f"Search error: {e}")
         # Fallback to just name search if complex query fails
         response = supabase.table("products") \
-            .select("*") \
+            .select(SEARCH_FIELDS) \
             .eq("trader_id", trader_id) \
             .eq("is_active", True) \
             .ilike("name", f"%{query}%") \
             .order("stock_quantity", desc=True) \
+            .limit(limit) \
             .execute()
 
     results = []
     for p in response.data:
-        results.append({
-            "id": p["id"],
-            "name": p["name"],
-            "price": p["price"],
-            "category": p["category"],
-            "stock_quantity": p["stock_quantity"],
-            "image_url": p.get("image_url", ""),
-            "description": p.get("description", "")
-        })
+        # Rows are kept so follow-up reads in this request skip the DB; they
+        # carry every field availability checks and orders read
+        remember("products", p["id"], p)
+        results.append(_search_result(p))
         
     return {
         "results": results,
-        "total": len(results)
+        "total": len(results),
+        "fetched_at": time.time()
     }
 
 def get_product_details(trader_id: str, product_id: str) -> Optional[Dict[str, Any]]:
     """Get full details of a specific product."""
+    cached = get_row("products", product_id)
+    if cached is not None and cached.get("trader_id") == trader_id:
+        return cached
+    
     supabase = get_supabase()
     
     response = supabase.table("products") \
@@ -111,24 +131,15 @@ def get_product_details(trader_id: str, product_id: str) -> Optional[Dict[str, A
         .execute()
         
     if response.data:
+        remember("products", product_id, response.data[0])
         return response.data[0]
     return None
 
-def get_products_by_category(trader_id: str, category: str) -> List[Dict[str, Any]]:
+def get_products_by_category(trader_id: str, category: str, limit: int = MAX_PRODUCTS_PER_PAGE) -> List[Dict[str, Any]]:
     """Filter products by category."""
     if category not in ALLOWED_CATEGORIES:
         return []
-        
-    supabase = get_supabase()
-    response = supabase.table("products") \
-        .select("*") \
-        .eq("trader_id", trader_id) \
-        .eq("is_active", True) \
-        .eq("category", category) \
-        .order("stock_quantity", desc=True) \
-        .execute()
-        
-    return response.data
+    return browse_products(trader_id, category=category, limit=limit)["products"]
 
 def check_product_availability(product_id: str, trader_id: str) -> Dict[str, Any]:
     """Real-time stock check."""
@@ -142,70 +153,128 @@ def check_product_availability(product_id: str, trader_id: str) -> Dict[str, Any
         "product_name": product["name"]
     }
 
-def get_price_range(trader_id: str) -> Dict[str, float]:
-    """Help customers filter by budget."""
-    supabase = get_supabase()
-    
-    # We need aggregations (min, max, avg). Supabase-py doesn't have direct aggregation helper 
-    # in the fluent API easily without RPC or raw SQL usually.
-    # Since we can't easily add RPC, we'll fetch prices and calc in python 
-    # (assuming product count isn't massive logic).
-    # Ideally should use .select('price')
+def _stock_from_search(product_ids: List[str], search_result: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """Stock levels a still-fresh search result already answers."""
+    stock = {}
+    if search_result and time.time() - search_result.get("fetched_at", 0) <= AVAILABILITY_MAX_STALENESS:
+        wanted = set(product_ids)
+        for p in search_result.get("results", []):
+            if p["id"] in wanted:
+                stock[p["id"]] = p["stock_quantity"]
+    return stock
+
+def check_products_availability(trader_id: str, product_ids: List[str], search_result: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """Stock levels for many products at once, as {product_id: stock_quantity}.
     
-    response = supabase.table("products") \
-        .select("price") \
-        .eq("trader_id", trader_id) \
-        .eq("is_active", True) \
-        .execute()
-        
-    prices = [p['price'] for p in response.data if p.get('price') is not None]
+    Products in a search_result fetched within AVAILABILITY_MAX_STALENESS seconds
+    are answered from it; the rest come from a single IN query. Unknown ids map to 0.
+    """
+    stock = _stock_from_search(product_ids, search_result)
+    missing = [pid for pid in product_ids if pid not in stock]
+    if missing:
+        supabase = get_supabase()
+        response = supabase.table("products") \
+            .select("id, stock_quantity") \
+            .eq("trader_id", trader_id) \
+            .in_("id", missing) \
+            .execute()
+        for p in response.data:
+            stock[p["id"]] = p["stock_quantity"]
     
-    if not prices:
-        return {"min_price": 0, "max_price": 0, "average_price": 0}
-        
-    return {
-        "min_price": min(prices),
-        "max_price": max(prices),
-        "average_price": sum(prices) / len(prices)
-    }
+    return {pid: stock.get(pid, 0) for pid in product_ids}
+
+def get_price_range(trader_id: str) -> Dict[str, float]:
+    """Help customers filter by budget."""
+    return get_shop_stats(trader_id).price_range()
 
-def get_products_in_price_range(trader_id: str, min_price: float, max_price: float) -> List[Dict[str, Any]]:
+def get_price_histogram(trader_id: str) -> List[Dict[str, Any]]:
+    """How many active products fall into each price band."""
+    return get_shop_stats(trader_id).price_histogram()
+
+def get_products_in_price_range(trader_id: str, min_price: float, max_price: float, limit: int = MAX_PRODUCTS_PER_PAGE) -> List[Dict[str, Any]]:
     """Find products within budget."""
-    supabase = get_supabase()
-    
-    response = supabase.table("products") \
-        .select("*") \
-        .eq("trader_id", trader_id) \
-        .eq("is_active", True) \
-        .gte("price", min_price) \
-        .lte("price", max_price) \
-        .order("price", desc=False) \
-        .execute()
-        
-    return response.data
+    return browse_products(trader_id, min_price=min_price, max_price=max_price, sort="price_asc", limit=limit)["products"]
 
+@singleflight
 def get_shop_products(trader_id: str, limit: int = 20) -> List[Dict[str, Any]]:
     """Fetch a list of active products for the shop preview."""
-    supabase = get_supabase()
+    return browse_products(trader_id, limit=limit)["products"]
+
+# Columns a product card needs; browse queries never fetch more than this
+CARD_FIELDS = "id, name, price, category, stock_quantity, image_url, description, created_at"
+
+# sort name -> (column, descending)
+BROWSE_SORTS = {
+    "newest": ("created_at", True),
+    "price_asc": ("price", False),
+    "price_desc": ("price", True),
+}
+
+def browse_products(
+    trader_id: str,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: bool = False,
+    sort: str = "newest",
+    limit: int = MAX_PRODUCTS_PER_PAGE,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    """One page of a shop's active products with combinable filters.
     
-    response = supabase.table("products") \
-        .select("*") \
+    Pages are keyset-paginated: pass the returned next_cursor to get the next
+    page (None when there are no more). Raises ValueError for a bad sort,
+    category or cursor.
+    """
+    if sort not in BROWSE_SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(BROWSE_SORTS)}")
+    if category is not None and category not in ALLOWED_CATEGORIES:
+        raise ValueError(f"category must be one of: {', '.join(ALLOWED_CATEGORIES)}")
+    position = decode_cursor(cursor)
+    if position is not None and position.get("sort") != sort:
+        raise ValueError("Cursor belongs to a different sort order")
+    limit = max(1, min(limit, MAX_PRODUCTS_PER_PAGE))
+    column, desc = BROWSE_SORTS[sort]
+    
+    supabase = get_supabase()
+    query = supabase.table("products") \
+        .select(CARD_FIELDS) \
         .eq("trader_id", trader_id) \
-        .eq("is_active", True) \
-        .order("created_at", desc=True) \
-        .limit(limit) \
-        .execute()
-        
-    return response.data
+        .eq("is_active", True)
+    if category:
+        query = query.eq("category", category)
+    if min_price is not None:
+        query = query.gte("price", min_price)
+    if max_price is not None:
+        query = query.lte("price", max_price)
+    if in_stock:
+        query = query.gt("stock_quantity", 0)
+    
+    # One extra row tells us whether there is a next page
+    response = apply_keyset(query, column, desc, position).limit(limit + 1).execute()
+    
+    page = page_result(response.data, limit, column, extra={"sort": sort})
+    return {"products": page["items"], "next_cursor": page["next_cursor"]}
 
-def create_order(trader_id: str, product_id: str, fulfillment_type: str, delivery_details: dict) -> Dict[str, Any]:
-    """Create a new order in the system."""
+def create_order(trader_id: str, product_id: str, fulfillment_type: str, delivery_details: dict, reserve: bool = True) -> Dict[str, Any]:
+    """Create a new order in the system.
+    
+    With reserve=True the order holds one unit of stock until it is paid or the
+    reservation expires. Returns {"error": ...} instead of an order when the
+    product is out of stock.
+    """
     
     # Real Implementation
     supabase = get_supabase()
     
+    # The id is generated here so the stock can be reserved before the insert
+    order_id = str(uuid.uuid4())
+    if reserve and not reserve_stock(order_id, trader_id, product_id):
+        return {"error": "Out of stock"}
+    
     # Insert new order
     order_data = {
+        "id": order_id,
         "trader_id": trader_id,
         "product_id": product_id,
         "amount": 5000, # In real app, fetch price from product_id
@@ -220,23 +289,54 @@ def create_order(trader_id: str, product_id: str, fulfillment_type: str, deliver
     prod = get_product_details(trader_id, product_id)
     if prod:
         order_data["amount"] = prod["price"]
+    if reserve:
+        # The reservation changed stock_quantity; don't serve the old row again
+        forget("products", product_id)
     
-    response = supabase.table("orders").insert(order_data).execute()
+    try:
+        response = supabase.table("orders").insert(order_data).execute()
+    except Exception:
+        if reserve:
+            release_reservation(order_id)
+        raise
     
     if response.data:
+        publish("orders", trader_id, response.data)
         return response.data[0]
     
+    if reserve:
+        release_reservation(order_id)
     raise Exception("Failed to create order")
 
+def _flutterwave_headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {FLUTTERWAVE_SECRET_KEY}",
+        "Content-Type": "application/json"
+    }
+
+def _payment_payload(order_id: str, amount: float) -> Dict[str, Any]:
+    return {
+        "tx_ref": f"sharpshop_{order_id}",
+        "amount": str(amount),
+        "currency": "NGN",
+        "redirect_url": f"https://sharpshop.app/pay/callback?order_id={order_id}", # Restore Production URL or use handling endpoint
+        "customer": {
+            "email": "customer@sharpshop.app", 
+            "phonenumber": "08000000000",
+            "name": "SharpShop Customer"
+        },
+        "customizations": {
+            "title": "SharpShop Payment",
+            "description": f"Payment for Order {order_id}"
+        }
+    }
+
 def create_payment_link(order_id: str) -> str:
     """Generate a payment link via Flutterwave API."""
     
     # Real Implementation
     url = f"{FLUTTERWAVE_BASE_URL}/payments"
-    headers = {
-        "Authorization": f"Bearer {FLUTTERWAVE_SECRET_KEY}",
-        "Content-Type": "application/json"
-    }
+    headers = _flutterwave_headers()
     
     # Need user details for Flutterwave... 
     # For V1 we might use a generic email or request it? 
@@ -251,21 +351,7 @@ def create_payment_link(order_id: str) -> str:
     else:
          amount = order_resp.data[0]["amount"]
     
-    payload = {
-        "tx_ref": f"sharpshop_{order_id}",
-        "amount": str(amount),
-        "currency": "NGN",
-        "redirect_url": f"https://sharpshop.app/pay/callback?order_id={order_id}", # Restore Production URL or use handling endpoint
-        "customer": {
-            "email": "customer@sharpshop.app", 
-            "phonenumber": "08000000000",
-            "name": "SharpShop Customer"
-        },
-        "customizations": {
-            "title": "SharpShop Payment",
-            "description": f"Payment for Order {order_id}"
-        }
-    }
+    payload = _payment_payload(order_id, amount)
     
     try:
         response = requests.post(url, json=payload, headers=headers)
@@ -287,16 +373,15 @@ def check_order_status(order_id: str) -> str:
     # Let's verify with Flutterwave using tx_ref
     
     url = f"{FLUTTERWAVE_BASE_URL}/transactions/verify_by_reference?tx_ref=sharpshop_{order_id}"
-    headers = {
-        "Authorization": f"Bearer {FLUTTERWAVE_SECRET_KEY}",
-        "Content-Type": "application/json"
-    }
+    headers = _flutterwave_headers()
     
     try:
         response = requests.get(url, headers=headers)
         data = response.json()
         
         if data.get("status") == "success" and data["data"]["status"] == "successful":
+            # Payment confirmed: the held stock is now sold
+            commit_reservation(order_id)
             return "paid"
         else:
             return "pending" # Or failed
@@ -0,0 +1,199 @@
+"""Async customer tools for the asyncio chat pipeline.
+
+Mirrors the customer_tools functions the chat agent calls. Supabase and
+Flutterwave requests are awaited on the event loop (async Supabase client,
+httpx) instead of each holding a threadpool thread. Reads served from the
+in-memory indexes and aggregates (search, shop stats, recommendations) reuse
+the sync implementations on the DB executor, since they only touch the
+database when an index is cold.
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+import executors
+from change_feed import publish
+from customer_config import FLUTTERWAVE_BASE_URL, MAX_SEARCH_RESULTS
+from customer_tools import (
+    search_shop_products as _search_shop_products,
+    _stock_from_search, _flutterwave_headers, _payment_payload, notify_seller,
+)
+from database import get_async_supabase
+from identity_map import get_row, remember, forget
+from reservations import reserve_stock_async, release_reservation_async, commit_reservation_async
+from shop_stats import get_shop_stats
+from singleflight import do_async
+
+FLUTTERWAVE_TIMEOUT = 15
+
+_http: Optional[httpx.AsyncClient] = None
+
+
+def _http_client() -> httpx.AsyncClient:
+    """One pooled HTTP client for all payment calls."""
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(timeout=FLUTTERWAVE_TIMEOUT)
+    return _http
+
+
+async def get_shop_info(trader_id: str) -> Optional[Dict[str, Any]]:
+    """Retrieve trader profile information."""
+    return await do_async(("get_shop_info", trader_id), _get_shop_info, trader_id)
+
+
+async def _get_shop_info(trader_id: str) -> Optional[Dict[str, Any]]:
+    supabase = await get_async_supabase()
+    response = await supabase.table("traders").select("*").eq("id", trader_id).execute()
+    if not response.data:
+        return None
+
+    trader = response.data[0]
+    remember("traders", trader_id, trader)
+    stats = await executors.db.run(get_shop_stats, trader_id)
+
+    return {
+        "business_name": trader.get("business_name"),
+        "whatsapp_number": trader.get("whatsapp_number"),
+        "address": trader.get("address"),
+        "bio": trader.get("bio"),
+        "product_count": stats.active_count
+    }
+
+
+async def search_shop_products(trader_id: str, query: str, limit: int = MAX_SEARCH_RESULTS) -> Dict[str, Any]:
+    """Search products by keyword within a shop, most relevant first."""
+    return await executors.db.run(_search_shop_products, trader_id, query, limit)
+
+
+async def get_product_details(trader_id: str, product_id: str) -> Optional[Dict[str, Any]]:
+    """Get full details of a specific product."""
+    cached = get_row("products", product_id)
+    if cached is not None and cached.get("trader_id") == trader_id:
+        return cached
+
+    supabase = await get_async_supabase()
+    response = await supabase.table("products") \
+        .select("*") \
+        .eq("id", product_id) \
+        .eq("trader_id", trader_id) \
+        .execute()
+
+    if response.data:
+        remember("products", product_id, response.data[0])
+        return response.data[0]
+    return None
+
+
+async def check_product_availability(product_id: str, trader_id: str) -> Dict[str, Any]:
+    """Real-time stock check."""
+    product = await get_product_details(trader_id, product_id)
+    if not product:
+        return {"available": False, "stock_quantity": 0, "product_name": "Unknown"}
+
+    return {
+        "available": product["stock_quantity"] > 0,
+        "stock_quantity": product["stock_quantity"],
+        "product_name": product["name"]
+    }
+
+
+async def check_products_availability(trader_id: str, product_ids: List[str], search_result: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """Stock levels for many products at once, as {product_id: stock_quantity}."""
+    stock = _stock_from_search(product_ids, search_result)
+    missing = [pid for pid in product_ids if pid not in stock]
+    if missing:
+        supabase = await get_async_supabase()
+        response = await supabase.table("products") \
+            .select("id, stock_quantity") \
+            .eq("trader_id", trader_id) \
+            .in_("id", missing) \
+            .execute()
+        for p in response.data:
+            stock[p["id"]] = p["stock_quantity"]
+
+    return {pid: stock.get(pid, 0) for pid in product_ids}
+
+
+async def create_order(trader_id: str, product_id: str, fulfillment_type: str, delivery_details: dict, reserve: bool = True) -> Dict[str, Any]:
+    """Create a new order; see customer_tools.create_order."""
+    supabase = await get_async_supabase()
+
+    order_id = str(uuid.uuid4())
+    if reserve and not await reserve_stock_async(order_id, trader_id, product_id):
+        return {"error": "Out of stock"}
+
+    order_data = {
+        "id": order_id,
+        "trader_id": trader_id,
+        "product_id": product_id,
+        "amount": 5000,
+        "currency": "NGN",
+        "fulfillment_type": fulfillment_type,
+        "delivery_details": delivery_details,
+        "status": "pending",
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+
+    prod = await get_product_details(trader_id, product_id)
+    if prod:
+        order_data["amount"] = prod["price"]
+    if reserve:
+        # The reservation changed stock_quantity; don't serve the old row again
+        forget("products", product_id)
+
+    try:
+        response = await supabase.table("orders").insert(order_data).execute()
+    except Exception:
+        if reserve:
+            await release_reservation_async(order_id)
+        raise
+
+    if response.data:
+        publish("orders", trader_id, response.data)
+        return response.data[0]
+
+    if reserve:
+        await release_reservation_async(order_id)
+    raise Exception("Failed to create order")
+
+
+async def create_payment_link(order_id: str) -> str:
+    """Generate a payment link via Flutterwave API."""
+    supabase = await get_async_supabase()
+    order_resp = await supabase.table("orders").select("amount").eq("id", order_id).execute()
+    amount = order_resp.data[0]["amount"] if order_resp.data else 5000
+
+    try:
+        response = await _http_client().post(
+            f"{FLUTTERWAVE_BASE_URL}/payments",
+            json=_payment_payload(order_id, amount),
+            headers=_flutterwave_headers(),
+        )
+        data = response.json()
+        if data.get("status") == "success":
+            return data["data"]["link"]
+        print(f"Flutterwave Error: {data}")
+        return "Error generating link"
+    except Exception as e:
+        print(f"Payment Link Error: {e}")
+        return "Error connecting to payment gateway"
+
+
+async def check_order_status(order_id: str) -> str:
+    """Verify an order's payment with Flutterwave."""
+    url = f"{FLUTTERWAVE_BASE_URL}/transactions/verify_by_reference?tx_ref=sharpshop_{order_id}"
+    try:
+        response = await _http_client().get(url, headers=_flutterwave_headers())
+        data = response.json()
+        if data.get("status") == "success" and data["data"]["status"] == "successful":
+            # Payment confirmed: the held stock is now sold
+            await commit_reservation_async(order_id)
+            return "paid"
+        return "pending"
+    except Exception as e:
+        print(f"Verify Error: {e}")
+        return "error"
+
@@ -1,13 +1,24 @@
 """Supabase database operations."""
-from supabase import create_client, Client
+from supabase import create_client, acreate_client, Client, AsyncClient
 from config import SUPABASE_URL, SUPABASE_KEY
 from typing import Optional
+from singleflight import singleflight
 import uuid
 
 def get_supabase() -> Client:
     """Get Supabase client."""
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
+_async_client: Optional[AsyncClient] = None
+
+async def get_async_supabase() -> AsyncClient:
+    """Shared async Supabase client for the asyncio customer pipeline."""
+    global _async_client
+    if _async_client is None:
+        _async_client = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+    return _async_client
+
+@singleflight
 def get_trader_by_whatsapp(whatsapp_number: str) -> Optional[dict]:
     """Get existing trader by WhatsApp number. Returns None if not found."""
     supabase = get_supabase()
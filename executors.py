@@ -0,0 +1,121 @@
+"""Bounded thread pools per kind of blocking work.
+
+Blocking calls used to share Starlette's default threadpool, so a burst of
+slow LLM turns could hold every thread while quick product reads waited
+behind them. Each I/O class now has its own pool:
+
+    llm  - agent turns (Groq calls)
+    db   - Supabase reads and small writes
+    io   - storage uploads, catalog imports, checkout/payment writes
+
+A pool runs at most `workers` calls and queues at most `max_queue` more.
+Beyond that, run() raises Overloaded, which the server turns into a 503, so
+a saturated class sheds its own load instead of slowing the others.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from customer_config import (
+    EXECUTOR_LLM_WORKERS, EXECUTOR_LLM_QUEUE,
+    EXECUTOR_DB_WORKERS, EXECUTOR_DB_QUEUE,
+    EXECUTOR_IO_WORKERS, EXECUTOR_IO_QUEUE,
+)
+
+
+class Overloaded(Exception):
+    """A pool's queue is full; the request should be retried later."""
+
+    def __init__(self, pool: str):
+        super().__init__(f"{pool} executor queue is full")
+        self.pool = pool
+
+
+class BoundedExecutor:
+    """A thread pool with a queue limit and wait-time metrics."""
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._pending = 0  # submitted and not finished: active + queued
+        self._active = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def run(self, fn: Callable, *args, shed: bool = True, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool.
+
+        Raises Overloaded if the queue is full, unless shed=False (for
+        background jobs, which should wait rather than be dropped).
+        """
+        with self._lock:
+            if shed and self._pending >= self.workers + self.max_queue:
+                self._rejected += 1
+                raise Overloaded(self.name)
+            self._pending += 1
+
+        submitted = time.perf_counter()
+        # Carry contextvars (e.g. the identity map scope) into the worker thread
+        context = contextvars.copy_context()
+
+        def call():
+            waited = time.perf_counter() - submitted
+            with self._lock:
+                self._active += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            try:
+                return context.run(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._pending -= 1
+                    self._completed += 1
+
+        try:
+            future = self._pool.submit(call)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        # A caller cancelled while still queued cancels the future, so call() never runs
+        future.add_done_callback(self._release_if_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def _release_if_cancelled(self, future) -> None:
+        if future.cancelled():
+            with self._lock:
+                self._pending -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            started = self._completed + self._active
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queued": self._pending - self._active,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._wait_total / started * 1000, 2) if started else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 2),
+            }
+
+
+llm = BoundedExecutor("llm", EXECUTOR_LLM_WORKERS, EXECUTOR_LLM_QUEUE)
+db = BoundedExecutor("db", EXECUTOR_DB_WORKERS, EXECUTOR_DB_QUEUE)
+io = BoundedExecutor("io", EXECUTOR_IO_WORKERS, EXECUTOR_IO_QUEUE)
+
+POOLS = {pool.name: pool for pool in (llm, db, io)}
+
+
+def get_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: pool.get_stats() for name, pool in POOLS.items()}
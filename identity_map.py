@@ -0,0 +1,90 @@
+"""Request-scoped identity map for customer-side DB reads.
+
+Within one chat turn (or one HTTP request) the same product is often read
+several times: search, then availability check, then order creation. Rows
+fetched inside a request_scope() are remembered by (table, id) and served
+from memory on the next read, so each row costs one DB call per request.
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+_current: contextvars.ContextVar[Optional["IdentityMap"]] = contextvars.ContextVar("identity_map", default=None)
+
+# Process-wide totals across all scopes
+_stats = {"scopes": 0, "hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+class IdentityMap:
+    """Rows keyed by (table, id) for the lifetime of one request."""
+
+    def __init__(self):
+        self._rows: Dict[tuple, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, table: str, key: str) -> Optional[Dict[str, Any]]:
+        row = self._rows.get((table, key))
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row
+
+    def put(self, table: str, key: str, row: Dict[str, Any]) -> None:
+        self._rows[(table, key)] = row
+
+    def forget(self, table: str, key: str) -> None:
+        self._rows.pop((table, key), None)
+
+
+@contextmanager
+def request_scope():
+    """Share one identity map between all customer_tools reads in this block.
+
+    Nested scopes reuse the outer map.
+    """
+    existing = _current.get()
+    if existing is not None:
+        yield existing
+        return
+
+    identity_map = IdentityMap()
+    token = _current.set(identity_map)
+    try:
+        yield identity_map
+    finally:
+        _current.reset(token)
+        with _stats_lock:
+            _stats["scopes"] += 1
+            _stats["hits"] += identity_map.hits
+            _stats["misses"] += identity_map.misses
+
+
+def get_row(table: str, key: str) -> Optional[Dict[str, Any]]:
+    """Row from the current request's map, or None (also outside any scope)."""
+    identity_map = _current.get()
+    if identity_map is None:
+        return None
+    return identity_map.get(table, key)
+
+
+def remember(table: str, key: str, row: Dict[str, Any]) -> None:
+    identity_map = _current.get()
+    if identity_map is not None:
+        identity_map.put(table, key, row)
+
+
+def forget(table: str, key: str) -> None:
+    """Drop a row this request has just changed, so the next read refetches it."""
+    identity_map = _current.get()
+    if identity_map is not None:
+        identity_map.forget(table, key)
+
+
+def get_stats() -> Dict[str, int]:
+    """Totals so far; "hits" is the number of DB calls saved."""
+    with _stats_lock:
+        return {**_stats, "saved_calls": _stats["hits"]}
@@ -0,0 +1,245 @@
+"""Deterministic extractor for common WhatsApp product listing formats.
+
+Most sellers post listings that follow a handful of templates, e.g.
+"Nike sneakers, 25000 naira, 10 in stock, fashion" or
+"this shoe na 5k, I get 10 for hand, condition good". When every required
+field can be read off the message confidently we can build the
+create_product action without asking the LLM.
+"""
+import re
+
+from config import ALLOWED_CATEGORIES
+
+REQUIRED_FIELDS = ["name", "price", "category", "stock"]
+
+
+def normalize_naira_price(value) -> int | None:
+    """Normalize common Nigerian WhatsApp price formats into integer Naira.
+
+    Examples:
+    - "5k", "5 K" -> 5000
+    - "₦12k" -> 12000
+    - "250" (no currency, < 1000) -> 250000
+    - "15000" -> 15000
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        n = int(value)
+        return n if n > 0 else None
+
+    s = str(value).strip().lower()
+    s = s.replace("₦", "").replace(",", "").strip()
+
+    # 5k / 5.5k / 5 k
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*k", s)
+    if m:
+        return max(1, int(float(m.group(1)) * 1000))
+
+    # plain number
+    m = re.fullmatch(r"\d+(?:\.\d+)?", s)
+    if m:
+        n = int(float(s))
+        if n <= 0:
+            return None
+        # Common Naija shorthand: "250" means 250k
+        return n * 1000 if n < 1000 else n
+
+    return None
+
+
+# Keyword lexicon used to infer a category from the product name.
+# Keys must be members of ALLOWED_CATEGORIES.
+CATEGORY_KEYWORDS = {
+    "Footwear": [
+        "shoe", "shoes", "sneaker", "sneakers", "slipper", "slippers", "sandal", "sandals",
+        "heel", "heels", "boot", "boots", "loafer", "loafers", "slides", "crocs", "canvas",
+        "nike", "adidas", "puma", "vans", "converse", "jordan", "jordans",
+    ],
+    "Electronics": [
+        "iphone", "samsung", "infinix", "tecno", "itel", "phone", "laptop", "earpod", "earpods",
+        "airpod", "airpods", "charger", "powerbank", "headphone", "headphones", "speaker",
+        "mouse", "keyboard", "tablet", "ipad", "tv", "esp32", "arduino",
+    ],
+    "Fashion": [
+        "jeans", "shirt", "shirts", "top", "tops", "gown", "dress", "trouser", "trousers",
+        "skirt", "jacket", "hoodie", "agbada", "ankara", "kaftan", "senator", "wig", "hair",
+    ],
+    "Accessories": [
+        "bag", "bags", "watch", "watches", "belt", "cap", "sunglasses", "glasses", "wallet",
+        "necklace", "bracelet", "earring", "earrings", "ring", "perfume", "jewelry",
+    ],
+    "Home & Living": [
+        "chair", "table", "bed", "pillow", "curtain", "rug", "blender", "pot", "pots",
+        "plate", "plates", "kettle", "fan", "mattress", "bedsheet", "duvet",
+    ],
+}
+
+_CATEGORY_BY_KEYWORD = {
+    kw: category
+    for category, keywords in CATEGORY_KEYWORDS.items() if category in ALLOWED_CATEGORIES
+    for kw in keywords
+}
+
+# Messages that look like searches/updates/listing requests are never listings.
+_NON_LISTING = re.compile(
+    r"\b(how many|remain|check|search|find|show|list|increase|reduce|decrease|raise|"
+    r"change|update|set|edit|delete|remove|my products)\b|\?",
+    re.IGNORECASE,
+)
+
+_STOCK_PATTERNS = [
+    re.compile(r"\bi\s+(?:get|have|got)\s+(\d+)(?:\s+(?:pcs|pieces|units))?(?:\s+for\s+hand)?\b", re.IGNORECASE),
+    re.compile(r"\b(\d+)\s*(?:pcs|pc|pieces|units|qty)\b", re.IGNORECASE),
+    re.compile(r"\b(\d+)\s+(?:in\s+stock|for\s+hand|dey|left|available|remain(?:ing)?)\b", re.IGNORECASE),
+    re.compile(r"\b(?:stock|qty|quantity)\s*[:=\-]?\s*(\d+)\b", re.IGNORECASE),
+]
+
+# Prices with an explicit marker: currency symbol/word or the "k" suffix
+_PRICE_MARKED = re.compile(
+    r"(?:₦\s*(\d[\d,]*(?:\.\d+)?\s*k?)\b"
+    r"|\b(\d[\d,]*(?:\.\d+)?\s*k)\b"
+    r"|\b(\d[\d,]*(?:\.\d+)?)\s*(?:naira|ngn)\b)",
+    re.IGNORECASE,
+)
+# Bare numbers introduced by a price word ("na 5000", "for 15000", "price: 250")
+# or standing alone between commas ("Gucci bag, 45000, 2 in stock")
+_PRICE_INTRODUCED = re.compile(
+    r"\b(?:na|for|price|at|@)\s*[:=]?\s*(\d[\d,]*(?:\.\d+)?)\b(?!\s*(?:pcs|pc|pieces|units|in\s+stock|for\s+hand))"
+    r"|(?:^|[,\n]|\s-)\s*(\d{1,3}(?:,\d{3})+|\d+)\s*(?=[,\n]|\s-|$)",
+    re.IGNORECASE,
+)
+
+_CONDITION = re.compile(
+    r"\b(brand\s+new|new|fairly\s+used|used|like\s+new|condition\s+\w+|\w+\s+condition|e\s+clean|clean|uk\s+used)\b",
+    re.IGNORECASE,
+)
+_LEADING_FILLER = re.compile(
+    r"^(?:please\s+)?(?:add|list|post|upload|new\s+product|i\s+wan\s+sell|i\s+want\s+to\s+sell|"
+    r"selling|sell|this|dis|the)\b[\s:,-]*",
+    re.IGNORECASE,
+)
+_CATEGORY_MENTION = re.compile(
+    r"\b(?:category\s*[:=\-]?\s*)?(" + "|".join(re.escape(c) for c in ALLOWED_CATEGORIES) + r")(?:\s+category)?\b",
+    re.IGNORECASE,
+)
+
+
+def _find_stock(text: str) -> tuple[int | None, list[tuple[int, int]]]:
+    """Return (stock, spans). Stock is None if absent or ambiguous."""
+    found = {}
+    for pattern in _STOCK_PATTERNS:
+        for m in pattern.finditer(text):
+            found[m.span()] = int(m.group(1))
+    values = set(found.values())
+    if len(values) != 1:
+        return None, list(found)
+    return values.pop(), list(found)
+
+
+def _find_price(text: str) -> tuple[int | None, list[tuple[int, int]]]:
+    """Return (price, spans). Price is None if absent or if several prices appear."""
+    matches = list(_PRICE_MARKED.finditer(text))
+    if not matches:
+        matches = list(_PRICE_INTRODUCED.finditer(text))
+    values = set()
+    for m in matches:
+        raw = next(g for g in m.groups() if g)
+        price = normalize_naira_price(raw)
+        if price:
+            values.add(price)
+    if len(values) != 1:
+        return None, [m.span() for m in matches]
+    return values.pop(), [m.span() for m in matches]
+
+
+def _count_prices(text: str) -> int:
+    return len(_PRICE_MARKED.findall(text))
+
+
+def _mask(text: str, spans: list[tuple[int, int]]) -> str:
+    """Replace spans with commas so the remaining text splits into segments."""
+    chars = list(text)
+    for start, end in spans:
+        for i in range(start, end):
+            chars[i] = ","
+    return "".join(chars)
+
+
+def _infer_category(text: str) -> str | None:
+    mentioned = {m.group(1).lower() for m in _CATEGORY_MENTION.finditer(text)}
+    explicit = [c for c in ALLOWED_CATEGORIES if c.lower() in mentioned]
+    if len(explicit) == 1:
+        return explicit[0]
+
+    inferred = {
+        _CATEGORY_BY_KEYWORD[word]
+        for word in re.findall(r"[a-z0-9]+", text.lower())
+        if word in _CATEGORY_BY_KEYWORD
+    }
+    if len(inferred) == 1:
+        return inferred.pop()
+    return None
+
+
+def _extract_name(masked: str) -> str | None:
+    """The name is the first remaining segment once prices, stock etc. are masked out."""
+    for segment in re.split(r"[,\n;|]|\s+-\s+", masked):
+        segment = re.sub(r"\b(?:na|for|price|at|@|naira|ngn|size)\s*$", "", segment.strip(), flags=re.IGNORECASE)
+        segment = _LEADING_FILLER.sub("", segment).strip(" .:-")
+        if len(segment) >= 2 and re.search(r"[a-zA-Z]", segment):
+            return segment.capitalize() if segment.islower() else segment
+    return None
+
+
+def parse_listing(message: str) -> dict:
+    """Extract listing fields from a seller message.
+
+    Returns a dict of the fields that were found confidently (a subset of
+    name, price, category, stock and description). Callers should check
+    is_complete_listing() before skipping the LLM.
+    """
+    text = (message or "").strip()
+    if not text or _NON_LISTING.search(text):
+        return {}
+
+    # Several marked prices means several items ("red bag 5k, blue bag 6k");
+    # leave those to the LLM rather than guessing which one is meant.
+    if _count_prices(text) > 1:
+        return {}
+
+    fields = {}
+    spans = []
+
+    stock, stock_spans = _find_stock(text)
+    spans.extend(stock_spans)
+    if stock is not None:
+        fields["stock"] = stock
+
+    # Stock phrases are masked first so "10 for hand" is never read as a price
+    price, price_spans = _find_price(_mask(text, stock_spans))
+    spans.extend(price_spans)
+    if price is not None:
+        fields["price"] = price
+
+    conditions = [m.group(1) for m in _CONDITION.finditer(text)]
+    spans.extend(m.span() for m in _CONDITION.finditer(text))
+    spans.extend(m.span() for m in _CATEGORY_MENTION.finditer(text))
+
+    name = _extract_name(_mask(text, spans))
+    if name:
+        fields["name"] = name
+
+    category = _infer_category(text)
+    if category:
+        fields["category"] = category
+
+    if conditions:
+        condition = re.sub(r"\s*\bcondition\b\s*", "", conditions[0].lower())
+        fields["description"] = f"{name or 'Item'} available. Condition: {condition}"
+
+    return fields
+
+
+def is_complete_listing(fields: dict) -> bool:
+    return all(f in fields for f in REQUIRED_FIELDS)
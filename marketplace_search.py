@@ -0,0 +1,251 @@
+"""Marketplace-wide product search across every shop.
+
+Active products from all traders are indexed in shards, one BM25 index per
+category, so a category-filtered query only scans its own shard. Results
+from the shards are merged, filtered by price and stock, and capped per shop
+so one large seller can't fill the whole page. Seller writes update the
+index as they happen, bulk updates mark the trader for a reload on the next
+search, and a background task rebuilds everything every
+MARKETPLACE_INDEX_TTL seconds to pick up stock changes from orders.
+"""
+import heapq
+import threading
+import time
+from collections import Counter, defaultdict
+from operator import itemgetter
+from typing import Any, Dict, List, Optional
+
+from change_feed import Change, subscribe
+from config import ALLOWED_CATEGORIES
+from customer_config import MARKETPLACE_PER_SHOP_CAP, MAX_PRODUCTS_PER_PAGE
+from database import get_supabase
+from query_normalizer import normalize_query
+from search_index import ProductSearchIndex, load_active_products
+
+UNCATEGORIZED = "Other"
+# Initial per-shard candidate window, as a multiple of the page size
+CANDIDATE_WINDOW_FACTOR = 4
+
+
+def _shard_key(product: Dict[str, Any]) -> str:
+    return product.get("category") or UNCATEGORIZED
+
+
+class MarketplaceIndex:
+    """Category-sharded search index over all active products."""
+
+    def __init__(self, products: List[Dict[str, Any]] = ()):
+        by_category: Dict[str, list] = defaultdict(list)
+        for p in products:
+            if p.get("is_active", True):
+                by_category[_shard_key(p)].append(p)
+        self.shards: Dict[str, ProductSearchIndex] = {
+            category: ProductSearchIndex(rows) for category, rows in by_category.items()
+        }
+        self._shard_of: Dict[str, str] = {}
+        self._by_trader: Dict[str, set] = defaultdict(set)
+        for category, rows in by_category.items():
+            for p in rows:
+                self._shard_of[p["id"]] = category
+                self._by_trader[p["trader_id"]].add(p["id"])
+        self.loaded_at = time.time()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._shard_of)
+
+    def add(self, product: Dict[str, Any]) -> None:
+        """Insert or replace a product, moving it if its category changed."""
+        with self._lock:
+            self._remove(product["id"])
+            if not product.get("is_active", True):
+                return
+            category = _shard_key(product)
+            shard = self.shards.get(category)
+            if shard is None:
+                shard = self.shards[category] = ProductSearchIndex()
+            shard.add(product)
+            self._shard_of[product["id"]] = category
+            self._by_trader[product["trader_id"]].add(product["id"])
+
+    def remove(self, product_id: str) -> None:
+        with self._lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id: str) -> None:
+        category = self._shard_of.pop(product_id, None)
+        if category is None:
+            return
+        product = self.shards[category].products.get(product_id)
+        self.shards[category].remove(product_id)
+        if product is not None:
+            self._by_trader[product["trader_id"]].discard(product_id)
+
+    def replace_trader(self, trader_id: str, products: List[Dict[str, Any]]) -> None:
+        """Swap in a freshly loaded set of one trader's products."""
+        with self._lock:
+            for product_id in list(self._by_trader.pop(trader_id, ())):
+                self._remove(product_id)
+        for p in products:
+            self.add(p)
+
+    def search(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        in_stock: bool = False,
+        limit: int = 20,
+        per_shop_cap: int = MARKETPLACE_PER_SHOP_CAP,
+    ) -> List[Dict[str, Any]]:
+        """Best matching products across shops, at most per_shop_cap from each."""
+        if category is not None:
+            shards = [self.shards[category]] if category in self.shards else []
+        else:
+            shards = list(self.shards.values())
+        scored = [(shard.products, shard.scores(query)) for shard in shards]
+
+        # Broad queries can match most of the catalog, so only the top `window`
+        # matches of each shard are ranked. Anything a shard left out scores at
+        # most its cutoff; once the walk drops below the highest cutoff, the
+        # window is widened and the page rebuilt.
+        window = limit * CANDIDATE_WINDOW_FACTOR
+        while True:
+            candidates = []
+            cutoff = None
+            for products, scores in scored:
+                if len(scores) > window:
+                    top = heapq.nlargest(window, scores.items(), key=itemgetter(1))
+                    cutoff = top[-1][1] if cutoff is None else max(cutoff, top[-1][1])
+                else:
+                    top = scores.items()
+                for pid, score in top:
+                    p = products.get(pid)
+                    if p is not None:
+                        candidates.append((score, p.get("stock_quantity") or 0, pid, p))
+            candidates.sort(key=itemgetter(0, 1), reverse=True)
+
+            results = []
+            per_shop: Counter = Counter()
+            for score, stock, _, p in candidates:
+                if cutoff is not None and score < cutoff:
+                    break
+                price = p.get("price") or 0
+                if min_price is not None and price < min_price:
+                    continue
+                if max_price is not None and price > max_price:
+                    continue
+                if in_stock and stock <= 0:
+                    continue
+                if per_shop[p["trader_id"]] >= per_shop_cap:
+                    continue
+                per_shop[p["trader_id"]] += 1
+                results.append(p)
+                if len(results) >= limit:
+                    return results
+            if cutoff is None:
+                return results
+            window *= 4
+
+
+_index: Optional[MarketplaceIndex] = None
+_dirty_traders: set = set()
+_dirty_lock = threading.Lock()  # change-feed callbacks add traders from other threads
+_build_lock = threading.Lock()
+
+
+def rebuild() -> MarketplaceIndex:
+    """Load every active product and swap in a fresh index."""
+    global _index
+    with _build_lock:
+        index = MarketplaceIndex(load_active_products())
+        _index = index
+    print(f"Marketplace index rebuilt: {len(index)} products in {len(index.shards)} shards")
+    return index
+
+
+def get_marketplace_index() -> MarketplaceIndex:
+    """The current index, built on first use, with pending trader reloads applied."""
+    global _dirty_traders
+    index = _index if _index is not None else rebuild()
+    with _dirty_lock:
+        dirty, _dirty_traders = _dirty_traders, set()
+    while dirty:
+        trader_id = dirty.pop()
+        try:
+            index.replace_trader(trader_id, load_active_products(trader_id))
+        except Exception:
+            # Retried on the next search
+            with _dirty_lock:
+                _dirty_traders |= dirty | {trader_id}
+            raise
+    return index
+
+
+def record_product_write(product: Dict[str, Any]) -> None:
+    """Apply a created/updated product row to the loaded index."""
+    if _index is not None:
+        _index.add(product)
+
+
+def invalidate_trader(trader_id: str) -> None:
+    """Reload a trader's products on the next search (e.g. after a bulk update)."""
+    if _index is not None:
+        with _dirty_lock:
+            _dirty_traders.add(trader_id)
+
+
+def search_marketplace(
+    query: str,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: bool = False,
+    limit: int = 20,
+) -> Dict[str, Any]:
+    """Search all shops. Raises ValueError for an empty query or unknown category."""
+    if not query or not query.strip():
+        raise ValueError("Search query is required")
+    if category is not None and category not in ALLOWED_CATEGORIES:
+        raise ValueError(f"category must be one of: {', '.join(ALLOWED_CATEGORIES)}")
+    limit = max(1, min(limit, MAX_PRODUCTS_PER_PAGE))
+
+    # Lexicon only: the marketplace has no single vocabulary to correct against
+    query = normalize_query(query)
+    products = get_marketplace_index().search(query, category, min_price, max_price, in_stock, limit)
+
+    # Shop names for just this page, in one query
+    shops = {}
+    trader_ids = list({p["trader_id"] for p in products})
+    if trader_ids:
+        response = get_supabase().table("traders") \
+            .select("id, business_name") \
+            .in_("id", trader_ids) \
+            .execute()
+        shops = {t["id"]: t.get("business_name") for t in response.data}
+
+    results = [
+        {
+            "id": p["id"],
+            "trader_id": p["trader_id"],
+            "shop_name": shops.get(p["trader_id"]),
+            "name": p["name"],
+            "price": p["price"],
+            "category": p["category"],
+            "stock_quantity": p["stock_quantity"],
+            "image_url": p.get("image_url", ""),
+        }
+        for p in products
+    ]
+    return {"results": results, "total": len(results)}
+
+def _on_products_changed(change: Change) -> None:
+    if change.rows is None:
+        invalidate_trader(change.trader_id)
+    else:
+        for product in change.rows:
+            record_product_write(product)
+
+
+subscribe("products", _on_products_changed)
@@ -0,0 +1,79 @@
+"""Keyset (cursor) pagination helpers for PostgREST queries.
+
+A cursor records the sort value and id of the last row on a page. The next
+page starts strictly after that (value, id) pair, so pages stay stable while
+rows are inserted and no OFFSET scan is needed.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# Sort columns that aren't text; cursor values are checked against these
+NUMERIC_COLUMNS = {"price", "stock_quantity"}
+TIMESTAMP_COLUMNS = {"created_at", "updated_at"}
+
+
+def encode_cursor(data: Dict[str, Any]) -> str:
+    raw = json.dumps(data, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Decode a cursor; raises ValueError if it is malformed."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(data, dict) or "id" not in data:
+        raise ValueError("Invalid cursor")
+    return data
+
+
+def _filter_value(column: str, value: Any) -> str:
+    """A cursor's sort value, checked against the column type and escaped for a quoted filter."""
+    if column in NUMERIC_COLUMNS:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("Invalid cursor")
+        return str(value)
+    if not isinstance(value, str):
+        raise ValueError("Invalid cursor")
+    if column in TIMESTAMP_COLUMNS:
+        try:
+            datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError("Invalid cursor")
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def apply_keyset(query, column: str, desc: bool, cursor: Optional[Dict[str, Any]]):
+    """Filter and order a query so it returns rows after the cursor position.
+
+    Raises ValueError if the cursor's id isn't a UUID or its value doesn't
+    fit the sort column, since both end up inside the filter string.
+    """
+    if cursor is not None:
+        op = "lt" if desc else "gt"
+        value = _filter_value(column, cursor.get("value"))
+        try:
+            row_id = str(uuid.UUID(str(cursor["id"])))
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        # Quoted so timestamps and decimals survive PostgREST's filter syntax
+        query = query.or_(f'{column}.{op}."{value}",and({column}.eq."{value}",id.{op}.{row_id})')
+    return query.order(column, desc=desc).order("id", desc=desc)
+
+
+def page_result(rows: list, limit: int, column: str, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Trim a limit+1 fetch to one page and build the next cursor."""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor({**(extra or {}), "value": last[column], "id": last["id"]})
+    return {"items": rows, "next_cursor": next_cursor}
@@ -0,0 +1,98 @@
+"""Stale-while-revalidate cache for the shop preview endpoint.
+
+Entries are fresh for PREVIEW_CACHE_TTL seconds. After that they are still
+served (up to PREVIEW_CACHE_STALE_TTL) while a background task refetches
+them. Concurrent misses for the same shop share a single load through
+singleflight. Each entry records the shop's products/traders change-feed
+version it was loaded at; a product or shop change bumps the version, and
+the entry is then treated as missing. Order writes (including the
+speculative ones behind buy links) don't invalidate it; stock held by orders
+shows up at the next refresh, as in the search index.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Dict, Optional, Set
+
+import executors
+from change_feed import get_version
+from customer_config import PREVIEW_CACHE_TTL, PREVIEW_CACHE_STALE_TTL
+from customer_tools import get_shop_info, get_shop_products
+from singleflight import do_async, in_flight
+
+# The change-feed tables the preview payload is built from
+PREVIEW_TABLES = ("products", "traders")
+
+
+class PreviewEntry:
+    __slots__ = ("value", "etag", "last_modified", "fetched_at", "version")
+
+    def __init__(self, value: Dict[str, Any], etag: str, last_modified: float, fetched_at: float, version: int):
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.version = version
+
+
+_entries: Dict[str, PreviewEntry] = {}
+# The loop only holds tasks weakly; background revalidations are kept here until done
+_revalidations: Set[asyncio.Task] = set()
+
+
+def load_shop_preview(trader_id: str) -> Optional[Dict[str, Any]]:
+    """Build the preview payload from the database. None if the shop doesn't exist."""
+    shop_info = get_shop_info(trader_id)
+    if not shop_info:
+        return None
+    return {"shop": shop_info, "products": get_shop_products(trader_id)}
+
+
+def _etag(value: Dict[str, Any]) -> str:
+    digest = hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+async def _load_entry(trader_id: str) -> Optional[PreviewEntry]:
+    # Read before loading: a change during the load leaves the entry already stale
+    version = get_version(trader_id, PREVIEW_TABLES)
+    value = await executors.db.run(load_shop_preview, trader_id)
+    if value is None:
+        return None
+    now = time.time()
+    etag = _etag(value)
+    previous = _entries.get(trader_id)
+    # Last-Modified only moves when the content actually changed
+    last_modified = previous.last_modified if previous and previous.etag == etag else now
+    entry = PreviewEntry(value, etag, last_modified, now, version)
+    _entries[trader_id] = entry
+    return entry
+
+
+async def _load(trader_id: str) -> Optional[PreviewEntry]:
+    """Load a preview, sharing one in-flight load between concurrent callers."""
+    return await do_async(("preview", trader_id), _load_entry, trader_id)
+
+
+async def _revalidate(trader_id: str) -> None:
+    try:
+        await _load(trader_id)
+    except Exception as e:
+        print(f"Preview revalidation error for {trader_id}: {e}")
+
+
+async def get_preview(trader_id: str) -> Optional[PreviewEntry]:
+    """Cached preview for a shop, or None if the shop doesn't exist."""
+    entry = _entries.get(trader_id)
+    if entry is not None and entry.version == get_version(trader_id, PREVIEW_TABLES):
+        age = time.time() - entry.fetched_at
+        if age < PREVIEW_CACHE_TTL:
+            return entry
+        if age < PREVIEW_CACHE_STALE_TTL:
+            if not in_flight(("preview", trader_id)):
+                task = asyncio.create_task(_revalidate(trader_id))
+                _revalidations.add(task)
+                task.add_done_callback(_revalidations.discard)
+            return entry
+    return await _load(trader_id)
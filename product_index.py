@@ -0,0 +1,215 @@
+"""Per-trader fuzzy product name index.
+
+Sellers refer to products with typos and short forms ("adiddas", "iphne").
+This index resolves those references to a single product id in memory:
+character trigrams pick the candidates, edit distance ranks them.
+"""
+import itertools
+import re
+import threading
+from typing import Optional
+
+from change_feed import Change, subscribe
+from database import get_supabase
+
+# A match is accepted without asking the seller when it scores at least
+# this well, clearly beats the runner-up, and has every model number the
+# seller typed ("iphone 12" must not resolve to "iPhone 11").
+CONFIDENT_SCORE = 0.75
+CONFIDENT_MARGIN = 0.1
+MAX_CANDIDATES = 50
+
+_versions = itertools.count(1)
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", (name or "").lower()))
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance, two-row dynamic programming."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb),
+            ))
+        previous = current
+    return previous[-1]
+
+
+def _ratio(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    return 1 - edit_distance(a, b) / max(len(a), len(b))
+
+
+def model_tokens(text: str) -> set[str]:
+    """Words with a digit in them: model numbers, sizes, capacities."""
+    return {word for word in text.split() if any(c.isdigit() for c in word)}
+
+
+def similarity(query: str, name: str) -> float:
+    """Score 0..1 of how well a normalized query refers to a normalized name.
+
+    Besides the whole-string ratio, the query is compared to every window of
+    the name with the same number of words, so "adiddas" still scores high
+    against "adidas black sneakers size 42".
+    """
+    if query == name:
+        return 1.0
+    best = _ratio(query, name)
+    query_words = query.split()
+    name_words = name.split()
+    width = len(query_words)
+    for i in range(len(name_words) - width + 1):
+        best = max(best, _ratio(query, " ".join(name_words[i:i + width])))
+    return best
+
+
+class ProductNameIndex:
+    """In-memory trigram index over one trader's product names."""
+
+    def __init__(self):
+        self._names: dict[str, str] = {}
+        self._normalized: dict[str, str] = {}
+        self._postings: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+        self.version = next(_versions)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def vocabulary(self) -> set[str]:
+        """Words used in product names, for query spelling correction."""
+        with self._lock:
+            return {word for name in self._normalized.values() for word in name.split()}
+
+    def add(self, product_id: str, name: str) -> None:
+        with self._lock:
+            self._remove(product_id)
+            normalized = normalize_name(name)
+            self._names[product_id] = name
+            self._normalized[product_id] = normalized
+            self.version = next(_versions)
+            for gram in trigrams(normalized):
+                self._postings.setdefault(gram, set()).add(product_id)
+
+    def remove(self, product_id: str) -> None:
+        with self._lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id: str) -> None:
+        normalized = self._normalized.pop(product_id, None)
+        self._names.pop(product_id, None)
+        if normalized is None:
+            return
+        self.version = next(_versions)
+        for gram in trigrams(normalized):
+            ids = self._postings.get(gram)
+            if ids:
+                ids.discard(product_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def search(self, query: str, limit: int = 5) -> list[dict]:
+        """Rank products by similarity to query, best first."""
+        normalized = normalize_name(query)
+        if not normalized:
+            return []
+
+        with self._lock:
+            shared: dict[str, int] = {}
+            for gram in trigrams(normalized):
+                for product_id in self._postings.get(gram, ()):
+                    shared[product_id] = shared.get(product_id, 0) + 1
+            candidates = sorted(shared, key=shared.get, reverse=True)[:MAX_CANDIDATES]
+            scored = [
+                {"id": pid, "name": self._names[pid], "score": similarity(normalized, self._normalized[pid])}
+                for pid in candidates
+            ]
+
+        scored.sort(key=lambda m: m["score"], reverse=True)
+        return scored[:limit]
+
+    def resolve(self, query: str) -> Optional[dict]:
+        """Return the single best match if it is confident, else None."""
+        matches = self.search(query, limit=2)
+        if not matches or matches[0]["score"] < CONFIDENT_SCORE:
+            return None
+        if len(matches) > 1 and matches[0]["score"] - matches[1]["score"] < CONFIDENT_MARGIN:
+            return None
+        # A close spelling with a different model number is a different product
+        if not model_tokens(normalize_name(query)) <= set(normalize_name(matches[0]["name"]).split()):
+            return None
+        return matches[0]
+
+
+# trader_id -> index, loaded lazily on first use
+_indexes: dict[str, ProductNameIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(trader_id: str) -> ProductNameIndex:
+    """Get the trader's index, loading product names from Supabase on first use."""
+    index = _indexes.get(trader_id)
+    if index is not None:
+        return index
+
+    with _indexes_lock:
+        index = _indexes.get(trader_id)
+        if index is None:
+            index = ProductNameIndex()
+            supabase = get_supabase()
+            result = supabase.table("products").select("id, name").eq("trader_id", trader_id).execute()
+            for p in result.data:
+                index.add(p["id"], p["name"])
+            _indexes[trader_id] = index
+    return index
+
+
+def record_product(trader_id: str, product_id: str, name: str) -> None:
+    """Keep a loaded index in sync after a product is created or renamed."""
+    index = _indexes.get(trader_id)
+    if index is not None:
+        index.add(product_id, name)
+
+
+def invalidate(trader_id: str) -> None:
+    """Forget a trader's index; it is reloaded on next use."""
+    _indexes.pop(trader_id, None)
+
+
+def resolve_product(trader_id: str, name: str) -> Optional[dict]:
+    """Resolve a seller's product reference to {"id", "name", "score"} or None.
+
+    Raises if the index can't be loaded; callers report that to the seller.
+    """
+    return get_index(trader_id).resolve(name)
+
+
+def suggest_products(trader_id: str, name: str, limit: int = 3) -> list[dict]:
+    """Closest product names for a "did you mean" reply."""
+    return get_index(trader_id).search(name, limit=limit)
+
+
+def _on_products_changed(change: Change) -> None:
+    if change.rows is None:
+        invalidate(change.trader_id)
+        return
+    for product in change.rows:
+        if "name" in product:
+            record_product(change.trader_id, product["id"], product["name"])
+
+
+subscribe("products", _on_products_changed)
@@ -0,0 +1,155 @@
+"""Query normalization ahead of product searches.
+
+Shoppers and sellers write "sneekers", "iphne", "phone charga", "abeg una
+get canvas?". Before a search runs, the query is lowercased, common
+Nigerian-English/pidgin spellings are fixed, filler words are dropped, local
+synonyms are added ("canvas" also searches "sneakers"), and words the shop
+doesn't use are corrected to the nearest word in its own vocabulary by edit
+distance. Normalized forms are kept in an LRU cache keyed by the vocabulary
+version, so a repeated query costs one dict lookup.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+from listing_parser import CATEGORY_KEYWORDS
+from product_index import edit_distance
+from search_index import stem
+
+QUERY_CACHE_SIZE = 5000
+
+# Misspellings and pidgin forms -> the word a listing would use
+SPELLINGS = {
+    "charga": "charger", "chaja": "charger", "chager": "charger",
+    "fone": "phone", "fon": "phone", "phne": "phone",
+    "snikers": "sneakers", "sneekers": "sneakers", "snickers": "sneakers",
+    "trowser": "trouser", "troser": "trouser", "trowsers": "trousers",
+    "lapi": "laptop", "lappy": "laptop", "labtop": "laptop",
+    "sumsung": "samsung", "samsong": "samsung", "techno": "tecno", "infinics": "infinix",
+    "pafum": "perfume", "perfum": "perfume", "parfum": "perfume",
+    "wristwatch": "watch", "wif": "with",
+}
+
+# Local names searched alongside the word the customer typed
+SYNONYMS = {
+    "canvas": ["sneakers"],
+    "palm": ["slippers"],
+    "okrika": ["thrift", "used"],
+    "tokunbo": ["used"],
+    "gown": ["dress"],
+    "earpiece": ["earphones"],
+    "headset": ["headphones"],
+    "airpod": ["earbuds"],
+    "powerbank": ["power", "bank"],
+    "torchlight": ["torch"],
+    "attachment": ["hair", "extensions"],
+}
+
+# Greetings, pidgin particles and request phrasing that never name a product
+FILLER_WORDS = {
+    "abeg", "biko", "pls", "plz", "please", "oga", "madam", "sir", "ma", "o", "oo",
+    "una", "dey", "de", "wey", "na", "abi", "get", "got", "have", "has", "any", "some",
+    "i", "me", "my", "you", "u", "we", "do", "does", "is", "are", "there", "can",
+    "want", "need", "looking", "buy", "sell", "selling", "sale", "with",
+    "a", "an", "the", "this", "that", "for", "of", "in",
+}
+
+# Real product words are never "corrected" into a different shop word: a shop
+# without sneakers should find nothing for "sneakers", not its speakers
+KNOWN_WORDS = (
+    {kw for keywords in CATEGORY_KEYWORDS.values() for kw in keywords}
+    | set(SPELLINGS.values())
+    | set(SYNONYMS)
+    | {word for words in SYNONYMS.values() for word in words}
+)
+
+
+class _LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_cache = _LRUCache(QUERY_CACHE_SIZE)
+
+
+def _max_distance(token: str) -> int:
+    if len(token) <= 3:
+        return 0
+    return 1 if len(token) <= 5 else 2
+
+
+def correct_word(token: str, vocabulary) -> str:
+    """The closest vocabulary word within a length-scaled edit distance, else token."""
+    stemmed = stem(token)
+    if token in vocabulary or stemmed in vocabulary or token in KNOWN_WORDS or token.isdigit():
+        return token
+    limit = _max_distance(token)
+    best, best_key = token, None
+    for word in vocabulary:
+        if abs(len(word) - len(token)) > limit + 1:
+            continue
+        distance = min(edit_distance(token, word), edit_distance(stemmed, word))
+        if distance > limit:
+            continue
+        # Closer first, then a shared first letter (typos rarely hit it)
+        key = (distance, word[0] != token[0], abs(len(word) - len(token)))
+        if best_key is None or key < best_key:
+            best, best_key = word, key
+    return best
+
+
+def _clean(tokens: List[str]) -> List[str]:
+    cleaned = (SPELLINGS.get(token, token) for token in tokens)
+    return [token for token in cleaned if token not in FILLER_WORDS]
+
+
+def normalize_query(query: str, index=None, expand: bool = True) -> str:
+    """Normalize a search query.
+
+    index, if given, is a shop index with vocabulary() and version (the
+    search index or the seller's product name index); unknown words are
+    corrected against its vocabulary. expand=False skips synonyms, for
+    substring (ilike) searches where extra words would stop matches.
+    """
+    key = (type(index).__name__, getattr(index, "version", None), expand, query)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    tokens = _clean(re.findall(r"[a-z0-9]+", (query or "").lower()))
+    if index is not None and tokens:
+        vocabulary = index.vocabulary()
+        tokens = [correct_word(t, vocabulary) for t in tokens]
+    if expand:
+        tokens += [synonym for t in tokens for synonym in SYNONYMS.get(t, ())]
+    # Keep first occurrences only; a query that was all filler stays as typed
+    normalized = " ".join(dict.fromkeys(tokens)) or (query or "").strip().lower()
+
+    _cache.put(key, normalized)
+    return normalized
+
+
+def get_stats() -> Dict[str, int]:
+    return {"hits": _cache.hits, "misses": _cache.misses, "size": len(_cache._data)}
@@ -0,0 +1,165 @@
+"""Precomputed "similar products" for each shop.
+
+A batch job turns every active product's name, category and description into
+a hashed character n-gram TF-IDF vector, then finds each product's top-k
+cosine neighbours within its shop with blocked matrix multiplications. The
+neighbours are kept in memory, so showing alternatives is a dict lookup with
+no LLM or DB call. A free-text query (e.g. a search that found nothing) is
+vectorized the same way and scored against the shop's matrix in one product.
+"""
+import time
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from change_feed import Change, subscribe
+from customer_config import RECOMMENDATIONS_TOP_K
+from search_index import tokenize, load_active_products
+
+VECTOR_DIM = 1024
+NGRAM_SIZE = 3
+FIELD_WEIGHTS = {"name": 2.0, "category": 1.0, "description": 0.5}
+# Rows per matrix multiplication block, bounding the similarity matrix held at once
+BLOCK_SIZE = 512
+MIN_SIMILARITY = 0.15
+
+CARD_KEYS = ("id", "name", "price", "category", "stock_quantity", "image_url")
+
+
+def _hashed_ngrams(text: Optional[str]) -> List[int]:
+    """Vector dimensions of the character n-grams of each word."""
+    dims = []
+    for word in tokenize(text):
+        padded = f" {word} "
+        for i in range(max(1, len(padded) - NGRAM_SIZE + 1)):
+            # crc32 rather than hash() so vectors are stable across processes
+            dims.append(zlib.crc32(padded[i:i + NGRAM_SIZE].encode()) % VECTOR_DIM)
+    return dims
+
+
+def _counts(fields: Dict[str, Optional[str]]) -> np.ndarray:
+    row = np.zeros(VECTOR_DIM, dtype=np.float32)
+    for field, weight in FIELD_WEIGHTS.items():
+        dims = _hashed_ngrams(fields.get(field))
+        if dims:
+            np.add.at(row, dims, weight)
+    return row
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-9)
+
+
+class ShopRecommendations:
+    """Product vectors and precomputed neighbours for one shop."""
+
+    def __init__(self, products: List[Dict[str, Any]], top_k: int = RECOMMENDATIONS_TOP_K):
+        products = [p for p in products if p.get("is_active", True)]
+        self.ids = [p["id"] for p in products]
+        self.cards = {p["id"]: {key: p.get(key) for key in CARD_KEYS} for p in products}
+        self.built_at = time.time()
+
+        counts = np.stack([_counts(p) for p in products]) if products else np.zeros((0, VECTOR_DIM), np.float32)
+        doc_freq = np.count_nonzero(counts, axis=0)
+        self.idf = (np.log((1 + len(products)) / (1 + doc_freq)) + 1).astype(np.float32)
+        self.vectors = _normalize(counts * self.idf)
+        self.neighbours = self._top_neighbours(top_k)
+
+    def _top_neighbours(self, k: int) -> Dict[str, List[tuple]]:
+        n = len(self.ids)
+        k = min(k, n - 1)
+        neighbours: Dict[str, List[tuple]] = {}
+        if k <= 0:
+            return neighbours
+        for start in range(0, n, BLOCK_SIZE):
+            block = self.vectors[start:start + BLOCK_SIZE]
+            sims = block @ self.vectors.T
+            rows = np.arange(len(block))
+            sims[rows, start + rows] = -1.0  # a product isn't its own neighbour
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            top_sims = np.take_along_axis(sims, top, axis=1)
+            order = np.argsort(-top_sims, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_sims = np.take_along_axis(top_sims, order, axis=1)
+            for row in rows:
+                neighbours[self.ids[start + row]] = [
+                    (self.ids[j], float(s)) for j, s in zip(top[row], top_sims[row]) if s >= MIN_SIMILARITY
+                ]
+        return neighbours
+
+    def similar(self, product_id: str, limit: int = RECOMMENDATIONS_TOP_K) -> List[Dict[str, Any]]:
+        """Precomputed neighbours of a product, most similar first."""
+        return [
+            self.cards[pid] for pid, _ in self.neighbours.get(product_id, [])
+            if pid in self.cards
+        ][:limit]
+
+    def match_query(self, query: str, limit: int = RECOMMENDATIONS_TOP_K) -> List[Dict[str, Any]]:
+        """Products closest to free text, for searches that matched nothing."""
+        if not self.ids:
+            return []
+        vector = _normalize(_counts({"name": query}) * self.idf)
+        sims = self.vectors @ vector
+        top = np.argsort(-sims)[:limit]
+        return [
+            self.cards[self.ids[i]] for i in top
+            if sims[i] >= MIN_SIMILARITY and self.ids[i] in self.cards
+        ]
+
+    def record_product_write(self, product: Dict[str, Any]) -> None:
+        """Keep cards current; new products get neighbours at the next batch run."""
+        if product["id"] not in self.cards:
+            return
+        if not product.get("is_active", True):
+            del self.cards[product["id"]]
+        else:
+            self.cards[product["id"]] = {key: product.get(key) for key in CARD_KEYS}
+
+
+_shops: Dict[str, ShopRecommendations] = {}
+
+
+def build_all() -> int:
+    """Batch job: recompute neighbours for every shop. Returns the number of shops."""
+    by_trader: Dict[str, list] = defaultdict(list)
+    for p in load_active_products():
+        by_trader[p["trader_id"]].append(p)
+    global _shops
+    # Built aside and swapped in whole, so lookups never see a half-built map
+    _shops = {trader_id: ShopRecommendations(rows) for trader_id, rows in by_trader.items()}
+    return len(_shops)
+
+
+def get_shop_recommendations(trader_id: str) -> ShopRecommendations:
+    """A shop's recommendations, built on first use if the batch hasn't covered it."""
+    shop = _shops.get(trader_id)
+    if shop is None:
+        shop = ShopRecommendations(load_active_products(trader_id))
+        _shops[trader_id] = shop
+    return shop
+
+
+def similar_products(trader_id: str, product_id: str, limit: int = RECOMMENDATIONS_TOP_K) -> List[Dict[str, Any]]:
+    return get_shop_recommendations(trader_id).similar(product_id, limit)
+
+
+def suggest_for_query(trader_id: str, query: str, limit: int = RECOMMENDATIONS_TOP_K) -> List[Dict[str, Any]]:
+    return get_shop_recommendations(trader_id).match_query(query, limit)
+
+
+def record_product_write(trader_id: str, product: Dict[str, Any]) -> None:
+    shop = _shops.get(trader_id)
+    if shop is not None:
+        shop.record_product_write(product)
+
+
+def _on_products_changed(change: Change) -> None:
+    # Unknown rows (bulk updates) are picked up by the next batch run
+    for product in change.rows or ():
+        record_product_write(change.trader_id, product)
+
+
+subscribe("products", _on_products_changed)
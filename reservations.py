@@ -0,0 +1,91 @@
+"""Stock reservations that stop concurrent checkouts from overselling.
+
+Creating an order holds its stock with a conditional decrement on the product
+row; the hold is committed when payment is confirmed and released when the
+TTL runs out. The SQL functions live in DB_SETUP_INSTRUCTIONS.txt.
+"""
+from database import get_supabase, get_async_supabase
+from customer_config import RESERVATION_TTL
+
+
+def _reserve_params(order_id: str, trader_id: str, product_id: str, quantity: int) -> dict:
+    return {
+        "p_order_id": order_id,
+        "p_product_id": product_id,
+        "p_trader_id": trader_id,
+        "p_quantity": quantity,
+        "p_ttl_seconds": RESERVATION_TTL,
+    }
+
+
+def reserve_stock(order_id: str, trader_id: str, product_id: str, quantity: int = 1) -> bool:
+    """Atomically take stock for an order. Returns False if not enough is left."""
+    supabase = get_supabase()
+    result = supabase.rpc("reserve_stock", _reserve_params(order_id, trader_id, product_id, quantity)).execute()
+    return bool(result.data)
+
+
+async def reserve_stock_async(order_id: str, trader_id: str, product_id: str, quantity: int = 1) -> bool:
+    supabase = await get_async_supabase()
+    result = await supabase.rpc("reserve_stock", _reserve_params(order_id, trader_id, product_id, quantity)).execute()
+    return bool(result.data)
+
+
+def release_reservation(order_id: str) -> bool:
+    """Give a held reservation's stock back. Returns False if nothing was held."""
+    supabase = get_supabase()
+    try:
+        result = supabase.rpc("release_reservation", {"p_order_id": order_id}).execute()
+        return bool(result.data)
+    except Exception as e:
+        print(f"Release Reservation Error: {e}")
+        return False
+
+
+async def release_reservation_async(order_id: str) -> bool:
+    supabase = await get_async_supabase()
+    try:
+        result = await supabase.rpc("release_reservation", {"p_order_id": order_id}).execute()
+        return bool(result.data)
+    except Exception as e:
+        print(f"Release Reservation Error: {e}")
+        return False
+
+
+def commit_reservation(order_id: str) -> bool:
+    """Make an order's stock deduction permanent once it has been paid.
+
+    Returns False if the hold had expired and the stock has since sold out.
+    """
+    supabase = get_supabase()
+    try:
+        result = supabase.rpc("commit_reservation", {"p_order_id": order_id}).execute()
+        if not result.data:
+            print(f"⚠️ Order {order_id} was paid but the product is out of stock")
+        return bool(result.data)
+    except Exception as e:
+        print(f"Commit Reservation Error: {e}")
+        return False
+
+
+async def commit_reservation_async(order_id: str) -> bool:
+    supabase = await get_async_supabase()
+    try:
+        result = await supabase.rpc("commit_reservation", {"p_order_id": order_id}).execute()
+        if not result.data:
+            print(f"⚠️ Order {order_id} was paid but the product is out of stock")
+        return bool(result.data)
+    except Exception as e:
+        print(f"Commit Reservation Error: {e}")
+        return False
+
+
+def release_expired_reservations() -> int:
+    """Release all holds past their TTL. Returns the number released."""
+    supabase = get_supabase()
+    try:
+        result = supabase.rpc("release_expired_reservations", {}).execute()
+        return result.data or 0
+    except Exception as e:
+        print(f"Reservation Sweep Error: {e}")
+        return 0
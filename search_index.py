@@ -0,0 +1,223 @@
+"""Per-shop BM25 relevance search over product names and descriptions.
+
+Each shop gets an in-memory term index built from its active products.
+Queries are tokenized and matched term by term, scored with BM25F (per-field
+length normalization and boosts, so a name match outweighs a description
+match), and ties are broken by stock. A query term also matches indexed words
+it is part of ("phone" finds "iPhone", "head" finds "Headphones"), as the
+old substring search did, at a discount to a whole-word match. Seller writes update the index
+incrementally; it is also reloaded every SEARCH_INDEX_TTL seconds to pick up
+changes made elsewhere (orders, the web dashboard).
+"""
+import heapq
+import math
+import re
+import threading
+import time
+import itertools
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from change_feed import Change, subscribe
+from customer_config import SEARCH_INDEX_TTL
+from database import get_supabase
+
+FIELD_BOOSTS = {"name": 3.0, "category": 1.5, "description": 1.0}
+K1 = 1.2
+B = 0.75
+LOAD_PAGE_SIZE = 1000
+# Weight of a match inside a longer word, relative to a whole-word match
+PARTIAL_MATCH_WEIGHT = 0.5
+# Shorter query terms only match whole words
+MIN_PARTIAL_LENGTH = 3
+
+# Index versions are unique across shops; a new value means the vocabulary may have changed
+_versions = itertools.count(1)
+
+INDEX_FIELDS = "id, trader_id, name, price, category, stock_quantity, image_url, description, is_active"
+
+
+def stem(token: str) -> str:
+    # Light plural folding so "sneakers" matches "sneaker"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [stem(t) for t in re.findall(r"[a-z0-9]+", (text or "").lower())]
+
+
+class ProductSearchIndex:
+    """Inverted index over a set of products, scored with BM25F.
+
+    Average field lengths are fixed when the index is built, which lets each
+    posting store its final BM25F term weight; a query is then just a sum of
+    idf * weight over the postings of its terms. Incremental adds reuse those
+    averages until the next rebuild.
+    """
+
+    def __init__(self, products: Iterable[Dict[str, Any]] = ()):
+        self.products: Dict[str, Dict[str, Any]] = {}
+        self._postings: Dict[str, Dict[str, float]] = {}  # term -> product_id -> weight
+        self._doc_terms: Dict[str, tuple] = {}
+        self.version = next(_versions)
+        self.loaded_at = time.time()
+        self._lock = threading.Lock()
+
+        docs = [(p, _field_freqs(p)) for p in products if p.get("is_active", True)]
+        self._avg_lengths = {
+            field: (sum(sum(freqs[field].values()) for _, freqs in docs) / len(docs) if docs else 0) or 1
+            for field in FIELD_BOOSTS
+        }
+        for product, freqs in docs:
+            self._insert(product, freqs)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def vocabulary(self) -> set:
+        return set(self._postings)
+
+    def add(self, product: Dict[str, Any]) -> None:
+        """Insert or replace a product; inactive products are removed."""
+        with self._lock:
+            self._remove(product["id"])
+            if product.get("is_active", True):
+                self._insert(product, _field_freqs(product))
+
+    def remove(self, product_id: str) -> None:
+        with self._lock:
+            self._remove(product_id)
+
+    def _insert(self, product: Dict[str, Any], freqs: Dict[str, Counter]) -> None:
+        pid = product["id"]
+        # Per-field length normalization, combined with the field boosts
+        norms = {
+            field: boost / (1 - B + B * sum(freqs[field].values()) / self._avg_lengths[field])
+            for field, boost in FIELD_BOOSTS.items()
+        }
+        terms = set().union(*freqs.values())
+        for term in terms:
+            tf = sum(freqs[field][term] * norms[field] for field in FIELD_BOOSTS if freqs[field][term])
+            self._postings.setdefault(term, {})[pid] = tf * (K1 + 1) / (tf + K1)
+        self.products[pid] = product
+        self._doc_terms[pid] = tuple(terms)
+        self.version = next(_versions)
+
+    def _remove(self, product_id: str) -> None:
+        terms = self._doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        self.products.pop(product_id, None)
+        self.version = next(_versions)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def _matching_terms(self, terms: set) -> List[tuple]:
+        """(indexed term, weight factor) for each query term and the longer words containing it."""
+        matched = [(t, 1.0) for t in terms if t in self._postings]
+        partial = [t for t in terms if len(t) >= MIN_PARTIAL_LENGTH]
+        if partial:
+            for indexed in self._postings:
+                if indexed not in terms and any(t in indexed for t in partial):
+                    matched.append((indexed, PARTIAL_MATCH_WEIGHT))
+        return matched
+
+    def scores(self, query: str) -> Dict[str, float]:
+        """BM25F score of every product matching at least one query term."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self.products)
+            matched = [(self._postings[t], factor) for t, factor in self._matching_terms(terms)]
+            # The longest posting list seeds the dict in one pass; the rest add to it
+            matched.sort(key=lambda m: len(m[0]), reverse=True)
+            scores: Dict[str, float] = {}
+            for i, (postings, factor) in enumerate(matched):
+                idf = factor * math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                if i == 0:
+                    scores = {pid: idf * weight for pid, weight in postings.items()}
+                    continue
+                for pid, weight in postings.items():
+                    scores[pid] = scores.get(pid, 0.0) + idf * weight
+        return scores
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Products ranked by relevance to query, best first; stock breaks ties."""
+        scores = self.scores(query)
+        products = self.products
+        ranked = heapq.nlargest(
+            limit, scores,
+            key=lambda pid: (scores[pid], products.get(pid, {}).get("stock_quantity") or 0),
+        )
+        # A product removed mid-search is simply dropped
+        return [products[pid] for pid in ranked if pid in products]
+
+
+def _field_freqs(product: Dict[str, Any]) -> Dict[str, Counter]:
+    return {field: Counter(tokenize(product.get(field))) for field in FIELD_BOOSTS}
+
+
+_indexes: Dict[str, ProductSearchIndex] = {}
+_load_lock = threading.Lock()
+
+
+def load_active_products(trader_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """All active products (of one trader, or of every trader), fetched in pages."""
+    supabase = get_supabase()
+    products = []
+    start = 0
+    while True:
+        query = supabase.table("products").select(INDEX_FIELDS).eq("is_active", True)
+        if trader_id is not None:
+            query = query.eq("trader_id", trader_id)
+        response = query.order("id").range(start, start + LOAD_PAGE_SIZE - 1).execute()
+        products.extend(response.data)
+        if len(response.data) < LOAD_PAGE_SIZE:
+            break
+        start += LOAD_PAGE_SIZE
+    return products
+
+
+def build_index(trader_id: str) -> ProductSearchIndex:
+    """Load a shop's active products from Supabase into a fresh index."""
+    return ProductSearchIndex(load_active_products(trader_id))
+
+
+def get_shop_index(trader_id: str) -> ProductSearchIndex:
+    """A shop's index, (re)built when missing or older than SEARCH_INDEX_TTL."""
+    index = _indexes.get(trader_id)
+    if index is not None and time.time() - index.loaded_at < SEARCH_INDEX_TTL:
+        return index
+    with _load_lock:
+        index = _indexes.get(trader_id)
+        if index is None or time.time() - index.loaded_at >= SEARCH_INDEX_TTL:
+            index = build_index(trader_id)
+            _indexes[trader_id] = index
+    return index
+
+
+def record_product_write(trader_id: str, product: Dict[str, Any]) -> None:
+    """Apply a created/updated product row to a loaded shop index."""
+    index = _indexes.get(trader_id)
+    if index is not None:
+        index.add(product)
+
+
+def invalidate(trader_id: str) -> None:
+    """Forget a shop's index; it is rebuilt on the next search."""
+    _indexes.pop(trader_id, None)
+
+def _on_products_changed(change: Change) -> None:
+    if change.rows is None:
+        invalidate(change.trader_id)
+    else:
+        for product in change.rows:
+            record_product_write(change.trader_id, product)
+
+
+subscribe("products", _on_products_changed)
@@ -5,6 +5,8 @@ from twilio.twiml.messaging_response import MessagingResponse
 from agent import create_initial_state, chat
 from database import get_trader_by_whatsapp
 from storage import process_images
+from catalog_import import is_spreadsheet, import_catalog, format_import_summary
+import executors
 import uvicorn
 import logging
 import os
@@ -49,13 +51,19 @@ async def whatsapp_webhook(request: Request):
     incoming_msg = form_data.get('Body', '').strip()
     sender_id = form_data.get('From', '')
     
-    # Check for media (images)
+    # Check for media (images and catalog spreadsheets)
     num_media = int(form_data.get('NumMedia', 0))
     twilio_image_urls = []
+    spreadsheets = []
     if num_media > 0:
         for i in range(num_media):
             media_url = form_data.get(f'MediaUrl{i}')
-            if media_url:
+            content_type = form_data.get(f'MediaContentType{i}', '')
+            if not media_url:
+                continue
+            if is_spreadsheet(content_type):
+                spreadsheets.append((media_url, content_type))
+            else:
                 twilio_image_urls.append(media_url)
     
     logging.info(f"Received message from {sender_id}: {incoming_msg}")
@@ -64,7 +72,7 @@ async def whatsapp_webhook(request: Request):
     whatsapp_number = sender_id.replace('whatsapp:', '')
     
     # Check if this is a registered seller
-    trader = get_trader_by_whatsapp(whatsapp_number)
+    trader = await executors.db.run(get_trader_by_whatsapp, whatsapp_number)
     
     if trader is None:
         # Not a registered seller - send rejection message
@@ -73,11 +81,26 @@ async def whatsapp_webhook(request: Request):
         resp.message("⚠️ Sorry, this WhatsApp number is not registered as a seller on SharpShop.\n\nTo upload products, please register as a seller at https://sharpshop.app first using this same WhatsApp number.")
         return Response(content=str(resp), media_type="application/xml")
     
+    # Catalog spreadsheets are imported directly, no agent turn needed
+    if spreadsheets:
+        summaries = []
+        for media_url, content_type in spreadsheets:
+            logging.info(f"Importing catalog ({content_type}) for {whatsapp_number}")
+            try:
+                result = await executors.io.run(import_catalog, media_url, content_type, trader, whatsapp_number)
+                summaries.append(format_import_summary(result))
+            except Exception as e:
+                logging.error(f"Catalog import failed: {e}")
+                summaries.append(f"❌ Couldn't import that file: {e}")
+        resp = MessagingResponse()
+        resp.message("\n\n".join(summaries))
+        return Response(content=str(resp), media_type="application/xml")
+    
     # Process images - download from Twilio and upload to Supabase
     permanent_image_urls = []
     if twilio_image_urls:
         logging.info(f"Processing {len(twilio_image_urls)} images...")
-        permanent_image_urls = process_images(twilio_image_urls)
+        permanent_image_urls = await executors.io.run(process_images, twilio_image_urls)
         logging.info(f"Uploaded {len(permanent_image_urls)} images to Supabase")
 
     # Get or create user state
@@ -86,12 +109,9 @@ async def whatsapp_webhook(request: Request):
     
     state = user_sessions[sender_id]
     
-    # Add image URL to state if provided
-    image_url = permanent_image_urls[0] if permanent_image_urls else None
-    
     # Process message through agent
     try:
-        new_state = chat(state, incoming_msg, image_url)
+        new_state = await executors.llm.run(chat, state, incoming_msg, image_urls=permanent_image_urls)
         user_sessions[sender_id] = new_state
         
         # Get the last assistant message
@@ -115,10 +135,29 @@ async def whatsapp_webhook(request: Request):
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, timezone
-from customer_sessions import create_session, get_session, update_session, cleanup_expired_sessions
+from customer_sessions import (
+    create_session, get_session, update_session, cleanup_expired_sessions, wait_for_messages,
+    memory_report as session_memory_report,
+)
 from customer_agent import handle_customer_chat
-from customer_tools import get_shop_info
-from starlette.concurrency import run_in_threadpool
+from customer_agent_async import handle_customer_chat_async
+from customer_tools import get_shop_info, browse_products
+from customer_config import (
+    RESERVATION_SWEEP_INTERVAL, PREVIEW_CACHE_TTL, PREVIEW_CACHE_STALE_TTL, MAX_PRODUCTS_IN_RESPONSE,
+    MARKETPLACE_INDEX_TTL, RECOMMENDATIONS_INTERVAL, CUSTOMER_PIPELINE,
+    SESSION_SNAPSHOT_ENABLED, SESSION_SNAPSHOT_INTERVAL, HISTORY_LONG_POLL_MAX
+)
+from reservations import release_expired_reservations
+from identity_map import request_scope, get_stats as get_identity_map_stats
+from singleflight import get_stats as get_singleflight_stats
+from preview_cache import get_preview as get_cached_preview
+from marketplace_search import search_marketplace, rebuild as rebuild_marketplace_index
+from recommendations import build_all as build_recommendations, similar_products
+from change_feed import start_realtime_listener
+from session_snapshots import snapshot as snapshot_sessions, restore as restore_sessions, get_stats as get_snapshot_stats
+from fastapi.responses import JSONResponse
+from email.utils import formatdate, parsedate_to_datetime
+import asyncio
 
 class CustomerChatRequest(BaseModel):
     trader_id: str
@@ -139,6 +178,62 @@ class NewSessionResponse(BaseModel):
     trader_name: str
     created_at: str
 
+async def _release_expired_reservations_loop():
+    """Periodically give back stock held by orders that were never paid."""
+    while True:
+        await asyncio.sleep(RESERVATION_SWEEP_INTERVAL)
+        released = await executors.db.run(release_expired_reservations, shed=False)
+        if released:
+            logging.info(f"Released {released} expired stock reservations")
+
+async def _rebuild_marketplace_index_loop():
+    """Build the marketplace search index at startup and refresh it periodically."""
+    while True:
+        try:
+            await executors.db.run(rebuild_marketplace_index, shed=False)
+        except Exception as e:
+            logging.error(f"Marketplace index rebuild failed: {e}")
+        await asyncio.sleep(MARKETPLACE_INDEX_TTL)
+
+async def _build_recommendations_loop():
+    """Recompute similar-product neighbours for every shop periodically."""
+    while True:
+        try:
+            shops = await executors.db.run(build_recommendations, shed=False)
+            logging.info(f"Recommendations rebuilt for {shops} shops")
+        except Exception as e:
+            logging.error(f"Recommendations build failed: {e}")
+        await asyncio.sleep(RECOMMENDATIONS_INTERVAL)
+
+async def _snapshot_sessions_loop():
+    """Append changed sessions to the snapshot log, so a restart can restore them."""
+    while True:
+        await asyncio.sleep(SESSION_SNAPSHOT_INTERVAL)
+        try:
+            await executors.io.run(snapshot_sessions, user_sessions, shed=False)
+        except Exception as e:
+            logging.error(f"Session snapshot failed: {e}")
+
+@app.on_event("startup")
+async def start_background_tasks():
+    if SESSION_SNAPSHOT_ENABLED:
+        try:
+            restored = await executors.io.run(restore_sessions, user_sessions, shed=False)
+            logging.info(f"Restored sessions from snapshot: {restored}")
+        except Exception as e:
+            logging.error(f"Session restore failed, starting empty: {e}")
+        asyncio.create_task(_snapshot_sessions_loop())
+    asyncio.create_task(_release_expired_reservations_loop())
+    asyncio.create_task(_rebuild_marketplace_index_loop())
+    asyncio.create_task(_build_recommendations_loop())
+    await start_realtime_listener()
+
+@app.on_event("shutdown")
+async def save_sessions():
+    """Final snapshot; uvicorn runs this on SIGTERM (dyno restarts, deploys)."""
+    if SESSION_SNAPSHOT_ENABLED:
+        snapshot_sessions(user_sessions)
+
 @app.post("/api/chat/customer", response_model=CustomerChatResponse)
 async def customer_chat(request: CustomerChatRequest):
     """Handle customer chat messages via web interface."""
@@ -149,19 +244,22 @@ async def customer_chat(request: CustomerChatRequest):
         session = get_session(request.session_id)
             
     if not session:
-        # Check if trader exists
-        shop_info = get_shop_info(request.trader_id)
+        # Check if trader exists (in the DB pool, so concurrent lookups coalesce)
+        shop_info = await executors.db.run(get_shop_info, request.trader_id)
         if not shop_info:
              return Response(content="Shop not found", status_code=404)
              
         session = create_session(request.trader_id, shop_info["business_name"], shop_info["whatsapp_number"])
 
     # 2. Process message
-    # Run agent in threadpool to avoid blocking event loop
-    new_state = await run_in_threadpool(handle_customer_chat, session["state"], request.message)
+    if CUSTOMER_PIPELINE == "async":
+        new_state = await handle_customer_chat_async(session.to_state(), request.message)
+    else:
+        # Run agent in the LLM pool to avoid blocking event loop
+        new_state = await executors.llm.run(handle_customer_chat, session.to_state(), request.message)
     
-    # 3. Update session
-    update_session(session["session_id"], new_state)
+    # 3. Update session (tool results are trimmed there; the reply below uses new_state)
+    update_session(session.session_id, new_state)
     
     # 4. Extract reply
     assistant_msg = next((m["content"] for m in reversed(new_state["messages"]) if m["role"] == "assistant"), "No response generated")
@@ -170,15 +268,16 @@ async def customer_chat(request: CustomerChatRequest):
     products = []
     tool_result = new_state["context"].get("tool_result")
     if isinstance(tool_result, dict):
-        if "results" in tool_result:
-             products = tool_result["results"][:5] # Limit to 5
+        if "results" in tool_result or "alternatives" in tool_result:
+             # Similar-product suggestions follow the actual matches
+             products = (tool_result.get("results", []) + tool_result.get("alternatives", []))[:MAX_PRODUCTS_IN_RESPONSE]
         elif "available" in tool_result:
              pass
     elif isinstance(tool_result, list):
-        products = tool_result[:5]
+        products = tool_result[:MAX_PRODUCTS_IN_RESPONSE]
         
     return CustomerChatResponse(
-        session_id=session["session_id"],
+        session_id=session.session_id,
         reply=assistant_msg,
         products=products,
         timestamp=datetime.now(timezone.utc).isoformat()
@@ -187,14 +286,14 @@ async def customer_chat(request: CustomerChatRequest):
 @app.post("/api/chat/customer/session/new", response_model=NewSessionResponse)
 async def create_new_customer_session(request: NewSessionRequest):
     """Explicitly create a new session."""
-    shop_info = get_shop_info(request.trader_id)
+    shop_info = await executors.db.run(get_shop_info, request.trader_id)
     if not shop_info:
         return Response(content="Shop not found", status_code=404)
         
     session = create_session(request.trader_id, shop_info["business_name"], shop_info["whatsapp_number"])
     
     return NewSessionResponse(
-        session_id=session["session_id"],
+        session_id=session.session_id,
         trader_name=shop_info["business_name"],
         created_at=datetime.now(timezone.utc).isoformat()
     )
@@ -207,34 +306,143 @@ async def end_customer_session(session_id: str):
         del sessions[session_id]
     return Response(status_code=204)
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison)."""
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
 @app.get("/api/chat/customer/session/{session_id}/history")
-async def get_session_history_endpoint(session_id: str):
+async def get_session_history_endpoint(session_id: str, request: Request, since: int = 0, wait: float = 0):
+    """Chat messages from index `since` on; pass the returned `next` as the following `since`.
+    
+    With wait > 0 and nothing new yet, the request is held open until a reply
+    arrives or `wait` seconds pass (capped at HISTORY_LONG_POLL_MAX).
+    """
+    if since < 0:
+        return Response(content="since must be >= 0", status_code=400)
     session = get_session(session_id)
     if not session:
         return Response(content="Session not found", status_code=404)
-        
-    return {
+    
+    if wait > 0:
+        await wait_for_messages(session, since, min(wait, HISTORY_LONG_POLL_MAX))
+    
+    # The message count is the version: a session's history only ever grows
+    messages = session.messages
+    headers = {"ETag": f'W/"{messages.total}"', "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    
+    first, new_messages = messages.since(since)
+    return JSONResponse(content={
         "session_id": session_id,
-        "messages": session["state"]["messages"]
-    }
+        "messages": new_messages,
+        "since": first,
+        "next": messages.total,
+        # Older messages than `since` were dropped from the ring
+        "truncated": first > since,
+    }, headers=headers)
+
+@app.exception_handler(executors.Overloaded)
+async def executor_overloaded(request: Request, exc: executors.Overloaded):
+    """A saturated pool sheds requests instead of queueing them without bound."""
+    logging.warning(f"Shedding {request.url.path}: {exc}")
+    return Response(content="Server busy, please retry", status_code=503, headers={"Retry-After": "5"})
+
+@app.get("/api/stats/executors")
+async def executor_stats():
+    """Active, queued and wait-time metrics per thread pool."""
+    return executors.get_stats()
+
+@app.get("/api/stats/sessions")
+async def session_stats():
+    """Memory per live session, and projected at MAX_CONCURRENT_SESSIONS."""
+    return {**session_memory_report(), "snapshots": get_snapshot_stats()}
+
+@app.get("/api/stats/identity-map")
+async def identity_map_stats():
+    """DB reads saved by the request-scoped identity map since startup."""
+    return get_identity_map_stats()
+
+@app.get("/api/stats/reads")
+async def read_stats():
+    """DB reads saved by the identity map and by singleflight coalescing."""
+    return {"identity_map": get_identity_map_stats(), "singleflight": get_singleflight_stats()}
 
 @app.get("/api/shop/{trader_id}/preview")
-async def get_shop_preview(trader_id: str):
+async def get_shop_preview(trader_id: str, request: Request):
     """Get aggregated shop info and products for preview."""
-    
-    # Run DB calls in threadpool
-    from customer_tools import get_shop_products
-    
-    shop_info = await run_in_threadpool(get_shop_info, trader_id)
-    if not shop_info:
+    entry = await get_cached_preview(trader_id)
+    if not entry:
         return Response(content="Shop not found", status_code=404)
-        
-    products = await run_in_threadpool(get_shop_products, trader_id)
     
-    return {
-        "shop": shop_info,
-        "products": products
+    headers = {
+        "ETag": entry.etag,
+        "Last-Modified": formatdate(entry.last_modified, usegmt=True),
+        "Cache-Control": f"public, max-age={PREVIEW_CACHE_TTL}, stale-while-revalidate={PREVIEW_CACHE_STALE_TTL}",
     }
+    
+    # Conditional GET: If-None-Match wins over If-Modified-Since
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        if _etag_matches(if_none_match, entry.etag):
+            return Response(status_code=304, headers=headers)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+                if int(entry.last_modified) <= since:
+                    return Response(status_code=304, headers=headers)
+            except (TypeError, ValueError):
+                pass
+    
+    return JSONResponse(content=entry.value, headers=headers)
+
+@app.get("/api/shop/{trader_id}/products")
+async def browse_shop_products(
+    trader_id: str,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: bool = False,
+    sort: str = "newest",
+    limit: int = 20,
+    cursor: Optional[str] = None,
+):
+    """Faceted, cursor-paginated product feed for the storefront."""
+    try:
+        page = await executors.db.run(
+            browse_products, trader_id, category, min_price, max_price, in_stock, sort, limit, cursor
+        )
+    except ValueError as e:
+        return Response(content=str(e), status_code=400)
+    return page
+
+@app.get("/api/shop/{trader_id}/products/{product_id}/similar")
+async def get_similar_products(trader_id: str, product_id: str, limit: int = 5):
+    """Precomputed alternatives to show on a product detail view."""
+    products = await executors.db.run(similar_products, trader_id, product_id, limit)
+    return {"products": products}
+
+@app.get("/api/search")
+async def marketplace_search(
+    q: str,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: bool = False,
+    limit: int = 20,
+):
+    """Search products across every shop on the marketplace."""
+    try:
+        return await executors.db.run(
+            search_marketplace, q, category, min_price, max_price, in_stock, limit
+        )
+    except ValueError as e:
+        return Response(content=str(e), status_code=400)
 
 # --- Direct Checkout API ---
 class CheckoutRequest(BaseModel):
@@ -263,19 +471,23 @@ async def create_checkout(request: CheckoutRequest):
     from customer_tools import create_order, get_product_details
     from customer_config import FLUTTERWAVE_PUBLIC_KEY
     
-    # Get product details for amount
-    product = await run_in_threadpool(get_product_details, request.trader_id, request.product_id)
-    if not product:
-        return Response(content="Product not found", status_code=404)
-    
-    # Create order in database
-    order = await run_in_threadpool(
-        create_order, 
-        request.trader_id, 
-        request.product_id, 
-        request.fulfillment_type,
-        {}  # Empty delivery details for now
-    )
+    # Both calls share one identity map, so create_order reuses the product row
+    with request_scope():
+        # Get product details for amount
+        product = await executors.db.run(get_product_details, request.trader_id, request.product_id)
+        if not product:
+            return Response(content="Product not found", status_code=404)
+        
+        # Create order in database
+        order = await executors.io.run(
+            create_order, 
+            request.trader_id, 
+            request.product_id, 
+            request.fulfillment_type,
+            {}  # Empty delivery details for now
+        )
+    if "id" not in order:
+        return Response(content=order.get("error", "Could not create order"), status_code=409)
     
     tx_ref = f"sharpshop_{order['id']}"
     
@@ -292,5 +504,25 @@ async def create_checkout(request: CheckoutRequest):
         redirect_url=f"https://sharpshop.app/pay/callback?order_id={order['id']}"
     )
 
+class CheckoutVerifyRequest(BaseModel):
+    tx_ref: str
+
+@app.post("/api/checkout/verify")
+async def verify_checkout(request: CheckoutVerifyRequest):
+    """Confirm a direct checkout's payment with Flutterwave and commit its stock hold.
+    
+    Without this the reservation taken at /api/checkout would be released
+    (and the order marked failed) after RESERVATION_TTL even though it was paid.
+    """
+    from customer_tools import check_order_status
+    
+    order_id = request.tx_ref.removeprefix("sharpshop_")
+    if order_id == request.tx_ref or not order_id:
+        return Response(content="Unknown tx_ref", status_code=400)
+    
+    # Verified server-side, so the client can't mark an order paid by itself
+    status = await executors.io.run(check_order_status, order_id)
+    return {"order_id": order_id, "status": status}
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
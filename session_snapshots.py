@@ -0,0 +1,197 @@
+"""Snapshots of live chat sessions, so restarts and deploys don't drop them.
+
+Customer sessions (customer_sessions.sessions) and seller WhatsApp sessions
+(server.user_sessions) are appended to a local log: each snapshot pass writes
+only the sessions that changed since the last pass, plus a tombstone for
+each one that is gone, then fsyncs once. At startup the log is replayed in
+order (the last record per session wins), expired sessions are skipped, and
+the log is compacted to just the restored sessions.
+
+Records are a fixed header followed by a marshal-encoded tuple of plain
+values:
+
+    kind (u8) | written_at (f64) | payload length (u32) | crc32 (u32) | payload
+
+A torn record at the end of the log (a crash mid-write) fails its length or
+checksum and ends the replay; everything before it is kept.
+"""
+import marshal
+import os
+import struct
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Tuple
+
+import customer_sessions
+from customer_config import SESSION_SNAPSHOT_PATH, TRADER_SESSION_RESTORE_TTL
+from customer_sessions import Session
+
+CUSTOMER, TRADER, CUSTOMER_GONE, TRADER_GONE = 1, 2, 3, 4
+
+_HEADER = struct.Struct("<BdII")
+
+# The log is rewritten once it is this many times the size of the live set
+COMPACT_RATIO = 4
+COMPACT_MIN_BYTES = 8 * 1024 * 1024
+
+# What was last written per (kind, key), to write changed sessions only
+_fingerprints: Dict[Tuple[int, str], tuple] = {}
+_compacted_size = 0
+_stats = {"passes": 0, "records": 0, "bytes": 0, "restored": 0, "skipped_expired": 0}
+
+
+def _customer_fingerprint(session: Session) -> tuple:
+    return (session.messages.total, session.last_activity, session.status,
+            session.order_id, session.payment_link, session.product_id)
+
+
+def _trader_fingerprint(state: Dict[str, Any]) -> tuple:
+    # chat() returns a new state dict each turn, and every turn adds messages
+    return (id(state), len(state.get("messages", ())))
+
+
+def _encode(kind: int, payload: Any, now: float) -> bytes:
+    data = marshal.dumps(payload)
+    return _HEADER.pack(kind, now, len(data), zlib.crc32(data)) + data
+
+
+def _changes(trader_sessions: Dict[str, Dict[str, Any]], full: bool) -> Iterator[Tuple[int, str, tuple, Any]]:
+    """(kind, key, fingerprint, payload) for every record to write; fingerprint is None for tombstones."""
+    live = set()
+    for session_id, session in list(customer_sessions.sessions.items()):
+        key = (CUSTOMER, session_id)
+        live.add(key)
+        fingerprint = _customer_fingerprint(session)
+        if full or _fingerprints.get(key) != fingerprint:
+            yield CUSTOMER, session_id, fingerprint, session.to_record()
+    for sender_id, state in list(trader_sessions.items()):
+        key = (TRADER, sender_id)
+        live.add(key)
+        fingerprint = _trader_fingerprint(state)
+        if full or _fingerprints.get(key) != fingerprint:
+            yield TRADER, sender_id, fingerprint, (sender_id, state)
+    if not full:
+        for kind, key in [k for k in _fingerprints if k not in live]:
+            yield (CUSTOMER_GONE if kind == CUSTOMER else TRADER_GONE), key, None, key
+
+
+def _write(records: List[bytes], path: str, mode: str) -> int:
+    if not records:
+        return 0
+    with open(path, mode) as f:
+        for record in records:
+            f.write(record)
+        f.flush()
+        # One fsync per pass, however many sessions changed
+        os.fsync(f.fileno())
+    return sum(len(r) for r in records)
+
+
+def snapshot(trader_sessions: Dict[str, Dict[str, Any]], path: str = SESSION_SNAPSHOT_PATH) -> int:
+    """Append changed and removed sessions to the log. Returns the number of records."""
+    now = time.time()
+    records, written = [], []
+    for kind, key, fingerprint, payload in _changes(trader_sessions, full=False):
+        try:
+            records.append(_encode(kind, payload, now))
+        except ValueError as e:
+            print(f"Session snapshot skipped {key}: {e}")
+            continue
+        written.append((kind, key, fingerprint))
+
+    size = _write(records, path, "ab")
+    for kind, key, fingerprint in written:
+        if fingerprint is None:
+            _fingerprints.pop((CUSTOMER if kind == CUSTOMER_GONE else TRADER, key), None)
+        else:
+            _fingerprints[(kind, key)] = fingerprint
+    _stats["passes"] += 1
+    _stats["records"] += len(records)
+    _stats["bytes"] += size
+
+    if os.path.exists(path) and os.path.getsize(path) > max(COMPACT_MIN_BYTES, COMPACT_RATIO * _compacted_size):
+        compact(trader_sessions, path)
+    return len(records)
+
+
+def compact(trader_sessions: Dict[str, Dict[str, Any]], path: str = SESSION_SNAPSHOT_PATH) -> int:
+    """Rewrite the log as one record per live session. Returns its size in bytes."""
+    global _compacted_size
+    now = time.time()
+    records, fingerprints = [], {}
+    for kind, key, fingerprint, payload in _changes(trader_sessions, full=True):
+        try:
+            records.append(_encode(kind, payload, now))
+        except ValueError as e:
+            print(f"Session snapshot skipped {key}: {e}")
+            continue
+        fingerprints[(kind, key)] = fingerprint
+
+    # Written aside and renamed over the log, so a crash leaves one or the other
+    tmp_path = f"{path}.tmp"
+    _compacted_size = _write(records, tmp_path, "wb")
+    if not records:
+        open(tmp_path, "wb").close()
+    os.replace(tmp_path, path)
+    _fingerprints.clear()
+    _fingerprints.update(fingerprints)
+    return _compacted_size
+
+
+def _read(path: str) -> Iterator[Tuple[int, float, Any]]:
+    with open(path, "rb") as f:
+        data = f.read()
+    view = memoryview(data)
+    offset, end = 0, len(data)
+    while offset + _HEADER.size <= end:
+        kind, written_at, length, crc = _HEADER.unpack_from(view, offset)
+        start = offset + _HEADER.size
+        payload = view[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            print(f"Session snapshot: ignoring torn record at byte {offset}")
+            return
+        yield kind, written_at, marshal.loads(payload)
+        offset = start + length
+
+
+def restore(trader_sessions: Dict[str, Dict[str, Any]], path: str = SESSION_SNAPSHOT_PATH) -> Dict[str, int]:
+    """Replay the log into the session stores, skipping expired sessions, then compact it."""
+    if not os.path.exists(path):
+        return {"customer": 0, "trader": 0, "expired": 0}
+
+    customers: Dict[str, tuple] = {}
+    traders: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+    for kind, written_at, payload in _read(path):
+        if kind == CUSTOMER:
+            customers[payload[0]] = payload
+        elif kind == TRADER:
+            traders[payload[0]] = (written_at, payload[1])
+        elif kind == CUSTOMER_GONE:
+            customers.pop(payload, None)
+        elif kind == TRADER_GONE:
+            traders.pop(payload, None)
+
+    now = time.time()
+    restored = {"customer": 0, "trader": 0, "expired": 0}
+    for session_id, record in customers.items():
+        session = Session.from_record(record)
+        if session.is_expired(now):
+            restored["expired"] += 1
+        else:
+            customer_sessions.sessions[session_id] = session
+            restored["customer"] += 1
+    for sender_id, (written_at, state) in traders.items():
+        if now - written_at > TRADER_SESSION_RESTORE_TTL:
+            restored["expired"] += 1
+        else:
+            trader_sessions[sender_id] = state
+            restored["trader"] += 1
+
+    compact(trader_sessions, path)
+    _stats["restored"] += restored["customer"] + restored["trader"]
+    _stats["skipped_expired"] += restored["expired"]
+    return restored
+
+
+def get_stats() -> Dict[str, int]:
+    return dict(_stats)
@@ -0,0 +1,156 @@
+"""Incrementally maintained per-trader product aggregates.
+
+Keeps the active product count, price min/max/sum and a price histogram
+for each shop in memory, so get_shop_info and get_price_range are O(1)
+reads instead of a count query or a download of every price. Seller writes
+apply deltas; a full rebuild is one paged pass over the trader's products.
+"""
+import bisect
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from change_feed import Change, subscribe
+from database import get_supabase
+
+# Upper bounds (Naira) of the histogram buckets; the last bucket is open-ended
+HISTOGRAM_BOUNDS = [5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000]
+REBUILD_PAGE_SIZE = 1000
+
+
+class ShopStats:
+    """Aggregates over one trader's active products."""
+
+    def __init__(self):
+        self._products: Dict[str, tuple] = {}  # product_id -> (price, is_active)
+        self._price_counts: Counter = Counter()
+        self._min: Optional[float] = None
+        self._max: Optional[float] = None
+        self.active_count = 0
+        self.price_sum = 0.0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self._lock = threading.Lock()
+
+    def apply(self, product_id: str, price: Optional[float], is_active: bool = True) -> None:
+        """Insert or update one product."""
+        with self._lock:
+            old = self._products.get(product_id)
+            if old is not None:
+                self._subtract(*old)
+            self._products[product_id] = (price, is_active)
+            self._add(price, is_active)
+
+    def remove(self, product_id: str) -> None:
+        with self._lock:
+            old = self._products.pop(product_id, None)
+            if old is not None:
+                self._subtract(*old)
+
+    def _add(self, price: Optional[float], is_active: bool) -> None:
+        if not is_active:
+            return
+        self.active_count += 1
+        if price is None:
+            return
+        self.price_sum += price
+        self._price_counts[price] += 1
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS, price)] += 1
+        if self._min is None or price < self._min:
+            self._min = price
+        if self._max is None or price > self._max:
+            self._max = price
+
+    def _subtract(self, price: Optional[float], is_active: bool) -> None:
+        if not is_active:
+            return
+        self.active_count -= 1
+        if price is None:
+            return
+        self.price_sum -= price
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS, price)] -= 1
+        self._price_counts[price] -= 1
+        if self._price_counts[price] <= 0:
+            del self._price_counts[price]
+            # Only removing the last copy of the current min/max needs a rescan
+            if price == self._min:
+                self._min = min(self._price_counts) if self._price_counts else None
+            if price == self._max:
+                self._max = max(self._price_counts) if self._price_counts else None
+
+    def price_range(self) -> Dict[str, float]:
+        with self._lock:
+            priced = sum(self._price_counts.values())
+            if not priced:
+                return {"min_price": 0, "max_price": 0, "average_price": 0}
+            return {
+                "min_price": self._min,
+                "max_price": self._max,
+                "average_price": self.price_sum / priced,
+            }
+
+    def price_histogram(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            lower = [0] + HISTOGRAM_BOUNDS
+            upper = HISTOGRAM_BOUNDS + [None]
+            return [
+                {"min_price": lo, "max_price": hi, "count": count}
+                for lo, hi, count in zip(lower, upper, self.histogram)
+            ]
+
+
+_stats: Dict[str, ShopStats] = {}
+_stats_lock = threading.Lock()
+
+
+def rebuild(trader_id: str) -> ShopStats:
+    """Recompute a trader's aggregates from the database in one paged pass."""
+    stats = ShopStats()
+    supabase = get_supabase()
+    start = 0
+    while True:
+        response = supabase.table("products") \
+            .select("id, price, is_active") \
+            .eq("trader_id", trader_id) \
+            .order("id") \
+            .range(start, start + REBUILD_PAGE_SIZE - 1) \
+            .execute()
+        for p in response.data:
+            stats.apply(p["id"], p.get("price"), p.get("is_active", True))
+        if len(response.data) < REBUILD_PAGE_SIZE:
+            break
+        start += REBUILD_PAGE_SIZE
+
+    with _stats_lock:
+        _stats[trader_id] = stats
+    return stats
+
+
+def get_shop_stats(trader_id: str) -> ShopStats:
+    """A trader's aggregates, built on first use."""
+    stats = _stats.get(trader_id)
+    if stats is None:
+        stats = rebuild(trader_id)
+    return stats
+
+
+def record_product_write(trader_id: str, product: Dict[str, Any]) -> None:
+    """Apply a created/updated product row to a loaded trader's aggregates."""
+    stats = _stats.get(trader_id)
+    if stats is not None:
+        stats.apply(product["id"], product.get("price"), product.get("is_active", True))
+
+
+def invalidate(trader_id: str) -> None:
+    """Forget a trader's aggregates (e.g. after a bulk update); rebuilt on next read."""
+    with _stats_lock:
+        _stats.pop(trader_id, None)
+
+def _on_products_changed(change: Change) -> None:
+    if change.rows is None:
+        invalidate(change.trader_id)
+    else:
+        for product in change.rows:
+            record_product_write(change.trader_id, product)
+
+
+subscribe("products", _on_products_changed)
@@ -0,0 +1,121 @@
+"""Singleflight: concurrent identical calls share one execution.
+
+When a shop link goes viral, many requests ask for the same shop at the same
+moment. A call made while an identical one (same function and arguments) is
+still running waits for that call instead of issuing its own DB request.
+Works across threadpool threads (do / @singleflight) and across tasks on the
+event loop (do_async). Nothing is cached: once the call finishes, the next
+one runs again.
+
+Waiters get a deep copy of the result, so callers that decorate the returned
+dicts don't affect each other.
+"""
+import asyncio
+import copy
+import functools
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+_stats = {"calls": 0, "executed": 0, "coalesced": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(coalesced: bool) -> None:
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["coalesced" if coalesced else "executed"] += 1
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls: Dict[Hashable, _Call] = {}
+_calls_lock = threading.Lock()
+
+
+def do(key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+    """Run fn(*args, **kwargs), or wait for the identical call already running under key."""
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+    _count(coalesced=not leader)
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return copy.deepcopy(call.result)
+
+    try:
+        call.result = fn(*args, **kwargs)
+        return call.result
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+_async_calls: Dict[Hashable, asyncio.Task] = {}
+
+
+def _async_done(key: Hashable, task: asyncio.Task) -> None:
+    if _async_calls.get(key) is task:
+        del _async_calls[key]
+    # Mark the exception as retrieved when every caller has given up
+    task.cancelled() or task.exception()
+
+
+async def do_async(key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+    """Await fn(*args, **kwargs), or the identical coroutine call already running under key.
+
+    The call runs in its own task and every caller, the first included,
+    awaits it shielded, so a caller giving up doesn't cancel it for the rest.
+    """
+    task = _async_calls.get(key)
+    leader = task is None
+    _count(coalesced=not leader)
+    if leader:
+        task = asyncio.ensure_future(fn(*args, **kwargs))
+        _async_calls[key] = task
+        task.add_done_callback(functools.partial(_async_done, key))
+
+    result = await asyncio.shield(task)
+    return result if leader else copy.deepcopy(result)
+
+
+def in_flight(key: Hashable) -> bool:
+    """Whether a call under key is currently running (either variant)."""
+    return key in _calls or key in _async_calls
+
+
+def singleflight(fn: Callable) -> Callable:
+    """Decorator: coalesce concurrent calls of fn with equal arguments."""
+    name = f"{fn.__module__}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return fn(*args, **kwargs)
+        return do(key, fn, *args, **kwargs)
+
+    return wrapper
+
+
+def get_stats() -> Dict[str, int]:
+    """Call counts; coalesced calls were served by another call's DB request."""
+    with _stats_lock:
+        return dict(_stats)
@@ -2,6 +2,15 @@
 from typing import Optional
 from config import ALLOWED_CATEGORIES
 from database import get_supabase
+from pagination import decode_cursor, apply_keyset, page_result
+from product_index import get_index
+from query_normalizer import normalize_query
+from change_feed import publish
+
+# Seller listings only fetch what the WhatsApp reply shows
+SELLER_LIST_FIELDS = "id, name, price, stock_quantity"
+SELLER_PAGE_SIZE = 10
+
 
 def validate_product_data(data: dict) -> tuple[bool, str]:
     """Validate product data before creation/update."""
@@ -14,6 +23,11 @@ def validate_product_data(data: dict) -> tuple[bool, str]:
     return True, ""
 
 
+def _products_written(trader_id: str, products: list[dict]) -> None:
+    """Announce written product rows to the indexes and caches on the change feed."""
+    publish("products", trader_id, products)
+
+
 def create_product(
     name: str,
     price: float,
@@ -55,6 +69,7 @@ def create_product(
     try:
         result = supabase.table("products").insert(product_data).execute()
         product = result.data[0]
+        _products_written(trader_id, [product])
         return {
             "success": True,
             "product_id": product["id"],
@@ -64,25 +79,91 @@ def create_product(
         return {"success": False, "error": str(e)}
 
 
-def query_inventory(search_term: str, trader_id: str) -> dict:
-    """Search inventory by term."""
+def create_products(products: list[dict], trader_id: str, trader_name: str, whatsapp_number: str) -> dict:
+    """Create several product listings with a single bulk insert.
+
+    Each item takes the same fields as create_product(). Invalid items are
+    reported in "errors" ({"index", "name", "error"}, index being the item's
+    position in products) and left out of the insert.
+    """
+    rows = []
+    indexes = []
+    errors = []
+    for i, p in enumerate(products):
+        name = p.get("name", "item")
+        valid, error = validate_product_data({
+            "price": p.get("price"), "category": p.get("category"), "stock_quantity": p.get("stock")
+        })
+        if not valid:
+            errors.append({"index": i, "name": name, "error": error})
+            continue
+        if not p.get("image"):
+            errors.append({"index": i, "name": name, "error": "Product image is required. Please send a photo of your product."})
+            continue
+        indexes.append(i)
+        rows.append({
+            "trader_id": trader_id,
+            "trader_name": trader_name,
+            "whatsapp_number": whatsapp_number,
+            "name": name,
+            "price": p["price"],
+            "category": p["category"],
+            "stock_quantity": p["stock"],
+            "description": p.get("description") or f"Great {name} available now!",
+            "image_url": p["image"],
+            "is_active": p.get("is_active", True)
+        })
+
+    if not rows:
+        return {"success": not errors, "products": [], "errors": errors}
+
+    supabase = get_supabase()
+    try:
+        result = supabase.table("products").insert(rows).execute()
+    except Exception as e:
+        errors.extend({"index": i, "name": row["name"], "error": str(e)} for i, row in zip(indexes, rows))
+        return {"success": False, "products": [], "errors": errors}
+
+    _products_written(trader_id, result.data)
+    return {"success": not errors, "products": result.data, "errors": errors}
+
+
+def _inventory_page(search_term: str, trader_id: str, limit: int, cursor: Optional[str]) -> dict:
     supabase = get_supabase()
+    # The exact count is only worth computing for the first page
+    count = None if cursor else "exact"
+    query = supabase.table("products").select(SELLER_LIST_FIELDS, count=count).eq("trader_id", trader_id)
+    if search_term:
+        query = query.ilike("name", f"%{search_term}%")
+    
+    result = apply_keyset(query, "name", False, decode_cursor(cursor)).limit(limit + 1).execute()
+    page = page_result(result.data, limit, "name")
     
+    return {
+        "success": True,
+        "results": page["items"],
+        "total": result.count if result.count is not None else len(page["items"]),
+        "next_cursor": page["next_cursor"],
+        "search_term": search_term
+    }
+
+
+def query_inventory(search_term: str, trader_id: str, limit: int = SELLER_PAGE_SIZE, cursor: Optional[str] = None) -> dict:
+    """Search inventory by term, one page at a time (pass back next_cursor for more).
+
+    The term is matched as typed first; only if that finds nothing is it
+    spell-corrected against the seller's product names and tried again.
+    search_term in the result is the term that was used, for later pages.
+    """
     try:
-        query = supabase.table("products").select("*").eq("trader_id", trader_id)
-        
-        if search_term:
-            query = query.ilike("name", f"%{search_term}%")
-        
-        result = query.execute()
-        
-        return {
-            "success": True,
-            "results": result.data,
-            "total": len(result.data)
-        }
+        page = _inventory_page(search_term, trader_id, limit, cursor)
+        if search_term and not cursor and not page["results"]:
+            corrected = normalize_query(search_term, get_index(trader_id), expand=False)
+            if corrected and corrected != search_term.lower():
+                page = _inventory_page(corrected, trader_id, limit, cursor)
+        return page
     except Exception as e:
-        return {"success": False, "error": str(e), "results": [], "total": 0}
+        return {"success": False, "error": str(e), "results": [], "total": 0, "next_cursor": None}
 
 
 def update_product(product_id: str, updates: dict, trader_id: str) -> dict:
@@ -94,34 +175,135 @@ def update_product(product_id: str, updates: dict, trader_id: str) -> dict:
     supabase = get_supabase()
     
     try:
-        # Check if product belongs to trader
-        check = supabase.table("products").select("id").eq("id", product_id).eq("trader_id", trader_id).execute()
+        # Filtering on trader_id as well makes the ownership check part of the
+        # update itself; PostgREST returns the updated rows in the same call.
+        result = supabase.table("products").update(updates).eq("id", product_id).eq("trader_id", trader_id).execute()
         
-        if not check.data:
+        if not result.data:
             return {"success": False, "error": "Product not found or you don't have permission"}
         
-        result = supabase.table("products").update(updates).eq("id", product_id).execute()
+        product = result.data[0]
+        _products_written(trader_id, [product])
         
         return {
             "success": True,
             "product_id": product_id,
+            "product": product,
             "message": "Product updated successfully"
         }
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
-def list_products(trader_id: str, limit: int = 10) -> dict:
-    """List trader's products."""
+def update_products(product_ids: list[str], updates: dict, trader_id: str) -> dict:
+    """Apply the same updates to several products in one call."""
+    valid, error = validate_product_data(updates)
+    if not valid:
+        return {"success": False, "error": error, "products": []}
+    
     supabase = get_supabase()
     
     try:
-        result = supabase.table("products").select("*").eq("trader_id", trader_id).limit(limit).execute()
+        result = supabase.table("products").update(updates).in_("id", product_ids).eq("trader_id", trader_id).execute()
         
-        return {
-            "success": True,
-            "products": result.data,
-            "total": len(result.data)
-        }
+        if not result.data:
+            return {"success": False, "error": "Products not found or you don't have permission", "products": []}
+        
+        _products_written(trader_id, result.data)
+        
+        return {"success": True, "products": result.data}
     except Exception as e:
-        return {"success": False, "error": str(e), "products": [], "total": 0}
\ No newline at end of file
+        return {"success": False, "error": str(e), "products": []}
+
+
+def list_products(trader_id: str, limit: int = SELLER_PAGE_SIZE, cursor: Optional[str] = None) -> dict:
+    """List trader's products, one page at a time (pass back next_cursor for more)."""
+    result = query_inventory("", trader_id, limit, cursor)
+    result["products"] = result.pop("results")
+    return result
+
+
+BULK_UPDATE_FIELDS = ["price", "stock_quantity"]
+BULK_UPDATE_MODES = ["set", "percent", "increment"]
+BULK_FILTER_KEYS = ["category", "name_contains", "min_price", "max_price"]
+
+
+def _validate_bulk_update(filters: dict, field: str, mode: str, value) -> tuple[bool, str]:
+    if field not in BULK_UPDATE_FIELDS:
+        return False, f"Bulk updates can only change: {', '.join(BULK_UPDATE_FIELDS)}"
+    if mode not in BULK_UPDATE_MODES:
+        return False, f"Mode must be one of: {', '.join(BULK_UPDATE_MODES)}"
+    if not isinstance(value, (int, float)):
+        return False, "Value must be a number"
+    if mode == "set":
+        valid, error = validate_product_data({field: int(value)})
+        if not valid:
+            return False, error
+    unknown = [k for k in filters if k not in BULK_FILTER_KEYS]
+    if unknown:
+        return False, f"Unknown filter: {', '.join(unknown)}"
+    if "category" in filters and filters["category"] not in ALLOWED_CATEGORIES:
+        return False, f"Category must be one of: {', '.join(ALLOWED_CATEGORIES)}"
+    return True, ""
+
+
+def preview_bulk_update(trader_id: str, filters: dict, field: str, mode: str, value: float) -> dict:
+    """Count the products a bulk update would touch, without changing anything.
+
+    The update is validated first, so a bad one is rejected before the seller
+    is asked to confirm it.
+    """
+    valid, error = _validate_bulk_update(filters, field, mode, value)
+    if not valid:
+        return {"success": False, "error": error, "count": 0}
+    
+    supabase = get_supabase()
+    
+    try:
+        query = supabase.table("products").select("id", count="exact").eq("trader_id", trader_id)
+        if filters.get("category"):
+            query = query.eq("category", filters["category"])
+        if filters.get("name_contains"):
+            query = query.ilike("name", f"%{filters['name_contains']}%")
+        if filters.get("min_price") is not None:
+            query = query.gte("price", filters["min_price"])
+        if filters.get("max_price") is not None:
+            query = query.lte("price", filters["max_price"])
+        result = query.limit(1).execute()
+        
+        return {"success": True, "count": result.count or 0}
+    except Exception as e:
+        return {"success": False, "error": str(e), "count": 0}
+
+
+def bulk_update_products(trader_id: str, filters: dict, field: str, mode: str, value: float) -> dict:
+    """Apply one transform to every matching product in a single server-side UPDATE.
+
+    filters: any of category, name_contains, min_price, max_price.
+    mode: "set" (absolute value), "percent" (e.g. -10 for 10% off) or "increment".
+    Runs the bulk_update_products SQL function (see DB_SETUP_INSTRUCTIONS.txt).
+    """
+    valid, error = _validate_bulk_update(filters, field, mode, value)
+    if not valid:
+        return {"success": False, "error": error}
+    
+    supabase = get_supabase()
+    
+    try:
+        result = supabase.rpc("bulk_update_products", {
+            "p_trader_id": trader_id,
+            "p_field": field,
+            "p_mode": mode,
+            "p_value": value,
+            "p_category": filters.get("category"),
+            "p_name_contains": filters.get("name_contains"),
+            "p_min_price": filters.get("min_price"),
+            "p_max_price": filters.get("max_price"),
+        }).execute()
+        
+        if result.data:
+            # The rows were changed in SQL; subscribers reload the trader
+            publish("products", trader_id, None)
+        return {"success": True, "updated": result.data or 0}
+    except Exception as e:
+        return {"success": False, "error": str(e)}